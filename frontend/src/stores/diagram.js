@@ -1,6 +1,7 @@
 import { defineStore } from 'pinia'
 import { ref, computed } from 'vue'
 import { createResource } from 'frappe-ui'
+import { apply, compose, transform, fromTexts } from '../utils/ot'
 
 export const useDiagramStore = defineStore('diagram', () => {
   // State
@@ -87,6 +88,27 @@ export const useDiagramStore = defineStore('diagram', () => {
     }
   })
 
+  const leaveDiagramResource = createResource({
+    url: 'mermaid_studio.mermaid_studio.api.collaboration_api.leave_diagram',
+    transform: (data) => {
+      return data
+    }
+  })
+
+  const updateCursorPositionResource = createResource({
+    url: 'mermaid_studio.mermaid_studio.api.collaboration_api.update_cursor_position',
+    transform: (data) => {
+      return data
+    }
+  })
+
+  const getCursorPositionsResource = createResource({
+    url: 'mermaid_studio.mermaid_studio.api.collaboration_api.get_cursor_positions',
+    transform: (data) => {
+      return data
+    }
+  })
+
   const startEditingSessionResource = createResource({
     url: 'mermaid_studio.mermaid_studio.api.collaboration_api.start_editing_session',
     transform: (data) => {
@@ -94,6 +116,13 @@ export const useDiagramStore = defineStore('diagram', () => {
     }
   })
 
+  const renewEditingSessionResource = createResource({
+    url: 'mermaid_studio.mermaid_studio.api.collaboration_api.renew_editing_session',
+    transform: (data) => {
+      return data
+    }
+  })
+
   const endEditingSessionResource = createResource({
     url: 'mermaid_studio.mermaid_studio.api.collaboration_api.end_editing_session',
     transform: (data) => {
@@ -101,6 +130,13 @@ export const useDiagramStore = defineStore('diagram', () => {
     }
   })
 
+  const submitOperationResource = createResource({
+    url: 'mermaid_studio.mermaid_studio.api.collaboration_api.submit_operation',
+    transform: (data) => {
+      return data
+    }
+  })
+
   // Actions
   async function loadDiagram(diagramName) {
     try {
@@ -141,15 +177,31 @@ export const useDiagramStore = defineStore('diagram', () => {
 
   async function updateDiagram(diagramData) {
     try {
-      const result = await updateDiagramResource.submit(diagramData)
+      // Only name, version and modified come back unless a shape is asked for
+      const { response_shape: responseShape = 'minimal', ...changes } = diagramData
+      const params = { ...changes, response_shape: responseShape }
+      const current = currentDiagram.value && currentDiagram.value.name === diagramData.name
+        ? currentDiagram.value
+        : null
+      
+      // Send the code as a patch against the last save; the server rebases
+      // it over saves made since or rejects it instead of overwriting them
+      if (changes.diagram_code !== undefined && current && current.modified && typeof current.diagram_code === 'string') {
+        delete params.diagram_code
+        params.patch = JSON.stringify(fromTexts(current.diagram_code, changes.diagram_code))
+        params.base_modified = current.modified
+      }
+      
+      const result = await updateDiagramResource.submit(params)
       
       // Update current diagram if it's the one being updated
-      if (currentDiagram.value && currentDiagram.value.name === diagramData.name) {
-        currentDiagram.value = result
+      if (current) {
+        currentDiagram.value = { ...current, ...changes, ...result }
         
-        // Only update code if it's explicitly changed
+        // Only update code if it's explicitly changed; a rebased patch
+        // comes back with the merged code
         if (diagramData.diagram_code !== undefined) {
-          diagramCode.value = diagramData.diagram_code
+          diagramCode.value = currentDiagram.value.diagram_code
         }
       }
       
@@ -188,27 +240,112 @@ export const useDiagramStore = defineStore('diagram', () => {
     }
   }
 
-  async function loadDiagramComments(diagramName) {
+  // Comment threads come newest first, a page at a time; with a viewport
+  // or node ids only threads anchored in view (or not anchored) are loaded.
+  // The etag and watermark of the last load let refreshes fetch only changes.
+  let commentsQuery = {}
+  let commentsEtag = null
+  let commentsWatermark = null
+
+  async function loadDiagramComments(diagramName, { start = 0, limit = 50, viewport = null, nodeIds = null } = {}) {
     try {
-      const comments = await getCommentsResource.submit({ diagram_name: diagramName })
-      diagramComments.value = comments
-      return comments
+      // Refreshes repeat the query, the etag only holds for the same one
+      commentsQuery = {
+        limit,
+        viewport: viewport ? JSON.stringify(viewport) : null,
+        node_ids: nodeIds ? JSON.stringify(nodeIds) : null
+      }
+      
+      const result = await getCommentsResource.submit({
+        diagram_name: diagramName,
+        start,
+        ...commentsQuery
+      })
+      
+      diagramComments.value = start ? [...diagramComments.value, ...result.comments] : result.comments
+      if (!start) {
+        commentsEtag = result.etag
+        commentsWatermark = result.watermark
+      }
+      
+      return result.comments
     } catch (error) {
       console.error('Error loading diagram comments:', error)
       throw error
     }
   }
 
-  async function addComment(diagramName, text, position = null) {
+  async function refreshDiagramComments(diagramName) {
+    if (!commentsWatermark) return loadDiagramComments(diagramName)
+    
+    try {
+      const result = await getCommentsResource.submit({
+        diagram_name: diagramName,
+        since: commentsWatermark,
+        etag: commentsEtag,
+        ...commentsQuery
+      })
+      
+      if (result.unchanged) return diagramComments.value
+      
+      if (result.incremental) {
+        mergeComments(result.comments)
+      } else {
+        diagramComments.value = result.comments
+      }
+      
+      commentsEtag = result.etag
+      commentsWatermark = result.watermark
+      
+      return diagramComments.value
+    } catch (error) {
+      console.error('Error refreshing diagram comments:', error)
+      throw error
+    }
+  }
+
+  // Changes come oldest first, replies flat with their thread's name.
+  // Incremental loads overlap, so comments already shown are replaced by name.
+  function mergeComments(changed) {
+    const threads = [...diagramComments.value]
+    
+    for (const comment of changed) {
+      if (comment.parent_comment) {
+        const index = threads.findIndex((thread) => thread.name === comment.parent_comment)
+        if (index === -1) continue
+        
+        const replies = threads[index].replies.filter((reply) => reply.name !== comment.name)
+        threads[index] = { ...threads[index], replies: [...replies, comment] }
+      } else {
+        const index = threads.findIndex((thread) => thread.name === comment.name)
+        if (index === -1) {
+          threads.unshift({ ...comment, replies: [] })
+        } else {
+          threads[index] = { ...comment, replies: threads[index].replies }
+        }
+      }
+    }
+    
+    diagramComments.value = threads
+  }
+
+  function onCommentsUpdate(data) {
+    if (!currentDiagram.value || data.diagram !== currentDiagram.value.name) return
+    
+    refreshDiagramComments(data.diagram).catch(() => {})
+  }
+
+  async function addComment(diagramName, text, position = null, parentComment = null) {
     try {
       const comment = await addCommentResource.submit({
         diagram_name: diagramName,
         text,
-        position: position ? JSON.stringify(position) : null
+        position: position ? JSON.stringify(position) : null,
+        parent_comment: parentComment
       })
       
-      // Refresh comments
-      await loadDiagramComments(diagramName)
+      // Fetch our comment and anything else new
+      await refreshDiagramComments(diagramName)
       
       return comment
     } catch (error) {
@@ -228,6 +365,267 @@ export const useDiagramStore = defineStore('diagram', () => {
     }
   }
 
+  // Realtime collaboration: cursor and presence changes are pushed by the
+  // server to the Diagram document room, so nothing here polls for them
+  let cursorThrottleMs = 100
+  let cursorTimer = null
+  let pendingCursor = null
+  let lastCursorSent = 0
+
+  function onCursorUpdate(data) {
+    if (!currentDiagram.value || data.diagram !== currentDiagram.value.name) return
+    if (data.user === frappe.session.user) return
+    
+    const cursorPositions = { ...collaborationState.value.cursorPositions }
+    if (data.position) {
+      cursorPositions[data.user] = data
+    } else {
+      delete cursorPositions[data.user]
+    }
+    
+    collaborationState.value.cursorPositions = cursorPositions
+  }
+
+  function onPresenceUpdate(data) {
+    if (!currentDiagram.value || data.diagram !== currentDiagram.value.name) return
+    
+    collaborationState.value.activeUsers = data.users
+  }
+
+  function onEditLockUpdate(data) {
+    if (!currentDiagram.value || data.diagram !== currentDiagram.value.name) return
+    
+    // An administrator took over the editing session
+    if (isEditing.value && (!data.holder || data.holder.user !== frappe.session.user)) {
+      isEditing.value = false
+    }
+  }
+
+  async function joinCollaboration(diagramName) {
+    frappe.realtime.doc_subscribe('Diagram', diagramName)
+    frappe.realtime.on('mermaid_cursor', onCursorUpdate)
+    frappe.realtime.on('mermaid_presence', onPresenceUpdate)
+    frappe.realtime.on('mermaid_edit_lock', onEditLockUpdate)
+    frappe.realtime.on('mermaid_coedit_op', onCoeditOperation)
+    frappe.realtime.on('mermaid_coedit_reset', onCoeditReset)
+    frappe.realtime.on('mermaid_comments', onCommentsUpdate)
+    
+    try {
+      const cursorPositions = await getCursorPositionsResource.submit({ diagram_name: diagramName })
+      delete cursorPositions[frappe.session.user]
+      collaborationState.value.cursorPositions = cursorPositions
+    } catch (error) {
+      console.error('Error loading cursor positions:', error)
+    }
+  }
+
+  function leaveCollaboration(diagramName) {
+    frappe.realtime.off('mermaid_cursor', onCursorUpdate)
+    frappe.realtime.off('mermaid_presence', onPresenceUpdate)
+    frappe.realtime.off('mermaid_edit_lock', onEditLockUpdate)
+    frappe.realtime.off('mermaid_coedit_op', onCoeditOperation)
+    frappe.realtime.off('mermaid_coedit_reset', onCoeditReset)
+    frappe.realtime.off('mermaid_comments', onCommentsUpdate)
+    frappe.realtime.doc_unsubscribe('Diagram', diagramName)
+    
+    clearTimeout(cursorTimer)
+    cursorTimer = null
+    pendingCursor = null
+    
+    leaveDiagramResource.submit({ diagram_name: diagramName }).catch((error) => {
+      console.error('Error leaving diagram:', error)
+    })
+  }
+
+  // Send at most one cursor update per throttle interval, always ending
+  // with the latest position
+  function publishCursorPosition(diagramName, position) {
+    pendingCursor = position
+    if (cursorTimer) return
+    
+    const wait = Math.max(0, lastCursorSent + cursorThrottleMs - Date.now())
+    cursorTimer = setTimeout(() => sendCursorPosition(diagramName), wait)
+  }
+
+  async function sendCursorPosition(diagramName) {
+    const position = pendingCursor
+    pendingCursor = null
+    lastCursorSent = Date.now()
+    
+    try {
+      const result = await updateCursorPositionResource.submit({
+        diagram_name: diagramName,
+        position: JSON.stringify(position)
+      })
+      
+      cursorThrottleMs = result.throttle_ms || cursorThrottleMs
+      
+      // Throttled by the server; resend unless a newer position is waiting
+      if (!result.published && !pendingCursor) {
+        pendingCursor = position
+      }
+    } catch (error) {
+      console.error('Error updating cursor position:', error)
+    } finally {
+      cursorTimer = null
+      if (pendingCursor) {
+        publishCursorPosition(diagramName, pendingCursor)
+      }
+    }
+  }
+
+  // Co-editing: every local change becomes a text operation. One operation
+  // at a time is in flight against the last revision seen from the server;
+  // changes made meanwhile are composed into a buffer. Operations arrive over
+  // realtime in revision order (our own one doubles as the acknowledgement)
+  // and are transformed over the in-flight and buffered ones before being
+  // applied, so every editor converges on the server's code.
+  const coEditing = ref(false)
+  const clientId = Math.random().toString(36).slice(2)
+  let revision = 0
+  let inflight = null
+  let buffer = null
+  let pendingRemote = {}
+  let resyncTimer = null
+  let idleCallbacks = []
+
+  function joinCoedit(session) {
+    coEditing.value = true
+    revision = session.revision
+    inflight = null
+    buffer = null
+    pendingRemote = {}
+    clearTimeout(resyncTimer)
+    resyncTimer = null
+    diagramCode.value = session.code
+    notifyIdle()
+  }
+
+  function leaveCoedit() {
+    coEditing.value = false
+    inflight = null
+    buffer = null
+    pendingRemote = {}
+    clearTimeout(resyncTimer)
+    resyncTimer = null
+    notifyIdle()
+  }
+
+  // Reload the session after missing operations; unsent local changes are lost
+  async function rejoinCoedit() {
+    if (!coEditing.value || !currentDiagram.value) return
+    
+    try {
+      const result = await startEditingSessionResource.submit({ diagram_name: currentDiagram.value.name })
+      
+      if (result.co_editing) {
+        joinCoedit(result)
+      } else {
+        leaveCoedit()
+        isEditing.value = false
+      }
+    } catch (error) {
+      console.error('Error rejoining co-editing session:', error)
+    }
+  }
+
+  function coeditLocalChange(oldCode, newCode) {
+    const operation = fromTexts(oldCode, newCode)
+    if (!operation.length) return
+    
+    if (inflight) {
+      buffer = buffer ? compose(buffer, operation) : operation
+    } else {
+      sendOperation(operation)
+    }
+  }
+
+  async function sendOperation(operation) {
+    inflight = operation
+    
+    try {
+      const result = await submitOperationResource.submit({
+        diagram_name: currentDiagram.value.name,
+        revision,
+        operation: JSON.stringify(operation),
+        client_id: clientId
+      })
+      
+      // The server could not place the operation; start over from its code
+      if (result.resync) {
+        joinCoedit(result)
+      }
+    } catch (error) {
+      console.error('Error submitting operation:', error)
+      rejoinCoedit()
+    }
+  }
+
+  function onCoeditOperation(data) {
+    if (!coEditing.value || !currentDiagram.value || data.diagram !== currentDiagram.value.name) return
+    if (data.revision <= revision) return
+    
+    pendingRemote[data.revision] = data
+    while (pendingRemote[revision + 1]) {
+      const entry = pendingRemote[revision + 1]
+      delete pendingRemote[revision + 1]
+      applyCoeditOperation(entry)
+    }
+    
+    // A gap in revisions means a message was lost; reload if it does not arrive
+    clearTimeout(resyncTimer)
+    resyncTimer = Object.keys(pendingRemote).length ? setTimeout(rejoinCoedit, 5000) : null
+  }
+
+  function applyCoeditOperation(entry) {
+    revision = entry.revision
+    
+    if (entry.client_id === clientId && inflight) {
+      inflight = null
+      if (buffer) {
+        const next = buffer
+        buffer = null
+        sendOperation(next)
+      } else {
+        notifyIdle()
+      }
+      return
+    }
+    
+    // Remote operations were committed first, so they win ties like on the server
+    let operation = entry.operation
+    if (inflight) {
+      [operation, inflight] = transform(operation, inflight)
+    }
+    if (buffer) {
+      [operation, buffer] = transform(operation, buffer)
+    }
+    
+    diagramCode.value = apply(diagramCode.value, operation)
+  }
+
+  function onCoeditReset(data) {
+    if (!currentDiagram.value || data.diagram !== currentDiagram.value.name) return
+    
+    // The diagram was saved outside the session, e.g. a version was restored
+    rejoinCoedit()
+  }
+
+  function notifyIdle() {
+    if (inflight) return
+    
+    const callbacks = idleCallbacks
+    idleCallbacks = []
+    callbacks.forEach((callback) => callback())
+  }
+
+  // Resolves once every local change has been acknowledged by the server
+  function waitForCoeditIdle() {
+    if (!inflight) return Promise.resolve()
+    
+    return new Promise((resolve) => idleCallbacks.push(resolve))
+  }
+
   async function startEditingSession(diagramName) {
     try {
       const result = await startEditingSessionResource.submit({ diagram_name: diagramName })
@@ -236,6 +634,10 @@ export const useDiagramStore = defineStore('diagram', () => {
         isEditing.value = true
       }
       
+      if (result.co_editing) {
+        joinCoedit(result)
+      }
+      
       return result
     } catch (error) {
       console.error('Error starting editing session:', error)
@@ -243,8 +645,31 @@ export const useDiagramStore = defineStore('diagram', () => {
     }
   }
 
+  async function renewEditingSession(diagramName) {
+    // Co-editing takes no lock, so there is no lease to renew
+    if (coEditing.value) return { success: true }
+    
+    try {
+      const result = await renewEditingSessionResource.submit({ diagram_name: diagramName })
+      
+      // The lease ran out or was taken over
+      if (!result.success) {
+        isEditing.value = false
+      }
+      
+      return result
+    } catch (error) {
+      console.error('Error renewing editing session:', error)
+      throw error
+    }
+  }
+
   async function endEditingSession(diagramName) {
     try {
+      // Let the server have all our operations before it saves the session
+      await waitForCoeditIdle()
+      leaveCoedit()
+      
       const result = await endEditingSessionResource.submit({ diagram_name: diagramName })
       
       if (result.success) {
@@ -260,6 +685,10 @@ export const useDiagramStore = defineStore('diagram', () => {
 
   // Update diagram code locally (without saving to server)
   function updateDiagramCode(newCode) {
+    if (coEditing.value && newCode !== diagramCode.value) {
+      coeditLocalChange(diagramCode.value, newCode)
+    }
+    
     diagramCode.value = newCode
   }
 
@@ -287,12 +716,21 @@ export const useDiagramStore = defineStore('diagram', () => {
       endEditingSession(currentDiagram.value.name)
     }
     
+    if (currentDiagram.value) {
+      leaveCollaboration(currentDiagram.value.name)
+    }
+    
+    leaveCoedit()
+    
     // Reset state
     currentDiagram.value = null
     diagramCode.value = ''
     isEditing.value = false
     diagramVersions.value = []
     diagramComments.value = []
+    commentsQuery = {}
+    commentsEtag = null
+    commentsWatermark = null
     collaborationState.value = {
       activeUsers: [],
       cursorPositions: {},
@@ -305,6 +743,7 @@ export const useDiagramStore = defineStore('diagram', () => {
     currentDiagram,
     diagramCode,
     isEditing,
+    coEditing,
     renderSettings,
     collaborationState,
     diagramVersions,
@@ -326,9 +765,14 @@ export const useDiagramStore = defineStore('diagram', () => {
     deleteDiagram,
     loadDiagramVersions,
     loadDiagramComments,
+    refreshDiagramComments,
     addComment,
     loadActiveUsers,
+    joinCollaboration,
+    leaveCollaboration,
+    publishCursorPosition,
     startEditingSession,
+    renewEditingSession,
     endEditingSession,
     updateDiagramCode,
     updateRenderSettings,
@@ -0,0 +1,209 @@
+// Operational transformation for plain text, the client half of
+// mermaid_studio/mermaid_studio/utils/ot.py. An operation is an array of
+// components applied left to right over the whole document:
+//   n (positive number)  retain the next n characters
+//   'text' (string)      insert text
+//   -n (negative number) delete the next n characters
+// Lengths count Unicode code points, like Python strings on the server.
+
+function kind(component) {
+  if (typeof component === 'string') return 'insert'
+  return component > 0 ? 'retain' : 'delete'
+}
+
+function length(component) {
+  return typeof component === 'string' ? Array.from(component).length : Math.abs(component)
+}
+
+export function normalize(operation) {
+  const result = []
+  
+  for (const component of operation) {
+    if (component === 0 || component === '') continue
+    
+    const last = result[result.length - 1]
+    if (result.length && kind(last) === kind(component)) {
+      result[result.length - 1] = last + component
+    } else if (kind(component) === 'insert' && result.length && kind(last) === 'delete') {
+      // Keep inserts before deletes so equal operations look the same
+      if (result.length > 1 && kind(result[result.length - 2]) === 'insert') {
+        result[result.length - 2] += component
+      } else {
+        result.splice(result.length - 1, 0, component)
+      }
+    } else {
+      result.push(component)
+    }
+  }
+  
+  // A trailing retain changes nothing
+  if (result.length && kind(result[result.length - 1]) === 'retain') {
+    result.pop()
+  }
+  
+  return result
+}
+
+export function apply(text, operation) {
+  const chars = Array.from(text)
+  const parts = []
+  let index = 0
+  
+  for (const component of operation) {
+    if (kind(component) === 'retain') {
+      parts.push(chars.slice(index, index + component).join(''))
+      index += component
+    } else if (kind(component) === 'insert') {
+      parts.push(component)
+    } else {
+      index -= component
+    }
+  }
+  
+  if (index > chars.length) {
+    throw new Error('Operation is longer than the document')
+  }
+  
+  parts.push(chars.slice(index).join(''))
+  return parts.join('')
+}
+
+// Smallest single-range operation turning oldText into newText
+export function fromTexts(oldText, newText) {
+  const oldChars = Array.from(oldText)
+  const newChars = Array.from(newText)
+  
+  let prefix = 0
+  while (prefix < oldChars.length && prefix < newChars.length && oldChars[prefix] === newChars[prefix]) {
+    prefix++
+  }
+  
+  let suffix = 0
+  while (
+    suffix < oldChars.length - prefix &&
+    suffix < newChars.length - prefix &&
+    oldChars[oldChars.length - 1 - suffix] === newChars[newChars.length - 1 - suffix]
+  ) {
+    suffix++
+  }
+  
+  return normalize([
+    prefix,
+    newChars.slice(prefix, newChars.length - suffix).join(''),
+    -(oldChars.length - prefix - suffix)
+  ])
+}
+
+// Walks an operation, splitting components when only part is consumed
+class Components {
+  constructor(operation) {
+    this.components = normalize(operation)
+    this.index = 0
+    this.current = this.components.length ? this.components[0] : null
+    this.lastKind = null
+  }
+  
+  get kind() {
+    return this.current === null ? null : kind(this.current)
+  }
+  
+  get length() {
+    return length(this.current)
+  }
+  
+  take(size = null) {
+    const current = this.current
+    this.lastKind = kind(current)
+    
+    if (size === null || size >= this.length) {
+      this.index++
+      this.current = this.index < this.components.length ? this.components[this.index] : null
+      return current
+    }
+    
+    if (this.lastKind === 'insert') {
+      const chars = Array.from(current)
+      this.current = chars.slice(size).join('')
+      return chars.slice(0, size).join('')
+    }
+    
+    if (this.lastKind === 'retain') {
+      this.current = current - size
+      return size
+    }
+    
+    this.current = current + size
+    return -size
+  }
+}
+
+// One operation with the effect of applying a and then b
+export function compose(a, b) {
+  const result = []
+  const aIter = new Components(a)
+  const bIter = new Components(b)
+  
+  while (aIter.current !== null || bIter.current !== null) {
+    if (aIter.kind === 'delete') {
+      result.push(aIter.take())
+    } else if (bIter.kind === 'insert') {
+      result.push(bIter.take())
+    } else if (aIter.current === null) {
+      result.push(bIter.take())
+    } else if (bIter.current === null) {
+      result.push(aIter.take())
+    } else {
+      const size = Math.min(aIter.length, bIter.length)
+      const aPart = aIter.take(size)
+      const bPart = bIter.take(size)
+      
+      if (bIter.lastKind === 'retain') {
+        result.push(aPart)
+      } else if (aIter.lastKind === 'retain') {
+        result.push(bPart)
+      }
+    }
+  }
+  
+  return normalize(result)
+}
+
+// Returns [a', b'] with apply(apply(d, a), b') === apply(apply(d, b), a');
+// a's inserts go first when both insert at the same position
+export function transform(a, b) {
+  const aPrime = []
+  const bPrime = []
+  const aIter = new Components(a)
+  const bIter = new Components(b)
+  
+  while (aIter.current !== null || bIter.current !== null) {
+    if (aIter.kind === 'insert') {
+      const text = aIter.take()
+      aPrime.push(text)
+      bPrime.push(length(text))
+    } else if (bIter.kind === 'insert') {
+      const text = bIter.take()
+      aPrime.push(length(text))
+      bPrime.push(text)
+    } else if (aIter.current === null) {
+      bPrime.push(bIter.take())
+    } else if (bIter.current === null) {
+      aPrime.push(aIter.take())
+    } else {
+      const size = Math.min(aIter.length, bIter.length)
+      const aPart = aIter.take(size)
+      const bPart = bIter.take(size)
+      
+      if (aIter.lastKind === 'retain' && bIter.lastKind === 'retain') {
+        aPrime.push(size)
+        bPrime.push(size)
+      } else if (aIter.lastKind === 'delete' && bIter.lastKind === 'retain') {
+        aPrime.push(aPart)
+      } else if (aIter.lastKind === 'retain' && bIter.lastKind === 'delete') {
+        bPrime.push(bPart)
+      }
+    }
+  }
+  
+  return [normalize(aPrime), normalize(bPrime)]
+}
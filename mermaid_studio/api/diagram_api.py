@@ -2,10 +2,18 @@ import frappe
 from frappe import _
 from frappe.utils import now_datetime
 
+from mermaid_studio.mermaid_studio.doctype.diagram.diagram import get_diagram_meta
+from mermaid_studio.mermaid_studio.utils import render_stats
+from mermaid_studio.mermaid_studio.utils.access import check_permission
+from mermaid_studio.mermaid_studio.utils.response_shape import project_fields
+
 @frappe.whitelist(allow_guest=True)
 def get_diagrams(filters=None, fields=None, order_by=None):
     """Get diagrams based on filters"""
-    if not fields:
+    if fields:
+        # Only list columns, never code bodies or settings
+        fields = project_fields(fields)
+    else:
         fields = ["name", "title", "diagram_type", "modified", "owner"]
     
     # Ensure user has permission
@@ -39,15 +47,11 @@ def get_diagram(name):
     """Get a specific diagram by name"""
     try:
         # Check if user has permission to access this diagram
-        diagram = frappe.get_doc("Diagram", name)
+        check_permission(name, "read")
         
-        # Check permissions
-        if not (diagram.owner == frappe.session.user or 
-                diagram.is_public or 
-                frappe.session.user == "Administrator"):
-            frappe.throw(_("You don't have permission to access this diagram"))
+        render_stats.record_view(name)
         
-        return diagram
+        return frappe.get_doc("Diagram", name)
     except Exception as e:
         frappe.log_error(f"Error getting diagram {name}: {str(e)}", "Diagram API Error")
         frappe.throw(_("Error fetching diagram"))
@@ -83,11 +87,10 @@ def create_diagram(title, diagram_type, diagram_code, is_public=0, is_template=0
 def update_diagram(name, title=None, diagram_type=None, diagram_code=None, is_public=None, is_template=None, description=None, folder=None):
     """Update an existing diagram"""
     try:
-        diagram = frappe.get_doc("Diagram", name)
-        
         # Check permissions
-        if not (diagram.owner == frappe.session.user or frappe.session.user == "Administrator"):
-            frappe.throw(_("You don't have permission to update this diagram"))
+        check_permission(name, "write", _("You don't have permission to update this diagram"))
+        
+        diagram = frappe.get_doc("Diagram", name)
         
         if title is not None:
             diagram.title = title
@@ -121,11 +124,8 @@ def update_diagram(name, title=None, diagram_type=None, diagram_code=None, is_pu
 def delete_diagram(name):
     """Delete a diagram"""
     try:
-        diagram = frappe.get_doc("Diagram", name)
-        
         # Check permissions
-        if not (diagram.owner == frappe.session.user or frappe.session.user == "Administrator"):
-            frappe.throw(_("You don't have permission to delete this diagram"))
+        check_permission(name, "owner", _("You don't have permission to delete this diagram"))
         
         frappe.delete_doc("Diagram", name)
         
@@ -138,11 +138,9 @@ def delete_diagram(name):
 def share_diagram(diagram, email, permission_level="read", expiry_days=None):
     """Share a diagram with another user"""
     try:
-        diagram_doc = frappe.get_doc("Diagram", diagram)
-        
         # Check permissions
-        if not (diagram_doc.owner == frappe.session.user or frappe.session.user == "Administrator"):
-            frappe.throw(_("You don't have permission to share this diagram"))
+        check_permission(diagram, "admin", _("You don't have permission to share this diagram"))
+        diagram_meta = get_diagram_meta(diagram)
         
         # Generate share token
         import uuid
@@ -169,7 +167,7 @@ def share_diagram(diagram, email, permission_level="read", expiry_days=None):
         share.insert(ignore_permissions=True)
         
         # Send email notification
-        send_share_notification(diagram_doc, email, token)
+        send_share_notification(diagram_meta, email, token)
         
         return {"success": True, "token": token}
     except Exception as e:
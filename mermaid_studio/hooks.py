@@ -154,6 +154,13 @@ doctype_js = {
 # 	}
 # }
 
+doc_events = {
+    "User": {
+        "on_update": "mermaid_studio.mermaid_studio.utils.user_profile.clear_user_profile",
+        "on_trash": "mermaid_studio.mermaid_studio.utils.user_profile.clear_user_profile"
+    }
+}
+
 # Scheduled Tasks
 # ---------------
 
@@ -175,6 +182,16 @@ doctype_js = {
 # 	],
 # }
 
+scheduler_events = {
+    "cron": {
+        "* * * * *": [
+            "mermaid_studio.tasks.persist_coedit_sessions",
+            "mermaid_studio.tasks.flush_pending_versions",
+            "mermaid_studio.tasks.flush_render_stats"
+        ]
+    }
+}
+
 # Testing
 # -------
 
@@ -1,199 +1,279 @@
 import frappe
 import json
+from datetime import datetime
 from frappe import _
-from frappe.utils import now_datetime
+from frappe.utils import convert_utc_to_system_timezone
+
+from mermaid_studio.mermaid_studio.doctype.diagram.diagram import get_diagram_meta
+from mermaid_studio.mermaid_studio.doctype.diagram_comment.diagram_comment import (
+    format_comment,
+    get_changed_comments,
+    get_comment_threads,
+    get_comments_etag,
+    get_comments_watermark,
+    has_deletions_since,
+)
+from mermaid_studio.mermaid_studio.utils import coedit, cursors, edit_lock, ot, presence, version_coalescing
+from mermaid_studio.mermaid_studio.utils.access import check_permission, has_permission
+from mermaid_studio.mermaid_studio.utils.user_profile import get_user_profile, get_user_profiles
 
 @frappe.whitelist()
 def get_active_users(diagram_name):
-    """Get list of active users for a diagram"""
-    # In a production environment, this would be implemented with WebSockets
-    # For now, we'll simulate active users with a placeholder
-    active_users = frappe.cache().hget("mermaid_active_users", diagram_name) or []
-    
-    # Add current user if not already in the list
-    current_user = {
-        "user": frappe.session.user,
-        "full_name": frappe.db.get_value("User", frappe.session.user, "full_name"),
-        "last_active": now_datetime().isoformat()
-    }
+    """Record a heartbeat for the current user and list active users of a diagram"""
+    check_permission(diagram_name, "read")
     
-    user_exists = False
-    for user in active_users:
-        if user.get("user") == frappe.session.user:
-            user_exists = True
-            user["last_active"] = current_user["last_active"]
-            break
+    joined = presence.heartbeat(diagram_name)
+    active_users = _get_active_users(diagram_name)
     
-    if not user_exists:
-        active_users.append(current_user)
-    
-    # Update cache
-    frappe.cache().hset("mermaid_active_users", diagram_name, active_users)
+    if joined:
+        _publish_presence(diagram_name, active_users)
     
     return active_users
 
+@frappe.whitelist()
+def leave_diagram(diagram_name):
+    """Remove the current user from the active users of a diagram"""
+    check_permission(diagram_name, "read")
+    
+    presence.leave(diagram_name)
+    cursors.remove_cursor(diagram_name)
+    _publish_presence(diagram_name, _get_active_users(diagram_name))
+    
+    return {"success": True}
+
+def _get_active_users(diagram_name):
+    active = presence.get_active_users(diagram_name)
+    profiles = get_user_profiles([user for user, _last_active in active])
+    
+    return [
+        dict(
+            profiles[user],
+            last_active=convert_utc_to_system_timezone(
+                datetime.utcfromtimestamp(last_active)
+            ).replace(tzinfo=None).isoformat()
+        )
+        for user, last_active in active
+    ]
+
+def _publish_presence(diagram_name, active_users):
+    frappe.publish_realtime(
+        "mermaid_presence",
+        {"diagram": diagram_name, "users": active_users},
+        doctype="Diagram",
+        docname=diagram_name,
+        after_commit=False
+    )
+
 @frappe.whitelist()
 def update_cursor_position(diagram_name, position):
-    """Update cursor position for real-time collaboration"""
-    # In a production environment, this would be implemented with WebSockets
-    # For now, we'll simulate cursor positions with a placeholder
-    cursor_positions = frappe.cache().hget("mermaid_cursors", diagram_name) or {}
-    
-    # Update cursor position for current user
-    cursor_positions[frappe.session.user] = {
-        "position": position,
-        "timestamp": now_datetime().isoformat(),
-        "user": frappe.session.user,
-        "full_name": frappe.db.get_value("User", frappe.session.user, "full_name")
-    }
+    """Publish the current user's cursor position to everyone viewing the diagram"""
+    check_permission(diagram_name, "read")
     
-    # Update cache
-    frappe.cache().hset("mermaid_cursors", diagram_name, cursor_positions)
+    position = json.loads(position) if isinstance(position, str) else position
+    published = cursors.update_cursor(diagram_name, position, get_user_profile())
     
-    return cursor_positions
+    return {
+        "published": published,
+        "throttle_ms": cursors.get_throttle_ms()
+    }
 
 @frappe.whitelist()
 def get_cursor_positions(diagram_name):
     """Get cursor positions for all active users"""
-    # In a production environment, this would be implemented with WebSockets
-    # For now, we'll simulate cursor positions with a placeholder
-    cursor_positions = frappe.cache().hget("mermaid_cursors", diagram_name) or {}
+    check_permission(diagram_name, "read")
     
-    # Filter out stale cursor positions (older than 1 minute)
-    current_time = now_datetime()
-    active_cursors = {}
-    
-    for user, cursor_data in cursor_positions.items():
-        timestamp = frappe.utils.get_datetime(cursor_data.get("timestamp"))
-        time_diff = (current_time - timestamp).total_seconds()
-        
-        if time_diff < 60:  # Less than 1 minute
-            active_cursors[user] = cursor_data
-    
-    return active_cursors
+    # Only needed when opening a diagram; later changes arrive over realtime
+    return cursors.get_cursors(diagram_name)
 
 @frappe.whitelist()
-def add_comment(diagram_name, text, position=None):
-    """Add a comment to a diagram"""
-    # Check permissions
-    diagram = frappe.get_doc("Diagram", diagram_name)
-    if not diagram.is_public and diagram.owner != frappe.session.user:
-        # Check if diagram is shared with the user
-        share = frappe.db.exists("Diagram Share", {
-            "diagram": diagram_name,
-            "shared_with": frappe.session.user
-        })
-        
-        if not share:
-            frappe.throw(_("You don't have permission to comment on this diagram"))
+def add_comment(diagram_name, text, position=None, parent_comment=None):
+    """Add a comment or a reply to a diagram"""
+    check_permission(diagram_name, "read", _("You don't have permission to comment on this diagram"))
     
     # Create comment
-    comment = frappe.new_doc("Comment")
-    comment.comment_type = "Comment"
-    comment.reference_doctype = "Diagram"
-    comment.reference_name = diagram_name
+    comment = frappe.new_doc("Diagram Comment")
+    comment.diagram = diagram_name
     comment.content = text
+    comment.parent_comment = parent_comment
     
     if position:
-        # Store position as JSON in comment
+        # Anchor to a node and/or a point of the diagram
         position_data = json.loads(position) if isinstance(position, str) else position
-        comment.content += f"\n\n<!-- POSITION: {json.dumps(position_data)} -->"
+        comment.node_id = position_data.get("node_id")
+        
+        if position_data.get("x") is not None and position_data.get("y") is not None:
+            comment.has_position = 1
+            comment.position_x = position_data["x"]
+            comment.position_y = position_data["y"]
     
     comment.insert(ignore_permissions=True)
     
-    return comment
+    return format_comment(comment)
 
 @frappe.whitelist()
-def get_comments(diagram_name):
-    """Get all comments for a diagram"""
-    comments = frappe.get_all(
-        "Comment",
-        filters={
-            "reference_doctype": "Diagram",
-            "reference_name": diagram_name
-        },
-        fields=["name", "owner", "creation", "content"],
-        order_by="creation desc"
-    )
+def get_comments(diagram_name, limit=50, start=0, viewport=None, node_ids=None, since=None, etag=None):
+    """Get comment threads for a diagram, or only what changed since a previous call
     
-    # Parse position data from comments
-    for comment in comments:
-        position_match = frappe.utils.find_pattern(comment.content, r'<!-- POSITION: (.*?) -->')
-        if position_match:
-            try:
-                position_data = json.loads(position_match.group(1))
-                comment.position = position_data
-                # Remove position data from content
-                comment.content = comment.content.replace(position_match.group(0), "").strip()
-            except:
-                comment.position = None
-        else:
-            comment.position = None
-    
-    return comments
+    Pass back the `etag` of the previous response with the same query to get
+    {"unchanged": True} when nothing changed, and its `watermark` as `since`
+    to get only new and edited comments. Incremental loads overlap, so they
+    can repeat comments the client already has. After a deletion the full
+    first page is returned with `incremental` false.
+    """
+    check_permission(diagram_name, "read")
+    
+    if isinstance(viewport, str):
+        viewport = json.loads(viewport)
+    
+    if isinstance(node_ids, str):
+        node_ids = json.loads(node_ids)
+    
+    current_etag = get_comments_etag(diagram_name, {
+        "limit": int(limit),
+        "start": int(start),
+        "viewport": viewport,
+        "node_ids": node_ids
+    })
+    if etag and etag == current_etag:
+        return {"unchanged": True, "etag": current_etag}
+    
+    # Taken before reading so changes made meanwhile are in the next load
+    watermark = get_comments_watermark()
+    incremental = bool(since) and not has_deletions_since(diagram_name, since)
+    
+    if incremental:
+        comments = get_changed_comments(diagram_name, since, viewport, node_ids)
+    else:
+        comments = get_comment_threads(diagram_name, limit, start, viewport, node_ids)
+    
+    return {
+        "comments": comments,
+        "incremental": incremental,
+        "etag": current_etag,
+        "watermark": watermark
+    }
 
 @frappe.whitelist()
 def delete_comment(comment_name):
-    """Delete a comment"""
-    comment = frappe.get_doc("Comment", comment_name)
+    """Delete a comment and its replies"""
+    comment = frappe.get_doc("Diagram Comment", comment_name)
     
     # Check permissions
     if comment.owner != frappe.session.user:
         frappe.throw(_("You don't have permission to delete this comment"))
     
-    frappe.delete_doc("Comment", comment_name)
+    frappe.delete_doc("Diagram Comment", comment_name, ignore_permissions=True)
     
     return {"success": True}
 
 @frappe.whitelist()
 def start_editing_session(diagram_name):
     """Start an editing session for a diagram"""
-    # In a production environment, this would be implemented with WebSockets
-    # For now, we'll simulate editing sessions with a placeholder
-    editing_sessions = frappe.cache().hget("mermaid_editing_sessions", diagram_name) or {}
-    
-    # Check if someone else is already editing
-    for user, session in editing_sessions.items():
-        if user != frappe.session.user:
-            timestamp = frappe.utils.get_datetime(session.get("timestamp"))
-            time_diff = (now_datetime() - timestamp).total_seconds()
-            
-            if time_diff < 300:  # Less than 5 minutes
-                return {
-                    "success": False,
-                    "message": f"{session.get('full_name')} is currently editing this diagram"
-                }
-    
-    # Start editing session for current user
-    editing_sessions[frappe.session.user] = {
-        "timestamp": now_datetime().isoformat(),
-        "user": frappe.session.user,
-        "full_name": frappe.db.get_value("User", frappe.session.user, "full_name")
+    check_permission(diagram_name, "write", _("You don't have permission to edit this diagram"))
+    
+    if coedit.is_enabled(get_diagram_meta(diagram_name)):
+        # Everyone edits the shared session; no exclusive lock is taken
+        return dict(
+            coedit.join(diagram_name),
+            success=True,
+            co_editing=True,
+            message="Editing session started"
+        )
+    
+    acquired, holder = edit_lock.acquire(diagram_name, get_user_profile()["full_name"])
+    
+    if not acquired:
+        return {
+            "success": False,
+            "message": f"{(holder or {}).get('full_name')} is currently editing this diagram",
+            "holder": holder
+        }
+    
+    return {
+        "success": True,
+        "message": "Editing session started",
+        "lease_seconds": edit_lock.get_lease_seconds()
     }
+
+@frappe.whitelist()
+def renew_editing_session(diagram_name):
+    """Extend the current user's edit lock on a diagram"""
+    if edit_lock.renew(diagram_name):
+        return {"success": True}
+    
+    return {
+        "success": False,
+        "message": "Your editing session has expired",
+        "holder": edit_lock.get_holder(diagram_name)
+    }
+
+@frappe.whitelist()
+def steal_edit_lock(diagram_name):
+    """Take over the edit lock of a diagram from another user"""
+    frappe.only_for("System Manager")
     
-    # Update cache
-    frappe.cache().hset("mermaid_editing_sessions", diagram_name, editing_sessions)
+    previous = edit_lock.steal(diagram_name, get_user_profile()["full_name"])
+    
+    # Tell the previous holder's editor that it lost the lock
+    frappe.publish_realtime(
+        "mermaid_edit_lock",
+        {"diagram": diagram_name, "holder": edit_lock.get_holder(diagram_name)},
+        doctype="Diagram",
+        docname=diagram_name,
+        after_commit=False
+    )
     
     return {
         "success": True,
-        "message": "Editing session started"
+        "previous_holder": previous
     }
 
+@frappe.whitelist()
+def submit_operation(diagram_name, revision, operation, client_id=None):
+    """Apply a text operation to a co-edited diagram and broadcast it"""
+    check_permission(diagram_name, "write", _("You don't have permission to edit this diagram"))
+    
+    if isinstance(operation, str):
+        operation = json.loads(operation)
+    
+    try:
+        return coedit.submit(diagram_name, revision, operation, client_id)
+    except (coedit.ResyncRequired, ot.OperationError):
+        # The client is too far behind or out of sync; it reloads from here
+        return dict(coedit.join(diagram_name), resync=True)
+
 @frappe.whitelist()
 def end_editing_session(diagram_name):
     """End an editing session for a diagram"""
-    # In a production environment, this would be implemented with WebSockets
-    # For now, we'll simulate editing sessions with a placeholder
-    editing_sessions = frappe.cache().hget("mermaid_editing_sessions", diagram_name) or {}
+    check_permission(diagram_name, "write", _("You don't have permission to edit this diagram"))
+    
+    edit_lock.release(diagram_name)
     
-    # Remove current user from editing sessions
-    if frappe.session.user in editing_sessions:
-        del editing_sessions[frappe.session.user]
+    # Save co-edited changes now rather than on the next scheduler run
+    coedit.persist(diagram_name)
     
-    # Update cache
-    frappe.cache().hset("mermaid_editing_sessions", diagram_name, editing_sessions)
+    # Leaving the editor closes the user's current batch of autosaves
+    pending = version_coalescing.get_pending_version(diagram_name)
+    if pending and pending.user == frappe.session.user:
+        version_coalescing.flush_pending_version(diagram_name)
     
     return {
         "success": True,
         "message": "Editing session ended"
-    } 
\ No newline at end of file
+    }
+
+@frappe.whitelist()
+def get_editing_status(diagram_names):
+    """Who is editing each of the given diagrams, for list and gallery views"""
+    if isinstance(diagram_names, str):
+        diagram_names = json.loads(diagram_names)
+    
+    # Diagrams the user cannot read are left out rather than revealing who edits them
+    return edit_lock.get_holders([name for name in diagram_names if has_permission(name, "read")])
+
+@frappe.whitelist()
+def get_edit_lock_stats():
+    """Edit lock counters and contention rate (System Manager only)"""
+    frappe.only_for("System Manager")
+    
+    return edit_lock.get_stats()
@@ -2,74 +2,192 @@ import frappe
 import json
 import base64
 from frappe import _
-from frappe.utils import now_datetime
+from frappe.utils import cint
+
+from mermaid_studio.mermaid_studio.doctype.diagram.diagram import create_share
+from mermaid_studio.mermaid_studio.doctype.diagram_folder.diagram_folder import get_breadcrumbs, get_folder_tree
+from mermaid_studio.mermaid_studio.doctype.diagram_version.diagram_version import (
+    get_next_version,
+    get_nth_version,
+    get_previous_version,
+    get_version_code,
+)
+from mermaid_studio.mermaid_studio.utils import ot, patch_log, render_stats, version_coalescing
+from mermaid_studio.mermaid_studio.utils.access import check_permission, get_token_share, has_permission
+from mermaid_studio.mermaid_studio.utils.response_shape import get_shape_fields, shape_diagram
+from mermaid_studio.mermaid_studio.utils.search import search_diagrams
+
+# Orders lists can be sorted in: (column, direction). Keyset paging keys on
+# the column plus name, which breaks ties.
+SORT_ORDERS = {
+    "modified desc": ("modified", "desc"),
+    "modified asc": ("modified", "asc"),
+    "title asc": ("title", "asc"),
+    "title desc": ("title", "desc")
+}
+
+# Diagrams one get_preview_codes call may ask for, a few pages of cards
+MAX_PREVIEW_CODES = 100
 
 @frappe.whitelist()
-def get_diagrams(folder=None, is_template=0, search_text=None, limit=20, start=0):
-    """Get diagrams with filters"""
+def get_diagrams(folder=None, is_template=0, search_text=None, limit=20, start=0, cursor=None,
+                 diagram_type=None, order_by="modified desc"):
+    """Get diagrams with filters
+    
+    Passing `cursor` (empty for the first page) switches to keyset paging:
+    the response is {"diagrams", "next_cursor"} and the `next_cursor` of one
+    page is the `cursor` of the next, None after the last page. `order_by` is
+    one of SORT_ORDERS; search results are always ordered by rank.
+    """
+    if order_by not in SORT_ORDERS:
+        frappe.throw(_("Invalid sort order: {0}").format(order_by))
+    
     filters = {}
     
     if folder:
         filters["folder"] = folder
     
+    if diagram_type:
+        filters["diagram_type"] = diagram_type
+    
     filters["is_template"] = is_template
     
     # Add owner filter for non-public diagrams
     if not int(is_template):
         filters["owner"] = frappe.session.user
     
-    # Search in title, description, or diagram_code
+    # Lists never carry the code or settings of the diagrams
+    fields = get_shape_fields("summary")
+    
+    if cursor is not None:
+        position = _decode_cursor(cursor, search_text, order_by)
+        return _get_diagrams_page(filters, fields, search_text, int(limit), position, order_by)
+    
+    # Ranked search through the token index
     if search_text:
+        diagrams = search_diagrams(search_text, filters, fields, limit, start)
+    else:
         diagrams = frappe.get_list(
             "Diagram",
             filters=filters,
-            or_filters=[
-                {"title": ["like", f"%{search_text}%"]},
-                {"description": ["like", f"%{search_text}%"]},
-                {"diagram_code": ["like", f"%{search_text}%"]}
-            ],
-            fields=["name", "title", "diagram_type", "status", "is_public", 
-                   "modified", "owner", "version", "thumbnail"],
+            fields=fields,
             limit=limit,
             start=start,
-            order_by="modified desc"
+            order_by=order_by
         )
+    
+    return diagrams
+
+def _get_diagrams_page(filters, fields, search_text, limit, cursor, order_by="modified desc"):
+    """One page of diagrams after `cursor`, fetching a row more to know if another page follows"""
+    if search_text:
+        # Search results are ordered by rank, so the cursor keeps an offset
+        start = cint(cursor.get("start"))
+        diagrams = search_diagrams(search_text, filters, fields, limit + 1, start)
+        next_cursor = {"start": start + limit}
     else:
+        # Continue strictly after the last row seen in sort order, with name
+        # breaking ties: (column, name) < cursor, or > when ascending
+        column, direction = SORT_ORDERS[order_by]
+        operator = "<" if direction == "desc" else ">"
+        or_filters = None
+        next_cursor = None
+        if cursor:
+            filters[column] = [f"{operator}=", cursor[column]]
+            or_filters = [
+                [column, operator, cursor[column]],
+                ["name", operator, cursor["name"]]
+            ]
+        
         diagrams = frappe.get_list(
             "Diagram",
             filters=filters,
-            fields=["name", "title", "diagram_type", "status", "is_public", 
-                   "modified", "owner", "version", "thumbnail"],
-            limit=limit,
-            start=start,
-            order_by="modified desc"
+            or_filters=or_filters,
+            fields=fields,
+            limit=limit + 1,
+            order_by=f"{column} {direction}, name {direction}"
         )
+        
+        if len(diagrams) > limit:
+            last = diagrams[limit - 1]
+            next_cursor = {column: str(last[column]), "name": last.name}
     
-    return diagrams
+    return {
+        "diagrams": diagrams[:limit],
+        "next_cursor": _encode_cursor(next_cursor) if len(diagrams) > limit else None
+    }
+
+def _encode_cursor(position):
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+def _decode_cursor(cursor, search_text=None, order_by="modified desc"):
+    """The position of a cursor, which must be of the kind the paging mode hands out"""
+    if not cursor:
+        return {}
+    
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        frappe.throw(_("Invalid pagination cursor"))
+    
+    # Search pages by offset, plain lists by the last (sort column, name)
+    # seen. A cursor of another mode or sort column, e.g. after the search
+    # text was cleared, must not be used as if it were one of this mode.
+    if not isinstance(position, dict):
+        valid = False
+    elif search_text:
+        valid = set(position) == {"start"} and isinstance(position["start"], int) and position["start"] >= 0
+    else:
+        column = SORT_ORDERS[order_by][0]
+        valid = set(position) == {column, "name"} and all(isinstance(v, str) for v in position.values())
+    
+    if not valid:
+        frappe.throw(_("Invalid pagination cursor"))
+    
+    return position
+
+@frappe.whitelist()
+def get_folders():
+    """All folders in tree order with their depth and recursive diagram counts"""
+    return get_folder_tree()
+
+@frappe.whitelist()
+def get_folder_breadcrumbs(folder):
+    """The path from the top level folder down to a folder"""
+    return get_breadcrumbs(folder)
 
 @frappe.whitelist()
 def get_diagram(name):
     """Get a single diagram by name"""
-    diagram = frappe.get_doc("Diagram", name)
+    check_permission(name, "read")
+    render_stats.record_view(name)
     
-    # Check permissions
-    if not diagram.is_public and diagram.owner != frappe.session.user:
-        # Check if diagram is shared with the user
-        share = frappe.db.exists("Diagram Share", {
-            "diagram": name,
-            "shared_with": frappe.session.user
-        })
-        
-        if not share:
-            frappe.throw(_("You don't have permission to access this diagram"))
+    return frappe.get_doc("Diagram", name)
+
+@frappe.whitelist()
+def get_preview_codes(diagram_names):
+    """Code of the listed diagrams the user can read or that are templates, to render previews in the browser"""
+    diagram_names = frappe.parse_json(diagram_names) or []
+    if not isinstance(diagram_names, list) or len(diagram_names) > MAX_PREVIEW_CODES:
+        frappe.throw(_("Request previews of at most {0} diagrams").format(MAX_PREVIEW_CODES))
+    
+    rows = frappe.get_all(
+        "Diagram",
+        filters={"name": ["in", diagram_names]},
+        fields=["name", "diagram_code", "is_template"]
+    )
     
-    return diagram
+    return {
+        row.name: row.diagram_code
+        for row in rows
+        if row.is_template or has_permission(row.name, "read")
+    }
 
 @frappe.whitelist()
 def create_diagram(title, diagram_code, diagram_type=None, description=None, 
                   folder=None, is_public=0, is_template=0, tags=None, 
-                  render_settings=None, thumbnail=None):
-    """Create a new diagram"""
+                  render_settings=None, thumbnail=None, response_shape="full"):
+    """Create a new diagram and return it in the given shape (minimal, summary or full)"""
     diagram = frappe.new_doc("Diagram")
     diagram.title = title
     diagram.diagram_code = diagram_code
@@ -95,81 +213,110 @@ def create_diagram(title, diagram_code, diagram_type=None, description=None,
     
     diagram.insert()
     
-    return diagram
+    return shape_diagram(diagram, response_shape)
 
 @frappe.whitelist()
 def update_diagram(name, title=None, diagram_code=None, diagram_type=None, 
                   description=None, folder=None, is_public=None, 
                   is_template=None, status=None, tags=None, 
-                  render_settings=None, thumbnail=None):
-    """Update an existing diagram"""
+                  render_settings=None, thumbnail=None, response_shape="full",
+                  patch=None, base_modified=None):
+    """Update an existing diagram and return it in the given shape (minimal, summary or full)
+    
+    Instead of the whole `diagram_code` a `patch` (a text operation, see
+    utils/ot.py) made against the code saved at `base_modified` can be sent.
+    It is rebased over saves made since, or rejected with a
+    TimestampMismatchError when that is no longer possible. Nothing is
+    written when no value actually changes.
+    """
+    check_permission(name, "write", _("You don't have permission to edit this diagram"))
+    
     diagram = frappe.get_doc("Diagram", name)
+    rebased = False
     
-    # Check permissions
-    if diagram.owner != frappe.session.user:
-        # Check if diagram is shared with the user with write permissions
-        share = frappe.db.get_value("Diagram Share", {
-            "diagram": name,
-            "shared_with": frappe.session.user,
-            "permission_level": ["in", ["write", "admin"]]
-        })
+    if patch is not None:
+        if diagram_code is not None:
+            frappe.throw(_("Send either diagram_code or a patch, not both"))
         
-        if not share:
-            frappe.throw(_("You don't have permission to edit this diagram"))
+        diagram_code, rebased = _apply_patch(diagram, patch, base_modified)
+    
+    values = {
+        "title": title,
+        "diagram_code": diagram_code,
+        "diagram_type": diagram_type,
+        "description": description,
+        "folder": folder,
+        "is_public": is_public,
+        "is_template": is_template,
+        "status": status,
+        "render_settings": render_settings,
+        "thumbnail": thumbnail
+    }
     
     # Update fields if provided
-    if title is not None:
-        diagram.title = title
-    
-    if diagram_code is not None:
-        diagram.diagram_code = diagram_code
+    changed = False
+    for fieldname, value in values.items():
+        if value is None:
+            continue
+        
+        value = diagram.cast(value, diagram.meta.get_field(fieldname))
+        if diagram.get(fieldname) != value:
+            diagram.set(fieldname, value)
+            changed = True
     
-    if diagram_type is not None:
-        diagram.diagram_type = diagram_type
+    # Update tags if provided
+    if tags is not None:
+        tags_list = json.loads(tags) if isinstance(tags, str) else tags
+        
+        if [row.tag for row in diagram.tags] != list(tags_list):
+            # Replace existing tags
+            diagram.tags = []
+            for tag in tags_list:
+                diagram.append("tags", {"tag": tag})
+            
+            changed = True
     
-    if description is not None:
-        diagram.description = description
+    if changed:
+        diagram.save()
     
-    if folder is not None:
-        diagram.folder = folder
+    result = shape_diagram(diagram, response_shape)
     
-    if is_public is not None:
-        diagram.is_public = is_public
+    if rebased and response_shape != "full":
+        # The client's code lacks the changes its patch was rebased over
+        result["diagram_code"] = diagram.diagram_code
     
-    if is_template is not None:
-        diagram.is_template = is_template
+    return result
+
+def _apply_patch(diagram, patch, base_modified):
+    """Code after applying a patch made against the save at `base_modified`, and whether it was rebased"""
+    if not base_modified:
+        frappe.throw(_("base_modified is required to apply a patch"))
     
-    if status is not None:
-        diagram.status = status
+    operation = json.loads(patch) if isinstance(patch, str) else patch
+    if not isinstance(operation, list):
+        frappe.throw(_("A patch must be a list of text operation components"))
     
-    if render_settings is not None:
-        diagram.render_settings = render_settings
+    conflict = _("This diagram was changed since you opened it, please reload it and try again")
     
-    if thumbnail is not None:
-        diagram.thumbnail = thumbnail
+    # Saves made since the base, oldest first
+    committed = patch_log.get_operations_since(diagram.name, base_modified, diagram.modified)
+    if committed is None:
+        frappe.throw(conflict, frappe.TimestampMismatchError)
     
-    # Update tags if provided
-    if tags is not None:
-        # Remove existing tags
-        diagram.tags = []
+    try:
+        for other in committed:
+            _other, operation = ot.transform(other, operation)
         
-        # Add new tags
-        tags_list = json.loads(tags) if isinstance(tags, str) else tags
-        for tag in tags_list:
-            diagram.append("tags", {"tag": tag})
+        code = ot.apply(diagram.diagram_code or "", ot.normalize(operation))
+    except ot.OperationError:
+        frappe.throw(conflict, frappe.TimestampMismatchError)
     
-    diagram.save()
-    
-    return diagram
+    return code, any(committed)
 
 @frappe.whitelist()
 def delete_diagram(name):
     """Delete a diagram"""
-    diagram = frappe.get_doc("Diagram", name)
-    
-    # Check permissions
-    if diagram.owner != frappe.session.user:
-        frappe.throw(_("You don't have permission to delete this diagram"))
+    check_permission(name, "owner", _("You don't have permission to delete this diagram"))
     
     frappe.delete_doc("Diagram", name)
     
@@ -178,17 +325,7 @@ def delete_diagram(name):
 @frappe.whitelist()
 def get_diagram_versions(diagram_name):
     """Get all versions of a diagram"""
-    # Check permissions
-    diagram = frappe.get_doc("Diagram", diagram_name)
-    if diagram.owner != frappe.session.user and not diagram.is_public:
-        # Check if diagram is shared with the user
-        share = frappe.db.exists("Diagram Share", {
-            "diagram": diagram_name,
-            "shared_with": frappe.session.user
-        })
-        
-        if not share:
-            frappe.throw(_("You don't have permission to access this diagram"))
+    check_permission(diagram_name, "read")
     
     versions = frappe.get_all(
         "Diagram Version",
@@ -200,57 +337,73 @@ def get_diagram_versions(diagram_name):
     return versions
 
 @frappe.whitelist()
-def get_version_diff(version1, version2=None):
-    """Get diff between two versions"""
+def get_version(diagram_name, version_number=None, direction=None, n=None):
+    """Get a single version by number, the one before/after a number, or the n-th"""
+    check_permission(diagram_name, "read")
+    
+    fields = ["name", "version_number", "created_by", "created_on", "change_notes"]
+    
+    if n is not None:
+        version = get_nth_version(diagram_name, n, fields)
+    elif version_number is None:
+        frappe.throw(_("Either version_number or n is required"))
+    elif direction == "previous":
+        version = get_previous_version(diagram_name, int(version_number), fields)
+    elif direction == "next":
+        version = get_next_version(diagram_name, int(version_number), fields)
+    elif not direction:
+        version = frappe.db.get_value("Diagram Version", {
+            "diagram": diagram_name,
+            "version_number": int(version_number)
+        }, fields, as_dict=True)
+    else:
+        frappe.throw(_("Direction must be 'previous' or 'next'"))
+    
+    if not version:
+        return None
+    
+    version.diagram_code = get_version_code(diagram_name, version.version_number)
+    
+    return version
+
+@frappe.whitelist()
+def get_version_diff(version1, version2=None, output_format="unified"):
+    """Get diff between two versions as unified text or, for flowcharts, structured changes"""
     v1 = frappe.get_doc("Diagram Version", version1)
+    check_permission(v1.diagram, "read")
     
     if version2:
         v2 = frappe.get_doc("Diagram Version", version2)
-        return v1.get_diff(v2.name)
+        return v1.get_diff(v2.name, output_format)
     else:
-        return v1.get_diff()
+        return v1.get_diff(output_format=output_format)
 
 @frappe.whitelist()
 def restore_version(version_name):
     """Restore a specific version"""
     version = frappe.get_doc("Diagram Version", version_name)
-    
-    # Check permissions
-    diagram = frappe.get_doc("Diagram", version.diagram)
-    if diagram.owner != frappe.session.user:
-        # Check if diagram is shared with the user with write permissions
-        share = frappe.db.get_value("Diagram Share", {
-            "diagram": version.diagram,
-            "shared_with": frappe.session.user,
-            "permission_level": ["in", ["write", "admin"]]
-        })
-        
-        if not share:
-            frappe.throw(_("You don't have permission to restore this version"))
+    check_permission(version.diagram, "write", _("You don't have permission to restore this version"))
     
     result = version.restore_version()
     
     return {"success": result}
 
+@frappe.whitelist()
+def checkpoint_version(diagram_name, change_notes=None):
+    """Turn the pending autosave changes of a diagram into a version now"""
+    check_permission(diagram_name, "write", _("You don't have permission to edit this diagram"))
+    
+    version = version_coalescing.flush_pending_version(diagram_name, change_notes=change_notes)
+    
+    return {"success": bool(version), "version": version}
+
 @frappe.whitelist()
 def share_diagram(diagram_name, user_email, permission_level="read", expiry_days=None):
     """Share a diagram with another user"""
-    diagram = frappe.get_doc("Diagram", diagram_name)
-    
-    # Check permissions
-    if diagram.owner != frappe.session.user:
-        # Check if diagram is shared with the user with admin permissions
-        share = frappe.db.get_value("Diagram Share", {
-            "diagram": diagram_name,
-            "shared_with": frappe.session.user,
-            "permission_level": "admin"
-        })
-        
-        if not share:
-            frappe.throw(_("You don't have permission to share this diagram"))
+    check_permission(diagram_name, "admin", _("You don't have permission to share this diagram"))
     
     # Share the diagram
-    share_token = diagram.share_with_user(user_email, permission_level, expiry_days)
+    share_token = create_share(diagram_name, user_email, permission_level, expiry_days)
     
     return {
         "success": True,
@@ -260,32 +413,21 @@ def share_diagram(diagram_name, user_email, permission_level="read", expiry_days
 @frappe.whitelist()
 def export_diagram_svg(diagram_name):
     """Export diagram as SVG"""
-    diagram = frappe.get_doc("Diagram", diagram_name)
+    from mermaid_studio.mermaid_studio.api.export_api import export_as_svg
     
-    # This would typically call a server-side mermaid renderer
-    # For now, we'll return the diagram code for client-side rendering
-    return {
-        "diagram_code": diagram.diagram_code,
-        "diagram_type": diagram.diagram_type,
-        "title": diagram.title
-    }
+    return export_as_svg(diagram_name)
 
 @frappe.whitelist()
-def get_public_diagram(share_token):
-    """Get a diagram using a public share token"""
-    share = frappe.db.get_value("Diagram Share", 
-                               {"share_token": share_token}, 
-                               ["diagram", "permission_level", "expires_on"],
-                               as_dict=True)
+def get_public_diagram(share_token, response_shape="full"):
+    """Get a diagram using a public share token, in the given shape (minimal, summary or full)"""
+    share = get_token_share(share_token)
     
-    if not share:
-        frappe.throw(_("Invalid share token"))
+    render_stats.record_view(share.diagram)
     
-    # Check if share has expired
-    if share.expires_on and frappe.utils.getdate(share.expires_on) < frappe.utils.getdate(now_datetime()):
-        frappe.throw(_("This share link has expired"))
-    
-    diagram = frappe.get_doc("Diagram", share.diagram)
+    if response_shape == "full":
+        diagram = frappe.get_doc("Diagram", share.diagram)
+    else:
+        diagram = frappe.db.get_value("Diagram", share.diagram, get_shape_fields(response_shape), as_dict=True)
     
     # Add permission info to the response
     diagram.permission_level = share.permission_level
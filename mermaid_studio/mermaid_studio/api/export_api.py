@@ -1,118 +1,207 @@
 import frappe
 import json
 import os
-import tempfile
 import subprocess
 from frappe import _
-from frappe.utils import get_site_path, get_files_path
-from frappe.utils.file_manager import save_file
+from frappe.utils import cint, get_site_path, get_files_path
+
+from mermaid_studio.mermaid_studio.utils import render_stats, svg_cache
+from mermaid_studio.mermaid_studio.utils.access import check_permission, get_token_share
+from mermaid_studio.mermaid_studio.utils.bulk_export import enqueue_export, get_readable_diagrams
+from mermaid_studio.mermaid_studio.utils.bulk_import import enqueue_import, get_source_files
+from mermaid_studio.mermaid_studio.utils.diagram_type import detect_diagram_type
+from mermaid_studio.mermaid_studio.utils.exporters import (
+    build_export,
+    get_export_file_name,
+    save_export_file,
+)
+from mermaid_studio.mermaid_studio.utils.job_status import get_job_for_user
+from mermaid_studio.mermaid_studio.utils.render import (
+    MermaidRenderError,
+    RendererUnavailableError,
+    get_cached_svg,
+    get_render_pool,
+    get_svg,
+)
 
 @frappe.whitelist()
 def export_as_svg(diagram_name):
     """Export diagram as SVG"""
+    check_permission(diagram_name, "read")
     diagram = frappe.get_doc("Diagram", diagram_name)
     
-    # For now, we'll return the diagram code for client-side rendering
-    # In a production environment, you would use a server-side renderer
-    return {
+    result = {
         "diagram_code": diagram.diagram_code,
         "diagram_type": diagram.diagram_type,
-        "title": diagram.title
+        "title": diagram.title,
+        "svg": None,
+        "cached": False
     }
+    
+    # Render on the server when possible; repeated exports are served from
+    # the content-addressed SVG cache. Without a renderer installed the client
+    # falls back to rendering the returned diagram code itself.
+    try:
+        svg, cached = get_svg(diagram.diagram_code, diagram.render_settings)
+        result["svg"] = svg.decode("utf-8")
+        result["cached"] = cached
+        render_stats.record_render(diagram_name)
+    except RendererUnavailableError:
+        pass
+    except MermaidRenderError as e:
+        frappe.log_error(f"Error rendering diagram {diagram_name}: {str(e)}", "Diagram Render Error")
+    
+    return result
+
+@frappe.whitelist(allow_guest=True)
+def get_svg_image(diagram_name=None, share_token=None, cached_only=0):
+    """Serve the rendered SVG of a diagram as a static image
+    
+    With `cached_only` only a render that is already cached is served and a
+    miss is a 404, so list views can show cached previews without starting
+    a render per card.
+    """
+    if share_token:
+        diagram_name = get_shared_diagram_name(share_token)
+    elif not diagram_name:
+        frappe.throw(_("Diagram name or share token is required"))
+    
+    diagram = frappe.db.get_value(
+        "Diagram", diagram_name,
+        ["name", "title", "diagram_code", "render_settings"],
+        as_dict=True
+    )
+    
+    if not diagram:
+        frappe.throw(_("Diagram {0} not found").format(diagram_name), frappe.DoesNotExistError)
+    
+    if not share_token:
+        check_permission(diagram_name, "read")
+    
+    if cint(cached_only):
+        svg = get_cached_svg(diagram.diagram_code, diagram.render_settings)
+        if svg is None:
+            frappe.throw(_("No cached render of diagram {0}").format(diagram_name), frappe.DoesNotExistError)
+    else:
+        try:
+            svg, cached = get_svg(diagram.diagram_code, diagram.render_settings)
+        except MermaidRenderError as e:
+            frappe.throw(_("Error rendering diagram: {0}").format(str(e)))
+        
+        render_stats.record_render(diagram.name)
+    
+    frappe.local.response.filename = f"{diagram.name}.svg"
+    frappe.local.response.filecontent = svg
+    frappe.local.response.type = "binary"
+    frappe.local.response.display_content_as = "inline"
+
+def get_shared_diagram_name(share_token):
+    """Resolve a share token to its diagram, rejecting expired shares"""
+    return get_token_share(share_token).diagram
 
 @frappe.whitelist()
-def export_as_png(diagram_name, width=800, height=600, scale=2):
-    """Export diagram as PNG using puppeteer"""
-    diagram = frappe.get_doc("Diagram", diagram_name)
+def get_svg_cache_stats():
+    """Hit/miss counters and disk usage of the SVG render cache"""
+    frappe.only_for("System Manager")
     
-    # In a production environment, this would use puppeteer or another
-    # headless browser to render the SVG and convert to PNG
-    # For now, we'll just return a placeholder message
-    return {
-        "message": "PNG export would be implemented with server-side rendering",
-        "diagram_code": diagram.diagram_code
-    }
+    return svg_cache.get_stats()
 
 @frappe.whitelist()
-def export_as_pdf(diagram_name):
-    """Export diagram as PDF"""
-    diagram = frappe.get_doc("Diagram", diagram_name)
+def clear_svg_cache():
+    """Remove all cached SVG renders"""
+    frappe.only_for("System Manager")
     
-    # Similar to PNG export, this would use a headless browser
-    # For now, we'll just return a placeholder message
-    return {
-        "message": "PDF export would be implemented with server-side rendering",
-        "diagram_code": diagram.diagram_code
-    }
+    svg_cache.clear()
+    
+    return {"success": True}
 
 @frappe.whitelist()
-def export_as_mmd(diagram_name):
-    """Export diagram as .mmd file (Mermaid Markdown)"""
+def export_as_png(diagram_name, width=800, height=600, scale=2):
+    """Export diagram as PNG using the renderer worker pool"""
+    return export_diagram_file(diagram_name, "png", width=int(width), height=int(height), scale=float(scale))
+
+@frappe.whitelist()
+def export_as_pdf(diagram_name):
+    """Export diagram as PDF using the renderer worker pool"""
+    return export_diagram_file(diagram_name, "pdf")
+
+def export_diagram_file(diagram_name, export_format, **options):
+    """Build an export in memory and attach it to the diagram"""
+    check_permission(diagram_name, "read")
     diagram = frappe.get_doc("Diagram", diagram_name)
     
-    # Create a temporary file
-    with tempfile.NamedTemporaryFile(suffix='.mmd', delete=False) as temp_file:
-        temp_file.write(diagram.diagram_code.encode('utf-8'))
-        temp_file_path = temp_file.name
+    try:
+        writer = build_export(diagram, export_format, **options)
+    except RendererUnavailableError:
+        frappe.throw(_("Server-side rendering is not available on this site"))
+    except MermaidRenderError as e:
+        frappe.log_error(f"Error rendering diagram {diagram.name}: {str(e)}", "Diagram Render Error")
+        frappe.throw(_("Error rendering diagram: {0}").format(str(e)))
     
-    # Save the file to Frappe's file manager
-    file_name = f"{diagram.title.replace(' ', '_')}.mmd"
-    file_url = save_file(
-        file_name,
-        open(temp_file_path, 'rb').read(),
-        "Diagram",
-        diagram_name,
-        is_private=1
-    ).file_url
+    render_stats.record_render(diagram.name)
     
-    # Clean up the temporary file
-    os.unlink(temp_file_path)
+    return save_export_file(diagram, get_export_file_name(diagram, export_format), writer)
+
+@frappe.whitelist()
+def get_render_pool_stats():
+    """Queue depth and job counters of this worker's renderer pool"""
+    frappe.only_for("System Manager")
     
-    return {
-        "file_url": file_url,
-        "file_name": file_name
-    }
+    return get_render_pool().get_stats()
+
+@frappe.whitelist()
+def export_as_mmd(diagram_name):
+    """Export diagram as .mmd file (Mermaid Markdown)"""
+    return export_diagram_file(diagram_name, "mmd")
 
 @frappe.whitelist()
 def export_as_json(diagram_name):
     """Export diagram as JSON"""
-    diagram = frappe.get_doc("Diagram", diagram_name)
-    
-    # Create a JSON representation
-    diagram_json = {
-        "title": diagram.title,
-        "description": diagram.description,
-        "diagram_code": diagram.diagram_code,
-        "diagram_type": diagram.diagram_type,
-        "version": diagram.version,
-        "created_by": diagram.created_by,
-        "created_at": str(diagram.creation),
-        "tags": [tag.tag for tag in diagram.tags]
-    }
-    
-    # Create a temporary file
-    with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as temp_file:
-        temp_file.write(json.dumps(diagram_json, indent=2).encode('utf-8'))
-        temp_file_path = temp_file.name
+    return export_diagram_file(diagram_name, "json")
+
+@frappe.whitelist()
+def export_diagrams(diagram_names=None, folder=None, export_format="mmd"):
+    """Queue a background export of several diagrams into one zip archive"""
+    if isinstance(diagram_names, str):
+        diagram_names = json.loads(diagram_names)
     
-    # Save the file to Frappe's file manager
-    file_name = f"{diagram.title.replace(' ', '_')}.json"
-    file_url = save_file(
-        file_name,
-        open(temp_file_path, 'rb').read(),
-        "Diagram",
-        diagram_name,
-        is_private=1
-    ).file_url
+    if not diagram_names and not folder:
+        frappe.throw(_("Select diagrams or a folder to export"))
     
-    # Clean up the temporary file
-    os.unlink(temp_file_path)
+    names = get_readable_diagrams(diagram_names, folder)
+    export_id = enqueue_export(names, export_format, archive_name=folder)
     
     return {
-        "file_url": file_url,
-        "file_name": file_name
+        "job_id": export_id,
+        "total": len(names)
     }
 
+@frappe.whitelist()
+def export_folder(folder, export_format="mmd"):
+    """Queue a background export of every diagram in a folder"""
+    return export_diagrams(folder=folder, export_format=export_format)
+
+@frappe.whitelist()
+def get_export_job_status(job_id):
+    """Status, progress and result file of a background export"""
+    return get_job_for_user(job_id)
+
+@frappe.whitelist()
+def bulk_import(file_url=None, file_names=None, file_folder=None, folder=None, is_public=0):
+    """Queue a background import from a zip archive or from files already uploaded"""
+    if isinstance(file_names, str):
+        file_names = json.loads(file_names)
+    
+    source_files = get_source_files(file_url, file_names, file_folder)
+    import_id = enqueue_import(source_files, folder, is_public)
+    
+    return {"job_id": import_id}
+
+@frappe.whitelist()
+def get_import_job_status(job_id):
+    """Progress and final report of a background import"""
+    return get_job_for_user(job_id)
+
 @frappe.whitelist()
 def import_from_mmd(file_url, title=None, folder=None, is_public=0):
     """Import diagram from .mmd file"""
@@ -136,20 +225,7 @@ def import_from_mmd(file_url, title=None, folder=None, is_public=0):
         diagram.created_by = frappe.session.user
         
         # Auto-detect diagram type
-        if diagram_code.strip().lower().startswith("graph ") or diagram_code.strip().lower().startswith("flowchart "):
-            diagram.diagram_type = "flowchart"
-        elif diagram_code.strip().lower().startswith("sequencediagram"):
-            diagram.diagram_type = "sequence"
-        elif diagram_code.strip().lower().startswith("classdiagram"):
-            diagram.diagram_type = "class"
-        elif diagram_code.strip().lower().startswith("statediagram"):
-            diagram.diagram_type = "state"
-        elif diagram_code.strip().lower().startswith("gantt"):
-            diagram.diagram_type = "gantt"
-        elif diagram_code.strip().lower().startswith("pie"):
-            diagram.diagram_type = "pie"
-        else:
-            diagram.diagram_type = "other"
+        diagram.diagram_type = detect_diagram_type(diagram_code)
         
         diagram.insert()
         
@@ -0,0 +1,117 @@
+import frappe
+import time
+
+from mermaid_studio.mermaid_studio.utils import cursors
+
+# Cursor updates through the realtime throttle of utils/cursors.py against
+# the pickled dict per diagram that every update used to read and rewrite:
+#
+#   bench --site <site> execute mermaid_studio.mermaid_studio.benchmarks.cursor_throttle.run \
+#       --kwargs "{'users': 50, 'rate': 60, 'seconds': 5}"
+#
+# Every user sends a cursor move `rate` times a second, as a client without
+# its own throttle would, for `seconds` seconds. Published messages are
+# counted from update_cursor's return value and handler time is CPU time
+# per call. The events go to the room of a made-up diagram and the keys are
+# removed again afterwards.
+
+OLD_CURSORS_KEY = "mermaid_cursors_benchmark"
+
+def run(users=50, rate=60, seconds=5):
+    """Send cursor moves from `users` users at `rate` Hz and report requests, messages and handler CPU"""
+    diagram = f"benchmark-{frappe.generate_hash(length=10)}"
+    names = [f"user{i}@example.com" for i in range(int(users))]
+    session_user = frappe.session.user
+    
+    try:
+        new = _send_moves(names, int(rate), float(seconds), lambda user, position: cursors.update_cursor(
+            diagram, position, {"full_name": user}
+        ))
+        old = _send_moves(names, int(rate), float(seconds), lambda user, position: _old_update(
+            diagram, user, position
+        ))
+        old["poll_cpu"] = _time_old_poll(diagram)
+    finally:
+        frappe.set_user(session_user)
+        frappe.cache().hdel(OLD_CURSORS_KEY, diagram)
+        frappe.cache().delete_value(
+            [cursors.CURSORS_KEY.format(diagram)]
+            + [cursors.THROTTLE_KEY.format(diagram, user) for user in names]
+        )
+    
+    results = {
+        "users": len(names),
+        "rate": int(rate),
+        "throttle_ms": cursors.get_throttle_ms(),
+        "realtime": new,
+        "old": old
+    }
+    
+    print(format_results(results))
+    return results
+
+def format_results(results):
+    new, old = results["realtime"], results["old"]
+    return "\n".join([
+        f"{results['users']} users at {results['rate']} Hz, throttle {results['throttle_ms']} ms",
+        f"realtime: {new['requests'] / new['seconds']:.0f} requests/s in, "
+        f"{new['published'] / new['seconds']:.0f} messages/s published "
+        f"({new['published'] / new['seconds'] / results['users']:.1f}/user/s), "
+        f"{new['cpu'] / new['requests'] * 1e6:.0f} us CPU per update",
+        f"old dict rewrite: {old['requests'] / old['seconds']:.0f} requests/s in, "
+        f"{old['cpu'] / old['requests'] * 1e6:.0f} us CPU per update, "
+        f"{old['poll_cpu'] * 1e6:.0f} us CPU per get_cursor_positions poll"
+    ])
+
+def _send_moves(names, rate, seconds, update):
+    """Send one move per user every 1/rate s and count what update() returns truthy for"""
+    requests = published = 0
+    cpu = 0.0
+    ticks = int(rate * seconds)
+    start = time.perf_counter()
+    
+    for tick in range(ticks):
+        # Falls behind rather than skipping ticks when the handler is too slow
+        delay = start + tick / rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        
+        for i, user in enumerate(names):
+            frappe.set_user(user)
+            started = time.process_time()
+            published += bool(update(user, {"x": tick, "y": i}))
+            cpu += time.process_time() - started
+            requests += 1
+    
+    return {
+        "requests": requests,
+        "published": published,
+        "cpu": cpu,
+        "seconds": time.perf_counter() - start
+    }
+
+def _old_update(diagram_name, user, position):
+    """update_cursor_position as it was: read every cursor of the diagram, change one, write all back"""
+    cache = frappe.cache()
+    cursor_positions = cache.hget(OLD_CURSORS_KEY, diagram_name) or {}
+    cursor_positions[user] = {
+        "position": position,
+        "timestamp": time.time(),
+        "user": user,
+        "full_name": user
+    }
+    
+    cache.hset(OLD_CURSORS_KEY, diagram_name, cursor_positions)
+    
+    # Nothing was published, other users had to poll
+    return False
+
+def _time_old_poll(diagram_name, polls=100):
+    """CPU per get_cursor_positions call as it was, on the dict _old_update left behind"""
+    started = time.process_time()
+    for _poll in range(polls):
+        cursor_positions = frappe.cache().hget(OLD_CURSORS_KEY, diagram_name) or {}
+        cutoff = time.time() - cursors.CURSOR_TIMEOUT
+        {user: cursor for user, cursor in cursor_positions.items() if cursor["timestamp"] > cutoff}
+    
+    return (time.process_time() - started) / polls
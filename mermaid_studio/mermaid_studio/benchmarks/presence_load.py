@@ -0,0 +1,112 @@
+import frappe
+import threading
+import time
+
+from mermaid_studio.mermaid_studio.utils import presence
+
+# Concurrent presence heartbeats on one diagram, with the Redis sorted set of
+# utils/presence.py against the pickled list the app used to read, change
+# and write back:
+#
+#   bench --site <site> execute mermaid_studio.mermaid_studio.benchmarks.presence_load.run \
+#       --kwargs "{'users': 500, 'heartbeats': 20}"
+#
+# Every user gets a thread that sends its heartbeats as fast as it can, all
+# starting at once. Afterwards every user should be listed as active; with
+# the old read-modify-write, concurrent heartbeats overwrite each other. The
+# keys are removed again afterwards.
+
+OLD_PRESENCE_KEY = "mermaid_presence_benchmark"
+
+def run(users=500, heartbeats=20):
+    """Send `heartbeats` heartbeats for each of `users` users at once and count who is listed"""
+    diagram = f"benchmark-{frappe.generate_hash(length=10)}"
+    names = [f"user{i}@example.com" for i in range(int(users))]
+    
+    try:
+        old_seconds = _run_threads(names, int(heartbeats), lambda user: _old_heartbeat(diagram, user))
+        old_visible = len(frappe.cache().hget(OLD_PRESENCE_KEY, diagram) or [])
+        
+        new_seconds = _run_threads(names, int(heartbeats), lambda user: presence.heartbeat(diagram, user))
+        new_visible = len(presence.get_active_users(diagram))
+        
+        pruned = _check_pruning(diagram)
+    finally:
+        frappe.cache().hdel(OLD_PRESENCE_KEY, diagram)
+        frappe.cache().delete(presence._key(diagram))
+    
+    results = {
+        "users": len(names),
+        "heartbeats": int(heartbeats),
+        "old": {"visible": old_visible, "seconds": old_seconds},
+        "sorted_set": {"visible": new_visible, "seconds": new_seconds},
+        "stale_user_pruned": pruned
+    }
+    
+    print(format_results(results))
+    return results
+
+def format_results(results):
+    total = results["users"] * results["heartbeats"]
+    lines = [f"{results['users']} users x {results['heartbeats']} heartbeats on one diagram"]
+    
+    for label in ("old", "sorted_set"):
+        result = results[label]
+        lines.append(
+            f"{label.replace('_', ' ')}: {result['visible']}/{results['users']} users visible, "
+            f"{total / result['seconds']:.0f} heartbeats/s"
+        )
+    
+    lines.append(f"stale user dropped and pruned: {results['stale_user_pruned']}")
+    return "\n".join(lines)
+
+def _old_heartbeat(diagram_name, user):
+    """The heartbeat as get_active_users used to do it: read the list, change it, write it back"""
+    cache = frappe.cache()
+    active_users = cache.hget(OLD_PRESENCE_KEY, diagram_name) or []
+    
+    for entry in active_users:
+        if entry["user"] == user:
+            entry["last_active"] = time.time()
+            break
+    else:
+        active_users.append({"user": user, "last_active": time.time()})
+    
+    cache.hset(OLD_PRESENCE_KEY, diagram_name, active_users)
+
+def _run_threads(names, heartbeats, heartbeat):
+    """Seconds until every user sent its heartbeats, one thread per user released at once"""
+    site, sites_path = frappe.local.site, frappe.local.sites_path
+    barrier = threading.Barrier(len(names) + 1, timeout=60)
+    
+    def send(user):
+        # Threads have no site context of their own
+        frappe.init(site=site, sites_path=sites_path)
+        try:
+            barrier.wait()
+            for _heartbeat in range(heartbeats):
+                heartbeat(user)
+        finally:
+            frappe.destroy()
+    
+    threads = [threading.Thread(target=send, args=(user,)) for user in names]
+    for thread in threads:
+        thread.start()
+    
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    
+    return time.perf_counter() - start
+
+def _check_pruning(diagram_name):
+    """A user whose last heartbeat is older than the timeout is not listed and is removed by the next heartbeat"""
+    stale = "stale@example.com"
+    frappe.cache().zadd(presence._key(diagram_name), {stale: time.time() - 2 * presence.PRESENCE_TIMEOUT})
+    
+    listed = stale in dict(presence.get_active_users(diagram_name))
+    presence.heartbeat(diagram_name, "user0@example.com")
+    kept = frappe.cache().zscore(presence._key(diagram_name), stale) is not None
+    
+    return not listed and not kept
@@ -0,0 +1,121 @@
+import frappe
+import os
+import random
+import statistics
+import time
+import uuid
+
+from mermaid_studio.mermaid_studio.utils import counters, render, render_pool, svg_cache
+
+# Cold vs warm SVG exports through the content-addressed cache:
+#
+#   bench --site <site> execute mermaid_studio.mermaid_studio.benchmarks.svg_export.run \
+#       --kwargs "{'diagrams': 1000, 'render_delay': 0.2}"
+#
+# Renders go to the stub renderer, which sleeps `render_delay` seconds per job
+# in place of a browser, so the numbers measure the cache rather than
+# mermaid. Entries are written under a one-off mermaid version and removed
+# again afterwards, and the hit/miss counters are restored.
+
+def run(diagrams=1000, render_delay=0.2, pool_size=2, seed=42):
+    """Export `diagrams` generated diagrams twice and report cold and warm timings"""
+    codes = get_diagram_codes(int(diagrams), seed)
+    conf_overrides = {
+        "mermaid_renderer": "stub",
+        "mermaid_renderer_options": {"delay": float(render_delay)},
+        "mermaid_render_pool_size": int(pool_size),
+        "mermaid_version": f"benchmark-{uuid.uuid4().hex}"
+    }
+    
+    saved_conf = {key: frappe.conf.get(key) for key in conf_overrides}
+    saved_stats = counters.get_values(svg_cache.STATS_KEY, svg_cache.STATS_FIELDS)
+    frappe.conf.update(conf_overrides)
+    
+    keys = [svg_cache.get_cache_key(code, {}, conf_overrides["mermaid_version"]) for code in codes]
+    try:
+        # Wait for the workers to boot so the first cold export does not pay for it
+        render.render_svg(codes[0])
+        
+        cold = _export_all(codes)
+        warm = _export_all(codes)
+    finally:
+        _remove_entries(keys)
+        for field in ("hits", "misses", "evictions"):
+            counters.set_value(svg_cache.STATS_KEY, field, saved_stats[field])
+        
+        # Meant for a one-off `bench execute` process, whose pools are all ours
+        render_pool.close_all()
+        frappe.conf.update(saved_conf)
+    
+    results = {
+        "diagrams": len(codes),
+        "render_delay": float(render_delay),
+        "pool_size": int(pool_size),
+        "cold": cold,
+        "warm": warm,
+        "speedup": cold["total"] / warm["total"] if warm["total"] else 0
+    }
+    
+    print(format_results(results))
+    return results
+
+def get_diagram_codes(count, seed=42):
+    """Distinct flowcharts of 5 to 60 nodes, the same for the same seed"""
+    rng = random.Random(seed)
+    codes = []
+    
+    for i in range(count):
+        lines = [f"flowchart {rng.choice(['TD', 'LR'])}", f"    %% diagram {i}"]
+        nodes = rng.randint(5, 60)
+        for node in range(1, nodes):
+            parent = rng.randrange(node)
+            lines.append(f"    N{parent}[Step {parent}] --> N{node}[Step {node}]")
+        
+        codes.append("\n".join(lines))
+    
+    return codes
+
+def format_results(results):
+    lines = [
+        f"{results['diagrams']} diagrams, stub render {results['render_delay'] * 1000:.0f} ms, "
+        f"{results['pool_size']} workers"
+    ]
+    
+    for label in ("cold", "warm"):
+        timing = results[label]
+        lines.append(
+            f"{label}: total {timing['total']:.2f} s, p50 {timing['p50'] * 1000:.2f} ms, "
+            f"p95 {timing['p95'] * 1000:.2f} ms, cache hits {timing['hits']}/{results['diagrams']}"
+        )
+    
+    lines.append(f"warm exports are {results['speedup']:.0f}x faster")
+    return "\n".join(lines)
+
+def _export_all(codes):
+    """Export every diagram once, the way export_as_svg does"""
+    timings, hits = [], 0
+    
+    for code in codes:
+        start = time.perf_counter()
+        _svg, cached = render.get_svg(code)
+        timings.append(time.perf_counter() - start)
+        hits += cached
+    
+    timings.sort()
+    return {
+        "total": sum(timings),
+        "mean": statistics.mean(timings),
+        "p50": timings[len(timings) // 2],
+        "p95": timings[int(len(timings) * 0.95)],
+        "hits": hits
+    }
+
+def _remove_entries(keys):
+    for key in keys:
+        try:
+            os.unlink(svg_cache.get_cache_path(key))
+        except FileNotFoundError:
+            pass
+    
+    # Resyncs the byte counter with what is left on disk
+    svg_cache.evict()
@@ -0,0 +1,117 @@
+import frappe
+import difflib
+import random
+import statistics
+import time
+
+from mermaid_studio.mermaid_studio.utils import diff
+from mermaid_studio.mermaid_studio.utils.version_delta import apply_delta, make_delta, split_lines
+
+# Version diffs with the patience engine of utils/diff.py against difflib:
+#
+#   bench --site <site> execute mermaid_studio.mermaid_studio.benchmarks.version_diff.run \
+#       --kwargs "{'lines': 10000, 'changes': 200}"
+#
+# The input is a large flowchart made of a few repeating blocks, the case
+# where difflib's SequenceMatcher degrades, with `changes` lines inserted
+# and as many deleted. Each variant runs `repeat` times and the median is
+# reported; outputs are checked against the target before timing. For the
+# unified diffs the number of +/- lines is reported too: difflib's autojunk
+# keeps it fast on such input at the cost of much larger diffs.
+
+def run(lines=10000, changes=200, repeat=5, seed=42):
+    """Time unified diffs and version deltas of a large, repetitive flowchart"""
+    old, new = get_inputs(int(lines), int(changes), random.Random(seed))
+    old_lines, new_lines = split_lines(old), split_lines(new)
+    
+    _check(old, new, old_lines, new_lines)
+    
+    results = {
+        "lines": len(old_lines),
+        "changes": int(changes),
+        "timings": {
+            "difflib unified diff": _time(lambda: list(difflib.unified_diff(old_lines, new_lines)), repeat),
+            "patience unified diff": _time(lambda: list(diff.unified_diff(old_lines, new_lines)), repeat),
+            "difflib delta": _time(lambda: _difflib_delta(old_lines, new_lines), repeat),
+            "make_delta": _time(lambda: make_delta(old, new), repeat)
+        },
+        "changed_lines": {
+            "difflib unified diff": _count_changes(difflib.unified_diff(old_lines, new_lines)),
+            "patience unified diff": _count_changes(diff.unified_diff(old_lines, new_lines))
+        }
+    }
+    
+    print(format_results(results))
+    return results
+
+def get_inputs(lines, changes, rng):
+    """A flowchart of `lines` lines repeating a few blocks, and a copy with `changes` inserts and deletes"""
+    blocks = [
+        [f"    A{block}_{i} --> B{block}_{i % 5}\n" for i in range(10)]
+        for block in range(5)
+    ]
+    
+    old = ["flowchart TD\n"]
+    while len(old) < lines:
+        old.extend(rng.choice(blocks))
+    
+    new = list(old[:lines])
+    for position in rng.sample(range(1, len(new)), changes):
+        new[position] = None
+    
+    new = [line for line in new if line is not None]
+    for _change in range(changes):
+        new.insert(rng.randrange(1, len(new)), f"    X{rng.randrange(10 ** 6)} --> Y{rng.randrange(10 ** 6)}\n")
+    
+    return "".join(old[:lines]), "".join(new)
+
+def format_results(results):
+    lines = [f"{results['lines']} lines, {results['changes']} inserts and {results['changes']} deletes"]
+    for label, seconds in results["timings"].items():
+        line = f"{label}: {seconds * 1000:.1f} ms"
+        if label in results["changed_lines"]:
+            line += f", {results['changed_lines'][label]} +/- lines"
+        
+        lines.append(line)
+    
+    return "\n".join(lines)
+
+def _check(old, new, old_lines, new_lines):
+    """The engine's opcodes and deltas must rebuild the target exactly"""
+    rebuilt = []
+    for tag, i1, i2, j1, j2 in diff.get_opcodes(old_lines, new_lines):
+        if tag == "equal":
+            rebuilt.extend(old_lines[i1:i2])
+        else:
+            rebuilt.extend(new_lines[j1:j2])
+    
+    if rebuilt != new_lines or apply_delta(old, make_delta(old, new)) != new:
+        frappe.throw("The diff engine did not reproduce the target")
+
+def _difflib_delta(old_lines, new_lines):
+    """make_delta as it was before the patience engine, on difflib opcodes"""
+    ops = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False).get_opcodes():
+        if tag == "equal":
+            ops.append(i2 - i1)
+            continue
+        
+        if i2 > i1:
+            ops.append(i1 - i2)
+        
+        if j2 > j1:
+            ops.append(new_lines[j1:j2])
+    
+    return ops
+
+def _count_changes(unified_lines):
+    return sum(1 for line in list(unified_lines)[2:] if line[:1] in ("+", "-"))
+
+def _time(function, repeat):
+    timings = []
+    for _run in range(int(repeat)):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    
+    return statistics.median(timings)
@@ -0,0 +1,159 @@
+import frappe
+import json
+import random
+import statistics
+import time
+
+from mermaid_studio.mermaid_studio.doctype.diagram_version.diagram_version import (
+    get_snapshot_interval,
+    get_version_code,
+)
+from mermaid_studio.mermaid_studio.utils.version_delta import apply_delta, get_storage_fields
+
+# Storage and reconstruction cost of version history kept as snapshots plus
+# line deltas, against a full copy of the code per version:
+#
+#   bench --site <site> execute mermaid_studio.mermaid_studio.benchmarks.version_storage.run \
+#       --kwargs "{'edits': 2000, 'code_kb': 50}"
+#
+# The history of one diagram is simulated with a few changed lines per
+# save and stored the way DiagramVersion.compress stores it. Reconstruction
+# is timed in memory, and with `use_database` also through get_version_code
+# on Diagram Version rows that are rolled back afterwards.
+
+def run(edits=2000, code_kb=50, interval=None, samples=200, use_database=False, seed=42):
+    """Store `edits` saves of a `code_kb` KB diagram and report storage and reconstruction time"""
+    rng = random.Random(seed)
+    interval = int(interval or get_snapshot_interval())
+    codes = get_edit_history(int(edits), int(code_kb) * 1024, rng)
+    
+    rows = store_history(codes, interval)
+    sample = sorted(rng.sample(range(1, len(codes) + 1), min(int(samples), len(codes))))
+    
+    results = {
+        "versions": len(codes),
+        "interval": interval,
+        "full_bytes": sum(len(code) for code in codes),
+        "stored_bytes": sum(_stored_size(row) for row in rows),
+        "snapshots": sum(1 for row in rows if row["storage_type"] == "full"),
+        "in_memory": _time_reconstruction(sample, lambda number: rebuild(rows, number), codes)
+    }
+    
+    if use_database:
+        results["database"] = _time_database_reconstruction(rows, sample, codes)
+    
+    print(format_results(results))
+    return results
+
+def get_edit_history(edits, code_bytes, rng):
+    """Code of every saved version: a flowchart of about `code_bytes`, then small edits"""
+    lines = []
+    size = 0
+    while size < code_bytes:
+        line = _random_edge(rng, len(lines))
+        lines.append(line)
+        size += len(line)
+    
+    codes = ["flowchart TD\n" + "".join(lines)]
+    for _edit in range(edits - 1):
+        # Most saves change, add or remove a line or two
+        for _change in range(rng.randint(1, 3)):
+            position = rng.randrange(len(lines))
+            action = rng.random()
+            if action < 0.6:
+                lines[position] = _random_edge(rng, position)
+            elif action < 0.8:
+                lines.insert(position, _random_edge(rng, position))
+            elif len(lines) > 1:
+                del lines[position]
+        
+        codes.append("flowchart TD\n" + "".join(lines))
+    
+    return codes
+
+def store_history(codes, interval):
+    """Diagram Version field values of every version, as DiagramVersion.compress stores them"""
+    rows = []
+    base = None
+    for number, code in enumerate(codes, 1):
+        row = get_storage_fields(code, base, interval)
+        row["version_number"] = number
+        rows.append(row)
+        base = {"version_number": number, "chain_length": row["chain_length"], "code": code}
+    
+    return rows
+
+def rebuild(rows, version_number):
+    """Code of a version from its nearest snapshot, the way get_version_code rebuilds it"""
+    snapshot = version_number
+    while rows[snapshot - 1]["storage_type"] == "delta":
+        snapshot -= 1
+    
+    code = rows[snapshot - 1]["diagram_code"]
+    for row in rows[snapshot:version_number]:
+        code = apply_delta(code, row["delta"])
+    
+    return code
+
+def format_results(results):
+    lines = [
+        f"{results['versions']} versions, a snapshot at most every {results['interval']}",
+        f"full copies: {results['full_bytes'] / 1024 / 1024:.1f} MB",
+        f"snapshots + deltas: {results['stored_bytes'] / 1024 / 1024:.1f} MB "
+        f"({results['snapshots']} snapshots, "
+        f"{results['stored_bytes'] / results['full_bytes'] * 100:.1f}% of full copies)"
+    ]
+    
+    for label in ("in_memory", "database"):
+        if label in results:
+            timing = results[label]
+            lines.append(
+                f"reconstruction ({label.replace('_', ' ')}): p50 {timing['p50'] * 1000:.2f} ms, "
+                f"p95 {timing['p95'] * 1000:.2f} ms, max {timing['max'] * 1000:.2f} ms"
+            )
+    
+    return "\n".join(lines)
+
+def _time_reconstruction(sample, reconstruct, codes):
+    timings = []
+    for number in sample:
+        start = time.perf_counter()
+        code = reconstruct(number)
+        timings.append(time.perf_counter() - start)
+        
+        if code != codes[number - 1]:
+            frappe.throw(f"Version {number} was not rebuilt exactly")
+    
+    timings.sort()
+    return {
+        "p50": timings[len(timings) // 2],
+        "p95": timings[int(len(timings) * 0.95)],
+        "max": timings[-1],
+        "mean": statistics.mean(timings)
+    }
+
+def _time_database_reconstruction(rows, sample, codes):
+    """Time get_version_code on inserted rows of a made-up diagram, then roll them back"""
+    diagram = f"benchmark-{frappe.generate_hash(length=10)}"
+    
+    try:
+        for row in rows:
+            frappe.get_doc(dict(
+                row,
+                doctype="Diagram Version",
+                name=f"{diagram}-{row['version_number']}",
+                diagram=diagram
+            )).db_insert()
+        
+        return _time_reconstruction(sample, lambda number: get_version_code(diagram, number), codes)
+    finally:
+        frappe.db.rollback()
+
+def _stored_size(row):
+    if row["storage_type"] == "full":
+        return len(row["diagram_code"] or "")
+    
+    return len(row["delta"] if isinstance(row["delta"], str) else json.dumps(row["delta"]))
+
+def _random_edge(rng, i):
+    return f"    N{rng.randrange(i + 1)}[Step {rng.randrange(10 ** 6)}] --> N{i + 1}[Step {rng.randrange(10 ** 6)}]\n"
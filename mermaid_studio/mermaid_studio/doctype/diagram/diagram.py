@@ -3,6 +3,10 @@ from frappe.model.document import Document
 from frappe.utils import now_datetime
 import json
 
+from mermaid_studio.mermaid_studio.utils import coedit, patch_log, render_stats, search, version_coalescing
+from mermaid_studio.mermaid_studio.utils.access import clear_access_cache
+from mermaid_studio.mermaid_studio.utils.diagram_type import detect_diagram_type
+
 class Diagram(Document):
     def validate(self):
         # Set default values if not provided
@@ -14,81 +18,96 @@ class Diagram(Document):
         
         if not self.diagram_type and self.diagram_code:
             self.detect_diagram_type()
-        
-        self.last_rendered = now_datetime()
     
     def detect_diagram_type(self):
         """Auto-detect diagram type from code"""
-        code = self.diagram_code.strip().lower()
-        
-        if code.startswith("graph ") or code.startswith("flowchart "):
-            self.diagram_type = "flowchart"
-        elif code.startswith("sequencediagram"):
-            self.diagram_type = "sequence"
-        elif code.startswith("classdiagram"):
-            self.diagram_type = "class"
-        elif code.startswith("statediagram"):
-            self.diagram_type = "state"
-        elif code.startswith("gantt"):
-            self.diagram_type = "gantt"
-        elif code.startswith("pie"):
-            self.diagram_type = "pie"
-        else:
-            self.diagram_type = "other"
+        self.diagram_type = detect_diagram_type(self.diagram_code)
+    
+    def get_collaboration_setting(self, key, default=None):
+        """Value of a key in the collaboration_settings JSON"""
+        return get_collaboration_setting(self, key, default)
     
     def on_update(self):
         """Create version history when diagram is updated"""
-        if self.has_value_changed("diagram_code"):
-            self.version = self.version + 1
+        clear_diagram_meta(self.name)
+        
+        if self.has_value_changed("owner") or self.has_value_changed("is_public"):
+            clear_access_cache(self.name)
+        
+        if search.is_index_stale(self):
+            search.update_diagram_index(self)
+        
+        # Lets patches based on an earlier save be rebased onto this one
+        patch_log.record(self)
+        
+        if self.flags.skip_version_history:
+            return
+        
+        if not self.has_value_changed("diagram_code"):
+            return
+        
+        if not self.flags.from_coedit:
+            # Saved outside the co-editing session, which is now out of date
+            coedit.reset(self.name)
+        
+        # Every code change is a new version of the diagram, also when it is
+        # folded into a pending version rather than getting a row of its own
+        self.db_set("version", (self.version or 1) + 1, update_modified=False)
+        
+        previous = self.get_doc_before_save()
+        previous_code = previous.diagram_code if previous else None
+        window = version_coalescing.get_coalesce_window(self)
+        
+        if self.flags.checkpoint_version or not window:
+            # Keep pending work as its own version, then record this change
+            version_coalescing.flush_pending_version(self.name, code=previous_code)
             self.create_version_history()
+        else:
+            # Autosaves within the window are folded into one pending version
+            version_coalescing.record_change(self, window, previous_code)
     
-    def create_version_history(self):
-        """Create a new version record"""
-        frappe.get_doc({
+    def on_trash(self):
+        version_coalescing.discard_pending_version(self.name)
+        coedit.reset(self.name)
+        frappe.db.delete("Diagram Comment", {"diagram": self.name})
+        clear_access_cache(self.name)
+        clear_diagram_meta(self.name)
+        search.remove_diagram_index(self.name)
+        patch_log.clear(self.name)
+    
+    def create_version_history(self, code=None, user=None, change_notes=None, version_number=None):
+        """Create a new version record and return its name
+        
+        The record is numbered after the save whose code it holds: the
+        diagram's current version unless `version_number` is given.
+        """
+        version = version_number or frappe.db.get_value("Diagram", self.name, "version") or 1
+        
+        return frappe.get_doc({
             "doctype": "Diagram Version",
             "diagram": self.name,
-            "version_number": self.version,
-            "diagram_code": self.diagram_code,
-            "created_by": frappe.session.user,
+            "version_number": version,
+            "diagram_code": self.diagram_code if code is None else code,
+            "change_notes": change_notes,
+            "created_by": user or frappe.session.user,
             "created_on": now_datetime()
-        }).insert(ignore_permissions=True)
+        }).insert(ignore_permissions=True).name
     
     def generate_share_token(self):
         """Generate a unique token for sharing"""
-        import uuid
-        import hashlib
-        
-        unique_id = str(uuid.uuid4())
-        token = hashlib.md5(f"{self.name}{unique_id}".encode()).hexdigest()
-        
-        return token
+        return generate_share_token(self.name)
     
     def share_with_user(self, user_email, permission_level="read", expiry_days=None):
         """Share diagram with another user"""
-        expires_on = None
-        if expiry_days:
-            expires_on = frappe.utils.add_days(now_datetime(), expiry_days)
-        
-        share_token = self.generate_share_token()
-        
-        frappe.get_doc({
-            "doctype": "Diagram Share",
-            "diagram": self.name,
-            "shared_with": user_email,
-            "permission_level": permission_level,
-            "expires_on": expires_on,
-            "share_token": share_token
-        }).insert(ignore_permissions=True)
-        
-        return share_token
+        return create_share(self.name, user_email, permission_level, expiry_days)
         
     @frappe.whitelist()
     def generate_preview(self):
         """Generate a preview of the diagram"""
         try:
-            # Update last_rendered timestamp
-            self.last_rendered = now_datetime()
-            self.save()
+            # Buffered and written by a scheduled job; saving the diagram here
+            # would bump modified, run every hook and could create a version
+            render_stats.record_render(self.name)
             
             return {
                 "success": True,
@@ -101,4 +120,69 @@ class Diagram(Document):
             return {
                 "success": False,
                 "message": f"Error generating preview: {str(e)}"
-            } 
\ No newline at end of file
+            } 
+
+# Columns permission checks and list views need, without diagram_code,
+# the tags table or the other JSON settings
+META_FIELDS = ["name", "title", "owner", "is_public", "folder", "version", "modified", "collaboration_settings"]
+
+def on_doctype_update():
+    # Keyset paging of a user's diagrams and templates, by date or by title
+    frappe.db.add_index("Diagram", ["owner", "is_template", "modified"])
+    frappe.db.add_index("Diagram", ["owner", "is_template", "title"])
+
+def get_diagram_meta(diagram_name):
+    """Slim, per-request cached view of a diagram's metadata, or None if it does not exist"""
+    if not hasattr(frappe.local, "mermaid_diagram_meta"):
+        frappe.local.mermaid_diagram_meta = {}
+    
+    memo = frappe.local.mermaid_diagram_meta
+    if diagram_name not in memo:
+        memo[diagram_name] = frappe.db.get_value("Diagram", diagram_name, META_FIELDS, as_dict=True)
+    
+    return memo[diagram_name]
+
+def clear_diagram_meta(diagram_name):
+    if hasattr(frappe.local, "mermaid_diagram_meta"):
+        frappe.local.mermaid_diagram_meta.pop(diagram_name, None)
+
+def get_collaboration_setting(diagram, key, default=None):
+    """Value of a key in the collaboration_settings JSON of a diagram or its meta"""
+    settings = diagram.collaboration_settings
+    if isinstance(settings, str):
+        try:
+            settings = json.loads(settings)
+        except ValueError:
+            settings = None
+    
+    if isinstance(settings, dict) and settings.get(key) is not None:
+        return settings[key]
+    
+    return default
+
+def generate_share_token(diagram_name):
+    """Generate a unique token for sharing"""
+    import uuid
+    import hashlib
+    
+    unique_id = str(uuid.uuid4())
+    return hashlib.md5(f"{diagram_name}{unique_id}".encode()).hexdigest()
+
+def create_share(diagram_name, user_email, permission_level="read", expiry_days=None):
+    """Share a diagram with another user and return the share token"""
+    expires_on = None
+    if expiry_days:
+        expires_on = frappe.utils.add_days(now_datetime(), expiry_days)
+    
+    share_token = generate_share_token(diagram_name)
+    
+    frappe.get_doc({
+        "doctype": "Diagram Share",
+        "diagram": diagram_name,
+        "shared_with": user_email,
+        "permission_level": permission_level,
+        "expires_on": expires_on,
+        "share_token": share_token
+    }).insert(ignore_permissions=True)
+    
+    return share_token
@@ -0,0 +1,201 @@
+import frappe
+import hashlib
+import json
+from datetime import timedelta
+from frappe import _
+from frappe.model.document import Document
+from frappe.utils import get_datetime, now_datetime
+
+COMMENT_FIELDS = ["name", "owner", "creation", "modified", "content", "node_id", "has_position", "position_x", "position_y", "parent_comment"]
+
+# Per diagram: a token that changes with every comment change (the ETag
+# clients poll with) and the time of the last deletion, which incremental
+# loads cannot express
+ETAG_CACHE_KEY = "mermaid_comment_etags"
+DELETED_CACHE_KEY = "mermaid_comment_deleted"
+
+# Incremental loads start this many seconds before the previous load, so a
+# comment stamped in a transaction that was still open then is not skipped
+WATERMARK_OVERLAP = 60
+
+class DiagramComment(Document):
+    def validate(self):
+        self.validate_parent_comment()
+    
+    def validate_parent_comment(self):
+        """Replies belong to a thread on the same diagram and share its anchor"""
+        if not self.parent_comment:
+            return
+        
+        parent = frappe.db.get_value(
+            "Diagram Comment", self.parent_comment,
+            ["diagram", "parent_comment"],
+            as_dict=True
+        )
+        
+        if not parent or parent.diagram != self.diagram:
+            frappe.throw(_("Replies must belong to a comment on the same diagram"))
+        
+        # Threads are one level deep: a reply to a reply joins the thread
+        if parent.parent_comment:
+            self.parent_comment = parent.parent_comment
+        
+        self.node_id = None
+        self.has_position = 0
+        self.position_x = 0
+        self.position_y = 0
+    
+    def on_update(self):
+        touch_comments(self.diagram)
+    
+    def on_trash(self):
+        # Deleting a thread deletes its replies
+        frappe.db.delete("Diagram Comment", {"parent_comment": self.name})
+        touch_comments(self.diagram, deleted=True)
+
+def on_doctype_update():
+    frappe.db.add_index("Diagram Comment", ["diagram", "creation"])
+    frappe.db.add_index("Diagram Comment", ["diagram", "modified"])
+
+def touch_comments(diagram, deleted=False):
+    """Record a change to a diagram's comments once it is committed and tell its viewers"""
+    # Bumped before the commit, a reader could take the new etag with the
+    # old rows and then be told nothing changed
+    frappe.db.after_commit.add(lambda: _bump_comments_etag(diagram, deleted))
+    
+    frappe.publish_realtime(
+        "mermaid_comments",
+        {"diagram": diagram},
+        doctype="Diagram",
+        docname=diagram,
+        after_commit=True
+    )
+
+def _bump_comments_etag(diagram, deleted=False):
+    cache = frappe.cache()
+    cache.hset(ETAG_CACHE_KEY, diagram, frappe.generate_hash(length=12))
+    if deleted:
+        cache.hset(DELETED_CACHE_KEY, diagram, now_datetime())
+
+def get_comments_etag(diagram, query=None):
+    """Token identifying the current state of a diagram's comments as seen through a query
+    
+    `query` holds the parameters that select the comments (page, viewport,
+    node ids), so the same token is never valid for a different selection.
+    """
+    cache = frappe.cache()
+    etag = cache.hget(ETAG_CACHE_KEY, diagram)
+    if not etag:
+        # Evicted or never set; a new token makes every client reload once
+        etag = frappe.generate_hash(length=12)
+        cache.hset(ETAG_CACHE_KEY, diagram, etag)
+    
+    if not query:
+        return etag
+    
+    return hashlib.sha1(json.dumps([etag, query], sort_keys=True, default=str).encode()).hexdigest()[:12]
+
+def get_comments_watermark():
+    """Where the next incremental load starts, overlapping this one by WATERMARK_OVERLAP"""
+    return now_datetime() - timedelta(seconds=WATERMARK_OVERLAP)
+
+def has_deletions_since(diagram, since):
+    """Whether a comment of the diagram was deleted at or after `since`"""
+    deleted = frappe.cache().hget(DELETED_CACHE_KEY, diagram)
+    return bool(deleted) and deleted >= get_datetime(since)
+
+def get_comment_threads(diagram, limit=50, start=0, viewport=None, node_ids=None):
+    """Newest comment threads of a diagram with their replies
+    
+    `viewport` ({x, y, width, height}) and `node_ids` restrict anchored
+    threads to those positioned inside the viewport or attached to one of
+    the nodes; threads without an anchor are always returned.
+    """
+    conditions = ["diagram = %(diagram)s", "COALESCE(parent_comment, '') = ''"]
+    values = {"diagram": diagram, "limit": int(limit), "start": int(start)}
+    _add_anchor_conditions(conditions, values, viewport, node_ids)
+    
+    threads = frappe.db.sql(f"""
+        SELECT {', '.join(COMMENT_FIELDS)}
+        FROM `tabDiagram Comment`
+        WHERE {' AND '.join(conditions)}
+        ORDER BY creation DESC
+        LIMIT %(limit)s OFFSET %(start)s
+    """, values, as_dict=True)
+    
+    replies = {}
+    if threads:
+        for reply in frappe.get_all(
+            "Diagram Comment",
+            filters={"parent_comment": ["in", [thread.name for thread in threads]]},
+            fields=COMMENT_FIELDS,
+            order_by="creation asc"
+        ):
+            replies.setdefault(reply.parent_comment, []).append(format_comment(reply))
+    
+    result = []
+    for thread in threads:
+        thread = format_comment(thread)
+        thread["replies"] = replies.get(thread["name"], [])
+        result.append(thread)
+    
+    return result
+
+def get_changed_comments(diagram, since, viewport=None, node_ids=None):
+    """Threads and replies of a diagram created or edited at or after `since`, oldest first
+    
+    Replies are returned flat next to threads; their `parent_comment` says
+    which thread they belong to.
+    """
+    conditions = ["diagram = %(diagram)s", "modified >= %(since)s"]
+    values = {"diagram": diagram, "since": get_datetime(since)}
+    _add_anchor_conditions(conditions, values, viewport, node_ids)
+    
+    comments = frappe.db.sql(f"""
+        SELECT {', '.join(COMMENT_FIELDS)}
+        FROM `tabDiagram Comment`
+        WHERE {' AND '.join(conditions)}
+        ORDER BY modified ASC
+    """, values, as_dict=True)
+    
+    return [format_comment(comment) for comment in comments]
+
+def format_comment(comment):
+    """API representation of a Diagram Comment row"""
+    position = None
+    if comment.has_position:
+        position = {"x": comment.position_x, "y": comment.position_y}
+    
+    return {
+        "name": comment.name,
+        "owner": comment.owner,
+        "creation": comment.creation,
+        "modified": comment.modified,
+        "content": comment.content,
+        "node_id": comment.node_id,
+        "position": position,
+        "parent_comment": comment.parent_comment
+    }
+
+def _add_anchor_conditions(conditions, values, viewport, node_ids):
+    if not viewport and not node_ids:
+        return
+    
+    anchors = ["(COALESCE(node_id, '') = '' AND has_position = 0)"]
+    
+    if viewport:
+        anchors.append("""(has_position = 1
+            AND position_x BETWEEN %(min_x)s AND %(max_x)s
+            AND position_y BETWEEN %(min_y)s AND %(max_y)s)""")
+        values.update({
+            "min_x": float(viewport["x"]),
+            "max_x": float(viewport["x"]) + float(viewport["width"]),
+            "min_y": float(viewport["y"]),
+            "max_y": float(viewport["y"]) + float(viewport["height"])
+        })
+    
+    if node_ids:
+        anchors.append("node_id IN %(node_ids)s")
+        values["node_ids"] = tuple(node_ids)
+    
+    conditions.append(f"({' OR '.join(anchors)})")
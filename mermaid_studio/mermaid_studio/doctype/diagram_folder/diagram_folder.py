@@ -1,7 +1,17 @@
 import frappe
-from frappe.model.document import Document
+from frappe.utils.nestedset import NestedSet
 
-class DiagramFolder(Document):
+# Folders form a nested set: every folder's lft/rgt interval encloses the
+# intervals of all its descendants. Ancestors, descendants and recursive
+# counts are then single range queries on the (lft, rgt) index instead of
+# one query per level. NestedSet keeps the intervals up to date on insert,
+# move and delete.
+
+FOLDER_FIELDS = ["name", "folder_name", "parent_folder", "is_public", "owner"]
+
+class DiagramFolder(NestedSet):
+    nsm_parent_field = "parent_folder"
+    
     def validate(self):
         self.validate_parent_folder()
     
@@ -13,32 +23,51 @@ class DiagramFolder(Document):
         if self.parent_folder == self.name:
             frappe.throw("A folder cannot be its own parent")
         
-        # Check for circular references
-        parent = self.parent_folder
-        visited = set([self.name])
+        # A new folder has no descendants to move it under
+        if self.is_new() or not self.lft:
+            return
         
-        while parent:
-            if parent in visited:
-                frappe.throw("Circular reference detected in folder structure")
-            
-            visited.add(parent)
-            parent_doc = frappe.get_doc("Diagram Folder", parent)
-            parent = parent_doc.parent_folder
+        # The new parent must not lie inside this folder's interval
+        parent_lft = frappe.db.get_value("Diagram Folder", self.parent_folder, "lft")
+        if parent_lft and self.lft <= parent_lft < self.rgt:
+            frappe.throw("Circular reference detected in folder structure")
     
-    def get_diagrams(self):
-        """Get all diagrams in this folder"""
-        return frappe.get_all(
-            "Diagram",
-            filters={"folder": self.name},
-            fields=["name", "title", "diagram_type", "status", "is_public", "modified", "owner"]
-        )
+    def on_trash(self):
+        # Top level folders have no parent but may be deleted
+        super().on_trash(allow_root_deletion=True)
+    
+    def get_diagrams(self, recursive=False):
+        """Get all diagrams in this folder, or also in its subfolders"""
+        if not recursive:
+            return frappe.get_all(
+                "Diagram",
+                filters={"folder": self.name},
+                fields=["name", "title", "diagram_type", "status", "is_public", "modified", "owner"]
+            )
+        
+        return frappe.db.sql("""
+            SELECT diagram.name, diagram.title, diagram.diagram_type, diagram.status,
+                diagram.is_public, diagram.modified, diagram.owner, diagram.folder
+            FROM `tabDiagram` diagram
+            INNER JOIN `tabDiagram Folder` folder ON folder.name = diagram.folder
+            WHERE folder.lft >= %(lft)s AND folder.rgt <= %(rgt)s
+            ORDER BY diagram.modified DESC
+        """, {"lft": self.lft, "rgt": self.rgt}, as_dict=True)
     
-    def get_subfolders(self):
-        """Get all subfolders of this folder"""
+    def get_subfolders(self, recursive=False):
+        """Get all subfolders of this folder, or all its descendants in tree order"""
+        if not recursive:
+            return frappe.get_all(
+                "Diagram Folder",
+                filters={"parent_folder": self.name},
+                fields=["name", "folder_name", "is_public", "owner"]
+            )
+        
         return frappe.get_all(
             "Diagram Folder",
-            filters={"parent_folder": self.name},
-            fields=["name", "folder_name", "is_public", "owner"]
+            filters={"lft": [">", self.lft], "rgt": ["<", self.rgt]},
+            fields=FOLDER_FIELDS,
+            order_by="lft asc"
         )
     
     def move_diagrams_to_folder(self, target_folder):
@@ -52,4 +81,48 @@ class DiagramFolder(Document):
             WHERE folder = %s
         """, (target_folder, self.name))
         
-        return True 
\ No newline at end of file
+        return True
+
+def on_doctype_update():
+    frappe.db.add_index("Diagram Folder", ["lft", "rgt"])
+
+def get_breadcrumbs(folder):
+    """The folder and its ancestors, from the top level folder down"""
+    return frappe.db.sql(f"""
+        SELECT {', '.join(f'ancestor.{field}' for field in FOLDER_FIELDS)}
+        FROM `tabDiagram Folder` folder
+        INNER JOIN `tabDiagram Folder` ancestor
+            ON ancestor.lft <= folder.lft AND ancestor.rgt >= folder.rgt
+        WHERE folder.name = %(folder)s
+        ORDER BY ancestor.lft ASC
+    """, {"folder": folder}, as_dict=True)
+
+def get_folder_tree(user=None):
+    """All folders in tree order with their depth and recursive diagram counts
+    
+    Counts include the diagrams of every subfolder that `user` owns or
+    that are public.
+    """
+    folders = frappe.db.sql(f"""
+        SELECT {', '.join(f'folder.{field}' for field in FOLDER_FIELDS)}, folder.lft, folder.rgt,
+            COUNT(diagram.name) AS diagram_count
+        FROM `tabDiagram Folder` folder
+        INNER JOIN `tabDiagram Folder` descendant
+            ON descendant.lft >= folder.lft AND descendant.rgt <= folder.rgt
+        LEFT JOIN `tabDiagram` diagram
+            ON diagram.folder = descendant.name
+            AND (diagram.owner = %(user)s OR diagram.is_public = 1)
+        GROUP BY {', '.join(f'folder.{field}' for field in FOLDER_FIELDS)}, folder.lft, folder.rgt
+        ORDER BY folder.lft ASC
+    """, {"user": user or frappe.session.user}, as_dict=True)
+    
+    # Depth is the number of enclosing intervals still open at each folder
+    open_rgts = []
+    for folder in folders:
+        while open_rgts and open_rgts[-1] < folder.lft:
+            open_rgts.pop()
+        
+        folder.depth = len(open_rgts)
+        open_rgts.append(folder.rgt)
+    
+    return folders
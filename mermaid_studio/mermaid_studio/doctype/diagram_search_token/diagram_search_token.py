@@ -0,0 +1,11 @@
+import frappe
+from frappe.model.document import Document
+
+class DiagramSearchToken(Document):
+    pass
+
+def on_doctype_update():
+    # Prefix lookups by token, then the tokens of one diagram: searches
+    # filtered down to a few diagrams and per-diagram rebuilds
+    frappe.db.add_index("Diagram Search Token", ["token", "diagram", "weight"])
+    frappe.db.add_index("Diagram Search Token", ["diagram", "token", "weight"])
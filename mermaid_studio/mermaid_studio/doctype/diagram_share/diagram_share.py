@@ -3,7 +3,8 @@
 
 import frappe
 from frappe.model.document import Document
-from frappe.utils import now_datetime
+
+from mermaid_studio.mermaid_studio.utils.access import clear_access_cache, is_share_expired
 
 class DiagramShare(Document):
     def validate(self):
@@ -16,9 +17,17 @@ class DiagramShare(Document):
             frappe.throw(frappe._("Share token already exists"))
         
         # Validate expiry date
-        if self.expires_on and frappe.utils.getdate(self.expires_on) < frappe.utils.getdate():
+        if is_share_expired(self.expires_on):
             frappe.throw(frappe._("Expiry date cannot be in the past"))
     
+    def on_update(self):
+        clear_access_cache(self.diagram)
+        
+        # A share moved to another diagram
+        previous = self.get_doc_before_save()
+        if previous and previous.diagram != self.diagram:
+            clear_access_cache(previous.diagram)
+    
     def after_insert(self):
         # Log the sharing activity
         frappe.log_error(
@@ -27,6 +36,8 @@ class DiagramShare(Document):
         )
     
     def on_trash(self):
+        clear_access_cache(self.diagram)
+        
         # Log the deletion of share
         frappe.log_error(
             message=f"Share of diagram {self.diagram} with {self.shared_with} deleted by {frappe.session.user}",
@@ -35,7 +46,7 @@ class DiagramShare(Document):
     
     def validate_expiry(self):
         """Ensure expiry date is in the future"""
-        if self.expires_on and frappe.utils.getdate(self.expires_on) < frappe.utils.getdate(now_datetime()):
+        if is_share_expired(self.expires_on):
             frappe.throw("Expiry date must be in the future")
     
     def validate_share_token(self):
@@ -57,14 +68,14 @@ class DiagramShare(Document):
     
     def is_expired(self):
         """Check if share has expired"""
-        if not self.expires_on:
-            return False
-        
-        return frappe.utils.getdate(self.expires_on) < frappe.utils.getdate(now_datetime())
+        return is_share_expired(self.expires_on)
     
     def get_access_level(self):
         """Get access level for this share"""
         if self.is_expired():
             return None
         
-        return self.permission_level 
\ No newline at end of file
+        return self.permission_level 
+
+def on_doctype_update():
+    frappe.db.add_index("Diagram Share", ["diagram", "shared_with"])
@@ -1,7 +1,17 @@
 import frappe
 from frappe.model.document import Document
 
+from mermaid_studio.mermaid_studio.utils.diff import diff_versions
+from mermaid_studio.mermaid_studio.utils.version_delta import (
+    DEFAULT_SNAPSHOT_INTERVAL,
+    apply_delta,
+    get_storage_fields,
+)
+
 class DiagramVersion(Document):
+    def before_insert(self):
+        self.compress()
+    
     def validate(self):
         self.validate_version_number()
     
@@ -10,52 +20,159 @@ class DiagramVersion(Document):
         if not self.version_number or self.version_number < 1:
             self.version_number = 1
     
-    def get_diff(self, compare_version=None):
-        """Get diff between this version and another version"""
-        import difflib
+    def onload(self):
+        # Show the reconstructed code in the form for delta-stored versions
+        self.diagram_code = self.get_code()
+    
+    def compress(self):
+        """Store this version as a delta against the previous one when worthwhile"""
+        code = self.diagram_code or ""
+        self._code = code
+        
+        base = frappe.get_all(
+            "Diagram Version",
+            filters={
+                "diagram": self.diagram,
+                "version_number": ("<", self.version_number)
+            },
+            fields=["version_number", "chain_length"],
+            order_by="version_number desc",
+            limit=1
+        )
+        
+        if base:
+            base = base[0]
+            base.code = get_version_code(self.diagram, base.version_number)
+        
+        self.update(get_storage_fields(code, base or None, get_snapshot_interval()))
+    
+    def get_code(self):
+        """Full diagram code of this version"""
+        if getattr(self, "_code", None) is None:
+            if self.storage_type == "delta":
+                self._code = get_version_code(self.diagram, self.version_number)
+            else:
+                self._code = self.diagram_code or ""
         
+        return self._code
+    
+    def get_diff(self, compare_version=None, output_format="unified"):
+        """Get diff between this version and another version"""
         if not compare_version:
-            # Get previous version
-            versions = frappe.get_all(
-                "Diagram Version",
-                filters={
-                    "diagram": self.diagram,
-                    "version_number": ("!=", self.version_number)
-                },
-                fields=["name", "version_number", "diagram_code"],
-                order_by="version_number desc"
-            )
+            compare_version = get_previous_version(self.diagram, self.version_number)
             
-            if not versions:
+            if not compare_version:
                 return None
-            
-            compare_version = versions[0]
-        else:
-            compare_version = frappe.get_doc("Diagram Version", compare_version)
-        
-        # Generate diff
-        current_lines = self.diagram_code.splitlines()
-        compare_lines = compare_version.diagram_code.splitlines()
-        
-        diff = difflib.unified_diff(
-            compare_lines,
-            current_lines,
-            fromfile=f"v{compare_version.version_number}",
-            tofile=f"v{self.version_number}",
-            lineterm=""
-        )
         
-        return "\n".join(diff)
+        compare_version = frappe.get_doc("Diagram Version", compare_version)
+        
+        return diff_versions(self, compare_version, output_format)
     
     def restore_version(self):
         """Restore this version as the current version"""
         diagram = frappe.get_doc("Diagram", self.diagram)
+        code = self.get_code()
         
         # Only update if different
-        if diagram.diagram_code != self.diagram_code:
-            diagram.diagram_code = self.diagram_code
+        if diagram.diagram_code != code:
+            diagram.diagram_code = code
+            # A restore is a deliberate change, record it as its own version
+            diagram.flags.checkpoint_version = True
             diagram.save()
             
             return True
         
-        return False 
\ No newline at end of file
+        return False
+
+def on_doctype_update():
+    frappe.db.add_index("Diagram Version", ["diagram", "version_number"])
+
+def get_previous_version(diagram, version_number, fields="name"):
+    """The version of `diagram` right before `version_number`, or None"""
+    return _get_adjacent_version(diagram, ("<", version_number), "desc", fields)
+
+def get_next_version(diagram, version_number, fields="name"):
+    """The version of `diagram` right after `version_number`, or None"""
+    return _get_adjacent_version(diagram, (">", version_number), "asc", fields)
+
+def get_nth_version(diagram, n, fields="name"):
+    """The n-th version of `diagram` counting from 1, negative n counts from the latest"""
+    n = int(n)
+    if not n:
+        return None
+    
+    return _get_adjacent_version(
+        diagram, None, "asc" if n > 0 else "desc", fields, start=abs(n) - 1
+    )
+
+def _get_adjacent_version(diagram, version_filter, order, fields, start=0):
+    # One row over the (diagram, version_number) index, never the whole history
+    filters = {"diagram": diagram}
+    if version_filter:
+        filters["version_number"] = version_filter
+    
+    rows = frappe.get_all(
+        "Diagram Version",
+        filters=filters,
+        fields=fields if isinstance(fields, (list, tuple)) else [fields],
+        order_by=f"version_number {order}",
+        start=start,
+        limit=1
+    )
+    
+    if not rows:
+        return None
+    
+    return rows[0] if isinstance(fields, (list, tuple)) else rows[0][fields]
+
+def get_snapshot_interval():
+    """Maximum number of deltas between two full snapshots"""
+    return int(frappe.conf.get("mermaid_version_snapshot_interval") or DEFAULT_SNAPSHOT_INTERVAL)
+
+def get_version_code(diagram, version_number):
+    """Reconstruct the code of a version from its nearest full snapshot
+    
+    Needs at most two queries and `mermaid_version_snapshot_interval` delta
+    applications regardless of how long the history is.
+    """
+    snapshot = frappe.get_all(
+        "Diagram Version",
+        filters={
+            "diagram": diagram,
+            "version_number": ("<=", version_number),
+            "storage_type": ("!=", "delta")
+        },
+        fields=["version_number", "diagram_code"],
+        order_by="version_number desc",
+        limit=1
+    )
+    
+    if not snapshot:
+        frappe.throw(frappe._("No snapshot found for version {0} of {1}").format(version_number, diagram))
+    
+    snapshot = snapshot[0]
+    code = snapshot.diagram_code or ""
+    
+    if snapshot.version_number == version_number:
+        return code
+    
+    deltas = frappe.get_all(
+        "Diagram Version",
+        filters={
+            "diagram": diagram,
+            "version_number": ("between", [snapshot.version_number + 1, version_number])
+        },
+        fields=["version_number", "base_version", "delta"],
+        order_by="version_number asc"
+    )
+    
+    current_version = snapshot.version_number
+    for row in deltas:
+        if row.base_version != current_version:
+            frappe.throw(frappe._("Version history of {0} is broken at version {1}").format(
+                diagram, row.version_number))
+        
+        code = apply_delta(code, row.delta)
+        current_version = row.version_number
+    
+    return code
@@ -0,0 +1,132 @@
+import frappe
+from frappe import _
+from frappe.utils import get_datetime, now_datetime
+
+# A user's effective permission on a diagram comes from ownership, the
+# is_public flag and their unexpired Diagram Share rows; Administrator may
+# do anything. It is resolved in one indexed query, memoized for the
+# request and cached in a Redis hash per diagram (user -> permission). The
+# hash is dropped whenever a share of the diagram changes or the diagram's
+# owner or visibility changes, and again once that change is committed: a
+# request that read the old rows in the meantime may have cached them
+# again. The hash also expires on its own, so anything that still slips
+# through lapses after a while.
+
+ACCESS_CACHE_KEY = "mermaid_diagram_access:{0}"
+ACCESS_CACHE_TTL = 10 * 60
+
+# Each level includes the ones before it
+PERMISSION_LEVELS = ("read", "write", "admin", "owner")
+
+def get_permission(diagram_name, user=None):
+    """The user's permission on a diagram: "owner", "admin", "write", "read" or None"""
+    user = user or frappe.session.user
+    
+    if not hasattr(frappe.local, "mermaid_diagram_access"):
+        frappe.local.mermaid_diagram_access = {}
+    
+    memo = frappe.local.mermaid_diagram_access
+    if (diagram_name, user) not in memo:
+        memo[(diagram_name, user)] = _get_cached_permission(diagram_name, user)
+    
+    return memo[(diagram_name, user)]
+
+def has_permission(diagram_name, level="read", user=None):
+    """Whether the user has at least `level` on a diagram"""
+    permission = get_permission(diagram_name, user)
+    if not permission:
+        return False
+    
+    return PERMISSION_LEVELS.index(permission) >= PERMISSION_LEVELS.index(level)
+
+def check_permission(diagram_name, level="read", message=None):
+    """Throw unless the session user has at least `level` on a diagram"""
+    if not has_permission(diagram_name, level):
+        frappe.throw(
+            message or _("You don't have permission to access this diagram"),
+            frappe.PermissionError
+        )
+
+def is_share_expired(expires_on):
+    """Whether a share has lapsed; shares end at the exact time of their expires_on"""
+    return bool(expires_on) and get_datetime(expires_on) <= now_datetime()
+
+def get_token_share(share_token):
+    """The diagram and permission level of a share link, throwing if it is unknown or expired"""
+    share = frappe.db.get_value(
+        "Diagram Share",
+        {"share_token": share_token},
+        ["diagram", "permission_level", "expires_on"],
+        as_dict=True
+    )
+    
+    if not share:
+        frappe.throw(_("Invalid share token"))
+    
+    if is_share_expired(share.expires_on):
+        frappe.throw(_("This share link has expired"))
+    
+    return share
+
+def clear_access_cache(diagram_name):
+    """Forget cached permissions on a diagram, now and after the transaction commits"""
+    _clear_access_cache(diagram_name)
+    frappe.db.after_commit.add(lambda: _clear_access_cache(diagram_name))
+
+def _clear_access_cache(diagram_name):
+    frappe.cache().delete_value(ACCESS_CACHE_KEY.format(diagram_name))
+    
+    if hasattr(frappe.local, "mermaid_diagram_access"):
+        for key in [key for key in frappe.local.mermaid_diagram_access if key[0] == diagram_name]:
+            del frappe.local.mermaid_diagram_access[key]
+
+def _get_cached_permission(diagram_name, user):
+    cache = frappe.cache()
+    cached = cache.hget(ACCESS_CACHE_KEY.format(diagram_name), user)
+    
+    # The share the permission came from may have expired since
+    if cached and not is_share_expired(cached["expires_on"]):
+        return cached["permission"]
+    
+    permission, expires_on = _resolve_permission(diagram_name, user)
+    cache.hset(ACCESS_CACHE_KEY.format(diagram_name), user, {
+        "permission": permission,
+        "expires_on": expires_on
+    })
+    cache.expire(cache.make_key(ACCESS_CACHE_KEY.format(diagram_name)), ACCESS_CACHE_TTL)
+    
+    return permission
+
+def _resolve_permission(diagram_name, user):
+    """(permission, expires_on) from the database; expires_on is when it lapses"""
+    now = now_datetime()
+    rows = frappe.db.sql("""
+        SELECT diagram.owner, diagram.is_public, share.permission_level, share.expires_on
+        FROM `tabDiagram` diagram
+        LEFT JOIN `tabDiagram Share` share
+            ON share.diagram = diagram.name
+            AND share.shared_with = %(user)s
+            AND (share.expires_on IS NULL OR share.expires_on > %(now)s)
+        WHERE diagram.name = %(diagram)s
+    """, {"diagram": diagram_name, "user": user, "now": now}, as_dict=True)
+    
+    if not rows:
+        return None, None
+    
+    if rows[0].owner == user or user == "Administrator":
+        return "owner", None
+    
+    permission = None
+    expires_on = None
+    for row in rows:
+        if row.permission_level not in PERMISSION_LEVELS:
+            continue
+        
+        if not permission or PERMISSION_LEVELS.index(row.permission_level) > PERMISSION_LEVELS.index(permission):
+            permission = row.permission_level
+            expires_on = get_datetime(row.expires_on) if row.expires_on else None
+    
+    if rows[0].is_public and not permission:
+        return "read", None
+    
+    return permission, expires_on
@@ -0,0 +1,137 @@
+import frappe
+import os
+import re
+import zipfile
+from frappe import _
+
+from mermaid_studio.mermaid_studio.utils import job_status
+from mermaid_studio.mermaid_studio.utils.access import has_permission
+from mermaid_studio.mermaid_studio.utils.exporters import EXPORTERS, ExportWriter, get_export_file_name
+
+# Publishing progress after every diagram would flood the realtime channel
+# on large exports, so progress is reported in steps of this many diagrams
+PROGRESS_STEP = 10
+
+def get_readable_diagrams(diagram_names=None, folder=None):
+    """Names of the requested diagrams the current user is allowed to read
+    
+    A `folder` includes the diagrams of all its subfolders.
+    """
+    filters = {}
+    if folder:
+        filters["folder"] = ["in", get_folder_and_descendants(folder)]
+    if diagram_names:
+        filters["name"] = ["in", diagram_names]
+    
+    names = frappe.get_all("Diagram", filters=filters, pluck="name", order_by="title asc")
+    
+    # The central resolver also drops shares that have expired
+    return [name for name in names if has_permission(name, "read")]
+
+def get_folder_and_descendants(folder):
+    """Names of `folder` and every folder below it, from its nested set interval"""
+    lft, rgt = frappe.db.get_value("Diagram Folder", folder, ["lft", "rgt"]) or (None, None)
+    if lft is None:
+        frappe.throw(_("Folder {0} not found").format(folder), frappe.DoesNotExistError)
+    
+    return frappe.get_all(
+        "Diagram Folder",
+        filters={"lft": [">=", lft], "rgt": ["<=", rgt]},
+        pluck="name"
+    )
+
+def enqueue_export(diagram_names, export_format="mmd", archive_name=None):
+    """Queue a zip export of `diagram_names` and return the job id"""
+    if export_format not in EXPORTERS:
+        frappe.throw(_("Unsupported export format: {0}").format(export_format))
+    
+    if not diagram_names:
+        frappe.throw(_("No diagrams to export"))
+    
+    export_id = job_status.create_job("export", total=len(diagram_names))
+    
+    frappe.enqueue(
+        "mermaid_studio.mermaid_studio.utils.bulk_export.run_export",
+        queue="long",
+        timeout=60 * 60,
+        export_id=export_id,
+        diagram_names=diagram_names,
+        export_format=export_format,
+        archive_name=archive_name or "diagrams"
+    )
+    
+    return export_id
+
+def run_export(export_id, diagram_names, export_format="mmd", archive_name="diagrams"):
+    """Background job: write every diagram into a single zip archive"""
+    job_status.update_job(export_id, status="running")
+    
+    exporter = EXPORTERS[export_format]
+    file_name = f"{frappe.scrub(archive_name)}_{export_format}_{export_id}.zip"
+    file_path = frappe.get_site_path("private", "files", file_name)
+    
+    errors = []
+    used_names = set()
+    bytes_written = 0
+    
+    try:
+        # Each diagram is rendered on its own and written to the archive only
+        # once it succeeded, so a failed export leaves no empty entry behind
+        # and memory use does not grow with the size of the export
+        with zipfile.ZipFile(file_path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            for processed, name in enumerate(diagram_names, start=1):
+                try:
+                    diagram = frappe.get_doc("Diagram", name)
+                    writer = ExportWriter()
+                    exporter(diagram, writer)
+                    
+                    entry_name = _unique_entry_name(get_export_file_name(diagram, export_format), used_names)
+                    archive.writestr(entry_name, writer.getvalue())
+                    bytes_written += writer.bytes_written
+                except Exception as e:
+                    errors.append({"diagram": name, "error": str(e)})
+                
+                if processed % PROGRESS_STEP == 0 or processed == len(diagram_names):
+                    job_status.update_job(
+                        export_id, processed=processed, errors=errors, bytes_written=bytes_written
+                    )
+        
+        file_doc = frappe.get_doc({
+            "doctype": "File",
+            "file_name": file_name,
+            "file_url": f"/private/files/{file_name}",
+            "file_size": os.path.getsize(file_path),
+            "is_private": 1
+        })
+        file_doc.insert(ignore_permissions=True)
+        frappe.db.commit()
+        
+        job_status.update_job(
+            export_id,
+            status="completed",
+            processed=len(diagram_names),
+            errors=errors,
+            bytes_written=bytes_written,
+            file_url=file_doc.file_url,
+            file_name=file_name
+        )
+    except Exception as e:
+        frappe.log_error(f"Error exporting diagrams: {str(e)}", "Diagram Export Error")
+        job_status.update_job(export_id, status="failed", errors=[*errors, {"error": str(e)}])
+        
+        if os.path.exists(file_path):
+            os.unlink(file_path)
+
+def _unique_entry_name(file_name, used_names):
+    """Archive entry name that is safe as a path and unique within the archive"""
+    file_name = re.sub(r'[\\/:*?"<>|]+', "_", file_name)
+    base, extension = os.path.splitext(file_name)
+    
+    candidate = file_name
+    counter = 1
+    while candidate in used_names:
+        counter += 1
+        candidate = f"{base}_{counter}{extension}"
+    
+    used_names.add(candidate)
+    return candidate
@@ -0,0 +1,187 @@
+import frappe
+import json
+import os
+import zipfile
+from frappe import _
+
+from mermaid_studio.mermaid_studio.utils import job_status
+
+BATCH_SIZE = 100
+MAX_ENTRY_BYTES = 5 * 1024 * 1024
+MAX_REPORTED_ERRORS = 500
+
+MMD_EXTENSIONS = (".mmd", ".mermaid")
+JSON_EXTENSIONS = (".json",)
+
+def get_source_files(file_url=None, file_names=None, file_folder=None):
+    """File records to import from: an uploaded archive, a list of files or a File folder"""
+    filters = {"is_folder": 0}
+    
+    if file_url:
+        filters["file_url"] = file_url
+    elif file_names:
+        filters["name"] = ["in", file_names]
+    elif file_folder:
+        filters["folder"] = file_folder
+    else:
+        frappe.throw(_("Provide an archive, a list of files or a folder to import from"))
+    
+    files = frappe.get_all("File", filters=filters, fields=["name", "file_name"], order_by="file_name asc")
+    if not files:
+        frappe.throw(_("No files found to import"))
+    
+    for f in files:
+        frappe.get_doc("File", f.name).check_permission("read")
+    
+    return [f.name for f in files]
+
+def enqueue_import(source_files, folder=None, is_public=0):
+    """Queue an import of `source_files` and return the job id"""
+    import_id = job_status.create_job("import")
+    
+    frappe.enqueue(
+        "mermaid_studio.mermaid_studio.utils.bulk_import.run_import",
+        queue="long",
+        timeout=4 * 60 * 60,
+        import_id=import_id,
+        source_files=source_files,
+        folder=folder,
+        is_public=is_public
+    )
+    
+    return import_id
+
+def iter_entries(source_files):
+    """Yield (entry_name, read) for each diagram file, opening zip archives lazily
+    
+    Archives are read through their central directory and each member is
+    decompressed only when it is imported, so the whole archive is never
+    loaded into memory.
+    """
+    for file_name in source_files:
+        path = frappe.get_doc("File", file_name).get_full_path()
+        
+        if zipfile.is_zipfile(path):
+            with zipfile.ZipFile(path) as archive:
+                for info in archive.infolist():
+                    if info.is_dir() or _is_hidden(info.filename):
+                        continue
+                    
+                    if info.file_size > MAX_ENTRY_BYTES:
+                        yield info.filename, _too_large
+                        continue
+                    
+                    yield info.filename, lambda info=info, archive=archive: archive.read(info)
+        else:
+            yield os.path.basename(path), lambda path=path: _read_file(path)
+
+def parse_entry(entry_name, content):
+    """Turn a file's content into Diagram field values, detecting its format"""
+    text = content.decode("utf-8-sig") if isinstance(content, bytes) else content
+    extension = os.path.splitext(entry_name)[1].lower()
+    
+    if extension in JSON_EXTENSIONS or (extension not in MMD_EXTENSIONS and text.lstrip().startswith("{")):
+        data = json.loads(text)
+        if not data.get("diagram_code"):
+            raise ValueError(_("JSON file has no diagram_code"))
+        
+        return {
+            "title": data.get("title") or _title_from_name(entry_name),
+            "description": data.get("description"),
+            "diagram_code": data.get("diagram_code"),
+            "diagram_type": data.get("diagram_type"),
+            "tags": data.get("tags") or []
+        }
+    
+    if not text.strip():
+        raise ValueError(_("File is empty"))
+    
+    return {
+        "title": _title_from_name(entry_name),
+        "diagram_code": text,
+        "tags": []
+    }
+
+def run_import(import_id, source_files, folder=None, is_public=0):
+    """Background job: create a diagram per file, committing in batches"""
+    job_status.update_job(import_id, status="running")
+    
+    created = 0
+    processed = 0
+    errors = []
+    
+    try:
+        for entry_name, read in iter_entries(source_files):
+            processed += 1
+            frappe.db.savepoint("mermaid_import")
+            
+            try:
+                values = parse_entry(entry_name, read())
+                insert_diagram(values, folder, is_public)
+                created += 1
+            except Exception as e:
+                frappe.db.rollback(save_point="mermaid_import")
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append({"file": entry_name, "error": str(e)})
+            
+            if processed % BATCH_SIZE == 0:
+                frappe.db.commit()
+                job_status.update_job(import_id, processed=processed, created=created, errors=errors)
+        
+        frappe.db.commit()
+        job_status.update_job(
+            import_id,
+            status="completed",
+            total=processed,
+            processed=processed,
+            created=created,
+            failed=processed - created,
+            errors=errors
+        )
+    except Exception as e:
+        frappe.db.rollback()
+        frappe.log_error(f"Error importing diagrams: {str(e)}", "Diagram Import Error")
+        job_status.update_job(
+            import_id,
+            status="failed",
+            processed=processed,
+            created=created,
+            errors=[*errors, {"error": str(e)}]
+        )
+
+def insert_diagram(values, folder=None, is_public=0):
+    """Insert an imported diagram without per-diagram version history"""
+    diagram = frappe.new_doc("Diagram")
+    diagram.title = values["title"]
+    diagram.description = values.get("description")
+    diagram.diagram_code = values["diagram_code"]
+    diagram.diagram_type = values.get("diagram_type")
+    diagram.folder = folder
+    diagram.is_public = is_public
+    diagram.owner = frappe.session.user
+    diagram.created_by = frappe.session.user
+    
+    for tag in values.get("tags") or []:
+        diagram.append("tags", {"tag": tag})
+    
+    # The imported code is the first version; there is no history to record
+    diagram.flags.skip_version_history = True
+    diagram.insert()
+    
+    return diagram
+
+def _read_file(path):
+    if os.path.getsize(path) > MAX_ENTRY_BYTES:
+        _too_large()
+    
+    with open(path, "rb") as f:
+        return f.read()
+
+def _too_large():
+    raise ValueError(_("File is larger than {0} MB").format(MAX_ENTRY_BYTES // (1024 * 1024)))
+
+def _is_hidden(entry_name):
+    return any(part.startswith((".", "__MACOSX")) for part in entry_name.split("/"))
+
+def _title_from_name(entry_name):
+    return os.path.splitext(os.path.basename(entry_name))[0].replace("_", " ")
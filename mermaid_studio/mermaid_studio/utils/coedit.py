@@ -0,0 +1,179 @@
+import frappe
+import json
+import time
+
+from mermaid_studio.mermaid_studio.utils import ot
+
+# Concurrent editing of diagram_code. While a diagram is being co-edited its
+# current code lives in a Redis session together with a log of the latest
+# operations. Clients send small text operations against the revision they
+# have seen; the server transforms them over everything committed since,
+# applies them, broadcasts the result over realtime and marks the session
+# dirty. A scheduler job writes dirty sessions back through Diagram.save so
+# validation, version history and hooks behave as for any other save.
+
+STATE_KEY = "mermaid_coedit:{0}"
+LOG_KEY = "mermaid_coedit_log:{0}"
+LOCK_KEY = "mermaid_coedit_lock:{0}"
+DIRTY_INDEX_KEY = "mermaid_coedit_dirty"
+
+# Operations kept for transforming late submissions; clients further behind
+# reload the document instead
+MAX_LOG_LENGTH = 500
+SESSION_TTL = 24 * 60 * 60
+LOCK_TIMEOUT = 10
+
+class ResyncRequired(Exception):
+    """Raised when a client's revision is unknown and it must reload the document"""
+
+def is_enabled(diagram):
+    """Whether a diagram (document or meta) is edited concurrently instead of under an exclusive lock"""
+    from mermaid_studio.mermaid_studio.doctype.diagram.diagram import get_collaboration_setting
+    
+    enabled = get_collaboration_setting(diagram, "co_editing")
+    if enabled is None:
+        enabled = frappe.conf.get("mermaid_co_editing", 1)
+    
+    return bool(int(enabled))
+
+def join(diagram_name):
+    """Current {revision, code} of a diagram's session, starting it if needed"""
+    cache = frappe.cache()
+    state = _get_state(diagram_name)
+    
+    if not state:
+        code = frappe.db.get_value("Diagram", diagram_name, "diagram_code") or ""
+        state = {
+            "revision": 0,
+            "log_start": 0,
+            "persisted_revision": 0,
+            "code": code,
+            "last_user": None
+        }
+        
+        # Another worker may have started the session in the meantime
+        if not cache.set(_key(STATE_KEY, diagram_name), json.dumps(state), ex=SESSION_TTL, nx=True):
+            state = _get_state(diagram_name)
+    
+    return {"revision": state["revision"], "code": state["code"]}
+
+def submit(diagram_name, revision, operation, client_id=None):
+    """Apply a client operation made against `revision`
+    
+    Returns {revision, operation} with the operation as it was applied after
+    transforming it over concurrent operations.
+    """
+    cache = frappe.cache()
+    user = frappe.session.user
+    revision = int(revision)
+    operation = ot.normalize(operation)
+    
+    with cache.lock(_key(LOCK_KEY, diagram_name), timeout=LOCK_TIMEOUT, blocking_timeout=LOCK_TIMEOUT):
+        state = _get_state(diagram_name)
+        if not state or not state["log_start"] <= revision <= state["revision"]:
+            raise ResyncRequired
+        
+        # Operations committed since the client's revision, oldest first.
+        # RedisWrapper.lrange adds the site prefix itself.
+        for entry in cache.lrange(LOG_KEY.format(diagram_name), revision - state["log_start"], -1):
+            _committed, operation = ot.transform(json.loads(entry)["operation"], operation)
+        
+        state["code"] = ot.apply(state["code"], operation)
+        state["revision"] += 1
+        state["last_user"] = user
+        
+        entry = {"operation": operation, "user": user, "client_id": client_id}
+        log_length = state["revision"] - state["log_start"]
+        if log_length > MAX_LOG_LENGTH:
+            state["log_start"] += log_length - MAX_LOG_LENGTH
+        
+        pipeline = cache.pipeline()
+        pipeline.set(_key(STATE_KEY, diagram_name), json.dumps(state), ex=SESSION_TTL)
+        pipeline.rpush(_key(LOG_KEY, diagram_name), json.dumps(entry))
+        pipeline.ltrim(_key(LOG_KEY, diagram_name), -MAX_LOG_LENGTH, -1)
+        pipeline.expire(_key(LOG_KEY, diagram_name), SESSION_TTL)
+        pipeline.zadd(_key(DIRTY_INDEX_KEY), {diagram_name: time.time()}, nx=True)
+        pipeline.execute()
+    
+    frappe.publish_realtime(
+        "mermaid_coedit_op",
+        dict(entry, diagram=diagram_name, revision=state["revision"]),
+        doctype="Diagram",
+        docname=diagram_name,
+        after_commit=False
+    )
+    
+    return {"revision": state["revision"], "operation": operation}
+
+def persist(diagram_name):
+    """Save the session's code to the Diagram if it has unsaved operations"""
+    cache = frappe.cache()
+    
+    with cache.lock(_key(LOCK_KEY, diagram_name), timeout=LOCK_TIMEOUT, blocking_timeout=LOCK_TIMEOUT):
+        state = _get_state(diagram_name)
+        if not state or state["revision"] == state["persisted_revision"]:
+            cache.zrem(_key(DIRTY_INDEX_KEY), diagram_name)
+            return False
+        
+        diagram = frappe.get_doc("Diagram", diagram_name)
+        if diagram.diagram_code != state["code"]:
+            diagram.diagram_code = state["code"]
+            diagram.flags.from_coedit = True
+            diagram.save(ignore_permissions=True)
+        
+        state["persisted_revision"] = state["revision"]
+        cache.set(_key(STATE_KEY, diagram_name), json.dumps(state), ex=SESSION_TTL)
+        cache.zrem(_key(DIRTY_INDEX_KEY), diagram_name)
+    
+    return True
+
+def persist_dirty_sessions():
+    """Persist every session with unsaved operations, as the user who made the last one"""
+    cache = frappe.cache()
+    session_user = frappe.session.user
+    
+    for diagram_name in cache.zrangebyscore(_key(DIRTY_INDEX_KEY), "-inf", "+inf"):
+        diagram_name = diagram_name.decode() if isinstance(diagram_name, bytes) else diagram_name
+        
+        try:
+            state = _get_state(diagram_name)
+            if not state or not frappe.db.exists("Diagram", diagram_name):
+                cache.zrem(_key(DIRTY_INDEX_KEY), diagram_name)
+                continue
+            
+            frappe.set_user(state["last_user"] or session_user)
+            persist(diagram_name)
+            frappe.db.commit()
+        except Exception as e:
+            frappe.db.rollback()
+            frappe.log_error(f"Error saving co-editing session of {diagram_name}: {str(e)}", "Diagram Co-editing Error")
+        finally:
+            frappe.set_user(session_user)
+
+def reset(diagram_name):
+    """Drop a session after the diagram was changed outside of it
+    
+    Connected editors are told to reload, unsaved operations are lost.
+    """
+    cache = frappe.cache()
+    # RedisWrapper.exists adds the site prefix itself
+    if not cache.exists(STATE_KEY.format(diagram_name)):
+        return
+    
+    cache.delete(_key(STATE_KEY, diagram_name), _key(LOG_KEY, diagram_name))
+    cache.zrem(_key(DIRTY_INDEX_KEY), diagram_name)
+    
+    frappe.publish_realtime(
+        "mermaid_coedit_reset",
+        {"diagram": diagram_name},
+        doctype="Diagram",
+        docname=diagram_name,
+        after_commit=True
+    )
+
+def _get_state(diagram_name):
+    value = frappe.cache().get(_key(STATE_KEY, diagram_name))
+    return json.loads(value) if value else None
+
+def _key(key, *args):
+    return frappe.cache().make_key(key.format(*args))
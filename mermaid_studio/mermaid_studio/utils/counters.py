@@ -0,0 +1,28 @@
+import frappe
+
+# Counters live in plain Redis string keys rather than going through the
+# pickling helpers of frappe.cache() so that INCRBY stays atomic across workers
+
+def incr(name, field, amount=1):
+    """Atomically add `amount` to a counter and return the new value"""
+    cache = frappe.cache()
+    return cache.incrby(_key(name, field), amount)
+
+def set_value(name, field, value):
+    """Overwrite a counter"""
+    cache = frappe.cache()
+    cache.set(_key(name, field), int(value))
+
+def get_values(name, fields):
+    """Return a dict of the current values of the given counters"""
+    cache = frappe.cache()
+    values = cache.mget([_key(name, field) for field in fields])
+    return {field: int(value or 0) for field, value in zip(fields, values)}
+
+def reset(name, fields):
+    """Delete the given counters"""
+    cache = frappe.cache()
+    cache.delete(*[_key(name, field) for field in fields])
+
+def _key(name, field):
+    return frappe.cache().make_key(f"{name}:{field}")
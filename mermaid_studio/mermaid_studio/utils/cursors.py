@@ -0,0 +1,74 @@
+import frappe
+import time
+
+# Cursor positions are pushed to everyone viewing a diagram over Frappe
+# realtime (the Diagram document room) instead of being polled. Each user
+# may publish at most one update per throttle interval; updates in between
+# only overwrite the user's latest position, which is what late joiners read.
+
+CURSORS_KEY = "mermaid_cursors:{0}"
+THROTTLE_KEY = "mermaid_cursor_throttle:{0}:{1}"
+DEFAULT_THROTTLE_MS = 100
+
+# Positions older than this are no longer shown
+CURSOR_TIMEOUT = 60
+
+def get_throttle_ms():
+    """Minimum milliseconds between two published updates of one user"""
+    return int(frappe.conf.get("mermaid_cursor_throttle_ms") or DEFAULT_THROTTLE_MS)
+
+def update_cursor(diagram_name, position, profile=None):
+    """Store the session user's cursor and publish it unless throttled
+    
+    `profile` (full name, image, colour) is sent along so receivers need no
+    lookups. Returns True when the update was published. Throttled updates are still
+    stored so the latest position is never lost; the client resends its
+    final position once the interval has passed.
+    """
+    user = frappe.session.user
+    cursor = dict(profile or {}, user=user, position=position, timestamp=time.time())
+    
+    cache = frappe.cache()
+    cache.hset(CURSORS_KEY.format(diagram_name), user, cursor)
+    cache.expire(cache.make_key(CURSORS_KEY.format(diagram_name)), CURSOR_TIMEOUT)
+    
+    # SET NX PX: only the first update in each interval gets the slot
+    if not cache.set(_key(THROTTLE_KEY.format(diagram_name, user)), 1, px=get_throttle_ms(), nx=True):
+        return False
+    
+    frappe.publish_realtime(
+        "mermaid_cursor",
+        dict(cursor, diagram=diagram_name),
+        doctype="Diagram",
+        docname=diagram_name,
+        after_commit=False
+    )
+    
+    return True
+
+def remove_cursor(diagram_name, user=None):
+    """Forget a user's cursor and tell the others it is gone"""
+    user = user or frappe.session.user
+    frappe.cache().hdel(CURSORS_KEY.format(diagram_name), user)
+    
+    frappe.publish_realtime(
+        "mermaid_cursor",
+        {"diagram": diagram_name, "user": user, "position": None},
+        doctype="Diagram",
+        docname=diagram_name,
+        after_commit=False
+    )
+
+def get_cursors(diagram_name):
+    """Latest cursor of every user that moved within CURSOR_TIMEOUT, by user"""
+    cursors = frappe.cache().hgetall(CURSORS_KEY.format(diagram_name)) or {}
+    cutoff = time.time() - CURSOR_TIMEOUT
+    
+    return {
+        (user.decode() if isinstance(user, bytes) else user): cursor
+        for user, cursor in cursors.items()
+        if cursor and cursor.get("timestamp", 0) > cutoff
+    }
+
+def _key(key):
+    return frappe.cache().make_key(key)
@@ -0,0 +1,95 @@
+import re
+
+# Mermaid declares the diagram type with a keyword on the first meaningful
+# line, so detection only ever looks at the header of the code. It skips
+# YAML front-matter, %% comments and %%{init}%% directives, and never copies
+# or lowercases the whole body.
+
+DIAGRAM_TYPES = {
+    "graph": "flowchart",
+    "flowchart": "flowchart",
+    "flowchart-elk": "flowchart",
+    "sequencediagram": "sequence",
+    "classdiagram": "class",
+    "classdiagram-v2": "class",
+    "statediagram": "state",
+    "statediagram-v2": "state",
+    "gantt": "gantt",
+    "pie": "pie",
+    "erdiagram": "er",
+    "journey": "journey",
+    "mindmap": "mindmap",
+    "timeline": "timeline",
+    "gitgraph": "gitgraph",
+    "quadrantchart": "quadrant",
+    "requirementdiagram": "requirement",
+    "c4context": "c4",
+    "c4container": "c4",
+    "c4component": "c4",
+    "c4dynamic": "c4",
+    "c4deployment": "c4",
+    "sankey-beta": "sankey",
+    "xychart-beta": "xychart",
+    "block-beta": "block",
+}
+
+# Stop looking for the header after this many lines; real diagrams declare
+# their type long before this even with front-matter and comments
+MAX_HEADER_LINES = 200
+
+_KEYWORD = re.compile(r"[A-Za-z][\w-]*")
+
+def detect_diagram_type(code):
+    """Return the Diagram.diagram_type for Mermaid code, or "other" if unknown"""
+    if not code:
+        return "other"
+    
+    length = len(code)
+    pos = 0
+    in_front_matter = False
+    in_directive = False
+    seen_content = False
+    
+    for _ in range(MAX_HEADER_LINES):
+        if pos >= length:
+            break
+        
+        end = code.find("\n", pos)
+        if end == -1:
+            end = length
+        
+        line = code[pos:end].strip()
+        pos = end + 1
+        
+        if in_front_matter:
+            if line == "---":
+                in_front_matter = False
+            continue
+        
+        if in_directive:
+            if "}%%" in line:
+                in_directive = False
+            continue
+        
+        if not line:
+            continue
+        
+        if line == "---" and not seen_content:
+            in_front_matter = True
+            seen_content = True
+            continue
+        
+        seen_content = True
+        
+        if line.startswith("%%"):
+            if line.startswith("%%{") and "}%%" not in line:
+                in_directive = True
+            continue
+        
+        match = _KEYWORD.match(line)
+        if not match:
+            return "other"
+        
+        return DIAGRAM_TYPES.get(match.group().lower(), "other")
+    
+    return "other"
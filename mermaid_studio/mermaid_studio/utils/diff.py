@@ -0,0 +1,383 @@
+import frappe
+import bisect
+import json
+
+from mermaid_studio.mermaid_studio.utils.diagram_type import detect_diagram_type
+from mermaid_studio.mermaid_studio.utils.flowchart import parse_flowchart
+
+# Line diffs use patience diff over interned lines: lines that occur exactly
+# once on both sides anchor the alignment and the gaps between anchors are
+# diffed recursively, falling back to Myers for gaps without unique lines.
+# Unlike difflib.SequenceMatcher this stays close to linear on the large,
+# repetitive inputs diagrams tend to be. Opcodes and unified output use the
+# same format as difflib so callers can switch between the two.
+
+DIFF_CACHE_KEY = "mermaid_version_diff:{0}:{1}:{2}"
+DIFF_CACHE_TTL = 24 * 60 * 60
+
+OUTPUT_FORMATS = ("unified", "structured")
+
+# Gaps that need more edits than this are reported as one replace block
+# instead of spending quadratic time on an optimal alignment
+MAX_EDIT_COST = 1000
+
+def get_opcodes(a, b):
+    """Opcodes turning list `a` into list `b`, like SequenceMatcher.get_opcodes"""
+    a, b = _intern(a, b)
+    matches = []
+    stack = [(0, len(a), 0, len(b))]
+    
+    while stack:
+        _match_region(a, b, *stack.pop(), matches, stack)
+    
+    matches.sort()
+    
+    opcodes = []
+    i = j = 0
+    for block_i, block_j, size in _to_blocks(matches) + [(len(a), len(b), 0)]:
+        tag = None
+        if i < block_i and j < block_j:
+            tag = "replace"
+        elif i < block_i:
+            tag = "delete"
+        elif j < block_j:
+            tag = "insert"
+        
+        if tag:
+            opcodes.append((tag, i, block_i, j, block_j))
+        
+        if size:
+            opcodes.append(("equal", block_i, block_i + size, block_j, block_j + size))
+        
+        i, j = block_i + size, block_j + size
+    
+    return opcodes
+
+def get_grouped_opcodes(opcodes, n=3):
+    """Group opcodes into hunks with up to `n` lines of context, like difflib"""
+    opcodes = list(opcodes) or [("equal", 0, 1, 0, 1)]
+    
+    # Trim context at the start and end of the whole diff
+    if opcodes[0][0] == "equal":
+        tag, i1, i2, j1, j2 = opcodes[0]
+        opcodes[0] = tag, max(i1, i2 - n), i2, max(j1, j2 - n), j2
+    
+    if opcodes[-1][0] == "equal":
+        tag, i1, i2, j1, j2 = opcodes[-1]
+        opcodes[-1] = tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)
+    
+    group = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        # Split long runs of equal lines into the end of one hunk and the
+        # start of the next
+        if tag == "equal" and i2 - i1 > n * 2:
+            group.append((tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)))
+            yield group
+            group = []
+            i1, j1 = max(i1, i2 - n), max(j1, j2 - n)
+        
+        group.append((tag, i1, i2, j1, j2))
+    
+    if group and not (len(group) == 1 and group[0][0] == "equal"):
+        yield group
+
+def unified_diff(a, b, fromfile="", tofile="", n=3, lineterm="\n", opcodes=None):
+    """Unified diff of two lists of lines in exactly difflib's output format"""
+    started = False
+    
+    for group in get_grouped_opcodes(get_opcodes(a, b) if opcodes is None else opcodes, n):
+        if not started:
+            started = True
+            yield f"--- {fromfile}{lineterm}"
+            yield f"+++ {tofile}{lineterm}"
+        
+        first, last = group[0], group[-1]
+        old_range = _format_range(first[1], last[2])
+        new_range = _format_range(first[3], last[4])
+        yield f"@@ -{old_range} +{new_range} @@{lineterm}"
+        
+        for tag, i1, i2, j1, j2 in group:
+            if tag == "equal":
+                for line in a[i1:i2]:
+                    yield " " + line
+                continue
+            
+            if tag in ("replace", "delete"):
+                for line in a[i1:i2]:
+                    yield "-" + line
+            
+            if tag in ("replace", "insert"):
+                for line in b[j1:j2]:
+                    yield "+" + line
+
+def structured_diff(old_code, new_code):
+    """Added, removed and relabelled nodes and added and removed edges of a flowchart"""
+    old_nodes, old_edges = parse_flowchart(old_code)
+    new_nodes, new_edges = parse_flowchart(new_code)
+    
+    return {
+        "nodes": {
+            "added": [
+                {"id": node_id, "label": new_nodes[node_id]}
+                for node_id in sorted(new_nodes.keys() - old_nodes.keys())
+            ],
+            "removed": [
+                {"id": node_id, "label": old_nodes[node_id]}
+                for node_id in sorted(old_nodes.keys() - new_nodes.keys())
+            ],
+            "changed": [
+                {"id": node_id, "old_label": old_nodes[node_id], "label": new_nodes[node_id]}
+                for node_id in sorted(old_nodes.keys() & new_nodes.keys())
+                if old_nodes[node_id] != new_nodes[node_id]
+            ]
+        },
+        "edges": {
+            "added": [_edge_dict(edge) for edge in sorted(new_edges - old_edges, key=_edge_sort_key)],
+            "removed": [_edge_dict(edge) for edge in sorted(old_edges - new_edges, key=_edge_sort_key)]
+        }
+    }
+
+def diff_versions(version, compare_version, output_format="unified"):
+    """Diff of two Diagram Versions, from `compare_version` to `version`
+    
+    Versions never change once written, so results are cached by the two
+    version names.
+    """
+    if output_format not in OUTPUT_FORMATS:
+        frappe.throw(frappe._("Unsupported diff format: {0}").format(output_format))
+    
+    cache = frappe.cache()
+    key = DIFF_CACHE_KEY.format(compare_version.name, version.name, output_format)
+    
+    result = cache.get_value(key)
+    if result is None:
+        result = _diff_versions(version, compare_version, output_format)
+        cache.set_value(key, result, expires_in_sec=DIFF_CACHE_TTL)
+    
+    return result
+
+def _diff_versions(version, compare_version, output_format):
+    new_code = version.get_code()
+    old_code = compare_version.get_code()
+    
+    if output_format == "structured":
+        if detect_diagram_type(new_code) != "flowchart":
+            frappe.throw(frappe._("Structured diffs are only available for flowcharts"))
+        
+        return structured_diff(old_code, new_code)
+    
+    opcodes = None
+    if (version.storage_type == "delta"
+            and version.base_version == compare_version.version_number):
+        # The stored delta already is the line diff against the predecessor
+        opcodes = delta_to_opcodes(version.delta)
+    
+    diff = unified_diff(
+        old_code.splitlines(),
+        new_code.splitlines(),
+        fromfile=f"v{compare_version.version_number}",
+        tofile=f"v{version.version_number}",
+        lineterm="",
+        opcodes=opcodes
+    )
+    
+    return "\n".join(diff)
+
+def delta_to_opcodes(delta):
+    """Opcodes equivalent to a version_delta delta"""
+    if isinstance(delta, str):
+        delta = json.loads(delta)
+    
+    opcodes = []
+    i = j = 0
+    deleted = inserted = 0
+    
+    for op in delta + [0]:
+        if isinstance(op, list):
+            inserted += len(op)
+            continue
+        
+        if op < 0:
+            deleted -= op
+            continue
+        
+        if deleted and inserted:
+            opcodes.append(("replace", i, i + deleted, j, j + inserted))
+        elif deleted:
+            opcodes.append(("delete", i, i + deleted, j, j))
+        elif inserted:
+            opcodes.append(("insert", i, i, j, j + inserted))
+        
+        i, j = i + deleted, j + inserted
+        deleted = inserted = 0
+        
+        if op:
+            opcodes.append(("equal", i, i + op, j, j + op))
+            i, j = i + op, j + op
+    
+    return opcodes
+
+def _intern(a, b):
+    # Compare small ints instead of strings; equal lines get equal ids
+    ids = {}
+    return (
+        [ids.setdefault(line, len(ids)) for line in a],
+        [ids.setdefault(line, len(ids)) for line in b]
+    )
+
+def _match_region(a, b, a_lo, a_hi, b_lo, b_hi, matches, stack):
+    # Common prefix and suffix
+    while a_lo < a_hi and b_lo < b_hi and a[a_lo] == b[b_lo]:
+        matches.append((a_lo, b_lo))
+        a_lo += 1
+        b_lo += 1
+    
+    while a_lo < a_hi and b_lo < b_hi and a[a_hi - 1] == b[b_hi - 1]:
+        a_hi -= 1
+        b_hi -= 1
+        matches.append((a_hi, b_hi))
+    
+    if a_lo == a_hi or b_lo == b_hi:
+        return
+    
+    anchors = _unique_anchors(a, b, a_lo, a_hi, b_lo, b_hi)
+    if not anchors:
+        _myers(a, b, a_lo, a_hi, b_lo, b_hi, matches)
+        return
+    
+    # Diff the gaps between consecutive anchors
+    previous_i, previous_j = a_lo, b_lo
+    for i, j in anchors:
+        matches.append((i, j))
+        stack.append((previous_i, i, previous_j, j))
+        previous_i, previous_j = i + 1, j + 1
+    
+    stack.append((previous_i, a_hi, previous_j, b_hi))
+
+def _unique_anchors(a, b, a_lo, a_hi, b_lo, b_hi):
+    # Lines occurring exactly once on each side, as (a index, b index)
+    counts = {}
+    for i in range(a_lo, a_hi):
+        line = a[i]
+        count = counts.get(line)
+        counts[line] = (i, None) if count is None else (-1, None)
+    
+    for j in range(b_lo, b_hi):
+        line = b[j]
+        count = counts.get(line)
+        if count is None or count[0] < 0:
+            continue
+        counts[line] = (count[0], j) if count[1] is None else (-1, None)
+    
+    pairs = sorted((i, j) for i, j in counts.values() if i >= 0 and j is not None)
+    if not pairs:
+        return []
+    
+    # Longest run of pairs increasing on both sides (patience sorting)
+    tails = []
+    tail_indexes = []
+    previous = [None] * len(pairs)
+    
+    for index, (_i, j) in enumerate(pairs):
+        position = bisect.bisect_left(tails, j)
+        if position:
+            previous[index] = tail_indexes[position - 1]
+        
+        if position == len(tails):
+            tails.append(j)
+            tail_indexes.append(index)
+        else:
+            tails[position] = j
+            tail_indexes[position] = index
+    
+    anchors = []
+    index = tail_indexes[-1]
+    while index is not None:
+        anchors.append(pairs[index])
+        index = previous[index]
+    
+    anchors.reverse()
+    return anchors
+
+def _myers(a, b, a_lo, a_hi, b_lo, b_hi, matches):
+    n = a_hi - a_lo
+    m = b_hi - b_lo
+    limit = min(n + m, MAX_EDIT_COST)
+    offset = limit + 1
+    v = [0] * (2 * limit + 3)
+    trace = []
+    
+    for d in range(limit + 1):
+        # Only diagonals -d - 1 .. d + 1 are read when backtracking step d
+        trace.append(v[offset - d - 1:offset + d + 2])
+        
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+                x = v[offset + k + 1]
+            else:
+                x = v[offset + k - 1] + 1
+            
+            y = x - k
+            while x < n and y < m and a[a_lo + x] == b[b_lo + y]:
+                x += 1
+                y += 1
+            
+            v[offset + k] = x
+            
+            if x >= n and y >= m:
+                _myers_backtrack(trace, n, m, a_lo, b_lo, matches)
+                return
+    
+    # Too many edits for an optimal alignment; leave the gap unmatched
+
+def _myers_backtrack(trace, x, y, a_lo, b_lo, matches):
+    for d in range(len(trace) - 1, -1, -1):
+        v = trace[d]
+        offset = d + 1
+        k = x - y
+        
+        if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+            previous_k = k + 1
+        else:
+            previous_k = k - 1
+        
+        previous_x = v[offset + previous_k]
+        previous_y = previous_x - previous_k
+        
+        while x > previous_x and y > previous_y:
+            x -= 1
+            y -= 1
+            matches.append((a_lo + x, b_lo + y))
+        
+        x, y = previous_x, previous_y
+
+def _to_blocks(matches):
+    # Collapse sorted matching (i, j) pairs into (i, j, size) runs
+    blocks = []
+    for i, j in matches:
+        if blocks:
+            block_i, block_j, size = blocks[-1]
+            if block_i + size == i and block_j + size == j:
+                blocks[-1] = (block_i, block_j, size + 1)
+                continue
+        
+        blocks.append((i, j, 1))
+    
+    return blocks
+
+def _format_range(start, stop):
+    # Unified diff ranges are 1-based; empty ranges point at the line before
+    length = stop - start
+    if length == 1:
+        return f"{start + 1}"
+    
+    if not length:
+        start -= 1
+    
+    return f"{start + 1},{length}"
+
+def _edge_dict(edge):
+    return {"from": edge[0], "to": edge[1], "label": edge[2]}
+
+def _edge_sort_key(edge):
+    return (edge[0], edge[1], edge[2] or "")
@@ -0,0 +1,120 @@
+import frappe
+import json
+import time
+
+from mermaid_studio.mermaid_studio.utils import counters
+
+# Edit locks are leases: one Redis key per diagram set with SET NX and a TTL.
+# Whoever creates the key holds the lock until they release it or stop
+# renewing it, so a crashed browser never blocks a diagram for longer than
+# the lease. Renew and release compare the holder inside Redis (Lua) so a
+# user can never extend or drop a lock that has since passed to someone else.
+
+LOCK_KEY = "mermaid_edit_lock:{0}"
+STATS_KEY = "mermaid_edit_lock_stats"
+STATS_FIELDS = ("acquired", "renewed", "contended", "released", "stolen")
+DEFAULT_LEASE = 300
+
+_RENEW_SCRIPT = """
+local value = redis.call('get', KEYS[1])
+if value and cjson.decode(value)['user'] == ARGV[1] then
+    return redis.call('expire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+_RELEASE_SCRIPT = """
+local value = redis.call('get', KEYS[1])
+if value and cjson.decode(value)['user'] == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+def get_lease_seconds():
+    """Seconds a lock is held without being renewed"""
+    return int(frappe.conf.get("mermaid_edit_lock_lease") or DEFAULT_LEASE)
+
+def acquire(diagram_name, full_name=None):
+    """Take the edit lock for the session user
+    
+    Returns (acquired, holder). Acquiring a lock the user already holds
+    renews it.
+    """
+    value = _make_value(frappe.session.user, full_name)
+    holder = None
+    
+    # Retry once if the other holder's lease ran out between the two calls
+    for _attempt in range(2):
+        if frappe.cache().set(_key(diagram_name), value, ex=get_lease_seconds(), nx=True):
+            counters.incr(STATS_KEY, "acquired")
+            return True, json.loads(value)
+        
+        if renew(diagram_name):
+            return True, get_holder(diagram_name)
+        
+        holder = get_holder(diagram_name)
+        if holder:
+            break
+    
+    counters.incr(STATS_KEY, "contended")
+    return False, holder
+
+def renew(diagram_name):
+    """Extend the session user's lease; False if they no longer hold the lock"""
+    renewed = _run(_RENEW_SCRIPT, diagram_name, frappe.session.user, get_lease_seconds())
+    if renewed:
+        counters.incr(STATS_KEY, "renewed")
+    
+    return bool(renewed)
+
+def release(diagram_name):
+    """Drop the session user's lock; a lock held by someone else is left alone"""
+    released = _run(_RELEASE_SCRIPT, diagram_name, frappe.session.user)
+    if released:
+        counters.incr(STATS_KEY, "released")
+    
+    return bool(released)
+
+def steal(diagram_name, full_name=None):
+    """Take the lock from whoever holds it; callers must check permissions"""
+    previous = get_holder(diagram_name)
+    frappe.cache().set(
+        _key(diagram_name), _make_value(frappe.session.user, full_name), ex=get_lease_seconds()
+    )
+    counters.incr(STATS_KEY, "stolen")
+    
+    return previous
+
+def get_holder(diagram_name):
+    """Holder of a diagram's lock ({user, full_name, acquired}) or None"""
+    return get_holders([diagram_name])[diagram_name]
+
+def get_holders(diagram_names):
+    """Lock holders of many diagrams in one MGET, by diagram name"""
+    if not diagram_names:
+        return {}
+    
+    values = frappe.cache().mget([_key(name) for name in diagram_names])
+    return {
+        name: json.loads(value) if value else None
+        for name, value in zip(diagram_names, values)
+    }
+
+def get_stats():
+    """Lock counters; contended / (acquired + contended) is the contention rate"""
+    stats = counters.get_values(STATS_KEY, STATS_FIELDS)
+    attempts = stats["acquired"] + stats["contended"]
+    stats["contention_rate"] = round(stats["contended"] / attempts, 4) if attempts else 0
+    
+    return stats
+
+def _make_value(user, full_name=None):
+    return json.dumps({"user": user, "full_name": full_name or user, "acquired": time.time()})
+
+def _run(script, diagram_name, *args):
+    cache = frappe.cache()
+    return cache.register_script(script)(keys=[_key(diagram_name)], args=list(args))
+
+def _key(diagram_name):
+    return frappe.cache().make_key(LOCK_KEY.format(diagram_name))
@@ -0,0 +1,112 @@
+import frappe
+import hashlib
+import io
+import json
+from frappe.utils.file_manager import save_file
+
+from mermaid_studio.mermaid_studio.utils.render import get_svg, render
+
+class ExportWriter:
+    """In-memory byte sink for exports that tracks size and content hash as it is written"""
+    
+    def __init__(self):
+        self._stream = io.BytesIO()
+        self._hash = hashlib.md5()
+        self.bytes_written = 0
+    
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        
+        self._stream.write(data)
+        self._hash.update(data)
+        self.bytes_written += len(data)
+        
+        return len(data)
+    
+    @property
+    def content_hash(self):
+        """MD5 of the written bytes, as stored in File.content_hash"""
+        return self._hash.hexdigest()
+    
+    def getvalue(self):
+        return self._stream.getvalue()
+
+def write_mmd(diagram, writer, **options):
+    """Mermaid Markdown export of a diagram"""
+    writer.write(diagram.diagram_code or "")
+
+def write_json(diagram, writer, **options):
+    """JSON export of a diagram"""
+    diagram_json = {
+        "title": diagram.title,
+        "description": diagram.description,
+        "diagram_code": diagram.diagram_code,
+        "diagram_type": diagram.diagram_type,
+        "version": diagram.version,
+        "created_by": diagram.created_by,
+        "created_at": str(diagram.creation),
+        "tags": [tag.tag for tag in diagram.tags]
+    }
+    
+    for chunk in json.JSONEncoder(indent=2).iterencode(diagram_json):
+        writer.write(chunk)
+
+def write_svg(diagram, writer, **options):
+    """Server-rendered SVG export of a diagram, served from the render cache when possible"""
+    svg, _cached = get_svg(diagram.diagram_code, diagram.render_settings)
+    writer.write(svg)
+
+def write_png(diagram, writer, **options):
+    """PNG export of a diagram rendered on the worker pool"""
+    writer.write(render(diagram.diagram_code, "png", diagram.render_settings, **options))
+
+def write_pdf(diagram, writer, **options):
+    """PDF export of a diagram rendered on the worker pool"""
+    writer.write(render(diagram.diagram_code, "pdf", diagram.render_settings, **options))
+
+EXPORTERS = {
+    "mmd": write_mmd,
+    "json": write_json,
+    "svg": write_svg,
+    "png": write_png,
+    "pdf": write_pdf,
+}
+
+def build_export(diagram, export_format, **options):
+    """Run the exporter for `export_format` into an in-memory writer"""
+    writer = ExportWriter()
+    EXPORTERS[export_format](diagram, writer, **options)
+    return writer
+
+def get_export_file_name(diagram, extension):
+    """File name used for a diagram export"""
+    return f"{diagram.title.replace(' ', '_')}.{extension}"
+
+def save_export_file(diagram, file_name, writer):
+    """Attach an export to the diagram, reusing an identical earlier attachment"""
+    existing = frappe.db.get_value(
+        "File",
+        {
+            "attached_to_doctype": "Diagram",
+            "attached_to_name": diagram.name,
+            "file_name": file_name,
+            "content_hash": writer.content_hash
+        },
+        "file_url"
+    )
+    
+    file_url = existing or save_file(
+        file_name,
+        writer.getvalue(),
+        "Diagram",
+        diagram.name,
+        is_private=1
+    ).file_url
+    
+    return {
+        "file_url": file_url,
+        "file_name": file_name,
+        "bytes_written": writer.bytes_written,
+        "reused": bool(existing)
+    }
@@ -0,0 +1,130 @@
+import re
+
+# A small flowchart reader that extracts node ids, labels and edges. It only
+# understands as much syntax as structural diffs and search need and quietly
+# skips statements it does not recognise rather than validating the diagram.
+
+HEADER_KEYWORDS = ("graph", "flowchart", "flowchart-elk")
+
+SKIP_KEYWORDS = (
+    "subgraph", "end", "direction", "classdef", "class", "style",
+    "linkstyle", "click", "acctitle", "accdescr"
+)
+
+_NODE_ID = re.compile(r"\s*([A-Za-z0-9_][\w]*)(?::::[\w-]+)?")
+
+_LINK = re.compile(r"""\s*
+    (?:
+        [<xo]?(?:--|==|-\.)\s+(?P<text>[^-=.|\s][^|]*?)\s+(?:-{2,}|={2,}|\.+-)[>xo]?
+      |
+        [<xo]?(?:-{2,}|={2,}|-\.+-|~{3,})[>xo]?
+    )
+    \s*(?:\|(?P<pipe>[^|]*)\|)?""", re.X)
+
+_AMPERSAND = re.compile(r"\s*&")
+
+_SHAPE_OPENERS = "[({>"
+
+def parse_flowchart(code):
+    """Return (nodes, edges) of a flowchart
+    
+    `nodes` maps node id to its label (the id itself when no label is given)
+    and `edges` is a set of (from_id, to_id, label) tuples.
+    """
+    nodes = {}
+    edges = set()
+    
+    for line in (code or "").splitlines():
+        line = line.strip()
+        if not line or line.startswith("%%"):
+            continue
+        
+        keyword = line.split(None, 1)[0].rstrip(":").lower()
+        if keyword in HEADER_KEYWORDS or keyword in SKIP_KEYWORDS:
+            continue
+        
+        for statement in line.split(";"):
+            _parse_statement(statement, nodes, edges)
+    
+    return nodes, edges
+
+def _parse_statement(statement, nodes, edges):
+    pos = 0
+    previous_group = None
+    link_label = None
+    
+    while pos < len(statement):
+        group, pos = _parse_node_group(statement, pos, nodes)
+        if not group:
+            return
+        
+        if previous_group is not None:
+            for source in previous_group:
+                for target in group:
+                    edges.add((source, target, link_label))
+        
+        link = _LINK.match(statement, pos)
+        if not link:
+            return
+        
+        label = link.group("text") or link.group("pipe")
+        link_label = _clean_label(label) if label else None
+        previous_group = group
+        pos = link.end()
+
+def _parse_node_group(statement, pos, nodes):
+    # `A & B[Label] & C` declares several nodes linked together
+    group = []
+    
+    while True:
+        match = _NODE_ID.match(statement, pos)
+        if not match:
+            return group, pos
+        
+        node_id = match.group(1)
+        pos = match.end()
+        label = None
+        
+        if pos < len(statement) and statement[pos] in _SHAPE_OPENERS:
+            end = _find_shape_end(statement, pos)
+            label = _clean_label(statement[pos:end])
+            pos = end
+        
+        if label is not None or node_id not in nodes:
+            nodes[node_id] = label or node_id
+        
+        group.append(node_id)
+        
+        ampersand = _AMPERSAND.match(statement, pos)
+        if not ampersand:
+            return group, pos
+        
+        pos = ampersand.end()
+
+def _find_shape_end(statement, pos):
+    # Track bracket depth and skip quoted labels, which may contain brackets
+    depth = 0
+    in_quotes = False
+    
+    for index in range(pos, len(statement)):
+        char = statement[index]
+        
+        if char == '"':
+            in_quotes = not in_quotes
+        elif in_quotes:
+            continue
+        elif char in "[({" or (char == ">" and index == pos):
+            depth += 1
+        elif char in "])}":
+            depth -= 1
+            if depth == 0:
+                return index + 1
+    
+    return len(statement)
+
+def _clean_label(label):
+    label = label.strip().strip("[](){}<>/\\").strip()
+    if len(label) >= 2 and label[0] == label[-1] == '"':
+        label = label[1:-1]
+    
+    return label.strip()
@@ -0,0 +1,64 @@
+import frappe
+from frappe import _
+from frappe.utils import now_datetime
+
+STATUS_KEY = "mermaid_job_status:{0}"
+STATUS_TTL = 24 * 60 * 60
+PROGRESS_EVENT = "mermaid_job_progress"
+
+def create_job(kind, total=0):
+    """Register a new background job for the current user and return its id"""
+    job_id = frappe.generate_hash(length=16)
+    
+    status = frappe._dict({
+        "job_id": job_id,
+        "kind": kind,
+        "status": "queued",
+        "user": frappe.session.user,
+        "total": total,
+        "processed": 0,
+        "progress": 0,
+        "errors": [],
+        "created_on": now_datetime().isoformat()
+    })
+    _save(status)
+    
+    return job_id
+
+def get_job(job_id):
+    """Return the stored status of a job, or None if unknown or expired"""
+    status = frappe.cache().get_value(STATUS_KEY.format(job_id))
+    return frappe._dict(status) if status else None
+
+def get_job_for_user(job_id):
+    """Return a job's status, only to the user who started it"""
+    status = get_job(job_id)
+    
+    if not status:
+        frappe.throw(_("Job {0} not found or expired").format(job_id), frappe.DoesNotExistError)
+    
+    if status.user != frappe.session.user and frappe.session.user != "Administrator":
+        frappe.throw(_("You don't have permission to view this job"), frappe.PermissionError)
+    
+    return status
+
+def update_job(job_id, publish=True, **values):
+    """Merge `values` into the job status and notify the owner over realtime"""
+    status = get_job(job_id)
+    if not status:
+        return None
+    
+    status.update(values)
+    
+    if status.total:
+        status.progress = min(100, int(status.processed * 100 / status.total))
+    
+    _save(status)
+    
+    if publish:
+        frappe.publish_realtime(PROGRESS_EVENT, status, user=status.user)
+    
+    return status
+
+def _save(status):
+    frappe.cache().set_value(STATUS_KEY.format(status.job_id), dict(status), expires_in_sec=STATUS_TTL)
@@ -0,0 +1,199 @@
+# Operational transformation for plain text, compatible with the operations
+# built by the editor (frontend/src/utils/ot.js). An operation is a list of
+# components applied left to right over the whole document:
+#   n (positive int)  retain the next n characters
+#   "text" (str)      insert text
+#   -n (negative int) delete the next n characters
+# Lengths count Unicode code points on both sides.
+
+class OperationError(ValueError):
+    """Raised when an operation does not fit the document it is applied to"""
+
+def normalize(operation):
+    """Merge adjacent components of the same kind and drop empty ones"""
+    result = []
+    for component in operation:
+        if isinstance(component, bool) or not isinstance(component, (int, str)):
+            raise OperationError(f"Invalid operation component: {component!r}")
+        
+        if component == 0 or component == "":
+            continue
+        
+        if result and _kind(result[-1]) == _kind(component):
+            result[-1] += component
+        elif isinstance(component, str) and result and _kind(result[-1]) == "delete":
+            # Keep inserts before deletes so equal operations look the same
+            if len(result) > 1 and _kind(result[-2]) == "insert":
+                result[-2] += component
+            else:
+                result.insert(len(result) - 1, component)
+        else:
+            result.append(component)
+    
+    # A trailing retain changes nothing
+    if result and _kind(result[-1]) == "retain":
+        result.pop()
+    
+    return result
+
+def base_length(operation):
+    """Length of the document the operation applies to, without the trailing retain"""
+    return sum(abs(component) for component in operation if isinstance(component, int))
+
+def apply(text, operation):
+    """Apply an operation to a text"""
+    if base_length(operation) > len(text):
+        raise OperationError("Operation is longer than the document")
+    
+    parts = []
+    index = 0
+    for component in operation:
+        kind = _kind(component)
+        if kind == "retain":
+            parts.append(text[index:index + component])
+            index += component
+        elif kind == "insert":
+            parts.append(component)
+        else:
+            index -= component
+    
+    parts.append(text[index:])
+    return "".join(parts)
+
+def from_texts(old_text, new_text):
+    """Smallest single-range operation turning old_text into new_text"""
+    prefix = 0
+    while prefix < min(len(old_text), len(new_text)) and old_text[prefix] == new_text[prefix]:
+        prefix += 1
+    
+    suffix = 0
+    while (
+        suffix < len(old_text) - prefix
+        and suffix < len(new_text) - prefix
+        and old_text[-1 - suffix] == new_text[-1 - suffix]
+    ):
+        suffix += 1
+    
+    return normalize([
+        prefix,
+        new_text[prefix:len(new_text) - suffix],
+        -(len(old_text) - prefix - suffix)
+    ])
+
+def compose(a, b):
+    """One operation with the effect of applying `a` and then `b`"""
+    result = []
+    a_iter, b_iter = _Components(a), _Components(b)
+    
+    while a_iter.current is not None or b_iter.current is not None:
+        if a_iter.kind == "delete":
+            result.append(a_iter.take())
+            continue
+        
+        if b_iter.kind == "insert":
+            result.append(b_iter.take())
+            continue
+        
+        if a_iter.current is None:
+            # Both operations implicitly retain the rest of the document
+            result.append(b_iter.take())
+            continue
+        
+        if b_iter.current is None:
+            result.append(a_iter.take())
+            continue
+        
+        size = min(a_iter.length, b_iter.length)
+        a_part, b_part = a_iter.take(size), b_iter.take(size)
+        
+        if b_iter.last_kind == "retain":
+            result.append(a_part)
+        elif a_iter.last_kind == "retain":
+            result.append(b_part)
+        # An insert deleted again by `b` leaves nothing behind
+    
+    return normalize(result)
+
+def transform(a, b):
+    """Transform concurrent operations so that apply(apply(d, a), b') == apply(apply(d, b), a')
+    
+    Returns (a', b'). When both insert at the same position, `a` goes first.
+    """
+    a_prime, b_prime = [], []
+    a_iter, b_iter = _Components(a), _Components(b)
+    
+    while a_iter.current is not None or b_iter.current is not None:
+        if a_iter.kind == "insert":
+            text = a_iter.take()
+            a_prime.append(text)
+            b_prime.append(len(text))
+            continue
+        
+        if b_iter.kind == "insert":
+            text = b_iter.take()
+            a_prime.append(len(text))
+            b_prime.append(text)
+            continue
+        
+        if a_iter.current is None:
+            b_prime.append(b_iter.take())
+            continue
+        
+        if b_iter.current is None:
+            a_prime.append(a_iter.take())
+            continue
+        
+        size = min(a_iter.length, b_iter.length)
+        a_part, b_part = a_iter.take(size), b_iter.take(size)
+        
+        if a_iter.last_kind == "retain" and b_iter.last_kind == "retain":
+            a_prime.append(size)
+            b_prime.append(size)
+        elif a_iter.last_kind == "delete" and b_iter.last_kind == "retain":
+            a_prime.append(a_part)
+        elif a_iter.last_kind == "retain" and b_iter.last_kind == "delete":
+            b_prime.append(b_part)
+        # Both deleted the same characters: nothing left to do
+    
+    return normalize(a_prime), normalize(b_prime)
+
+def _kind(component):
+    if isinstance(component, str):
+        return "insert"
+    
+    return "retain" if component > 0 else "delete"
+
+class _Components:
+    """Walks an operation, splitting components when only part is consumed"""
+    
+    def __init__(self, operation):
+        self.components = list(normalize(operation))
+        self.index = 0
+        self.current = self.components[0] if self.components else None
+        self.last_kind = None
+    
+    @property
+    def kind(self):
+        return _kind(self.current) if self.current is not None else None
+    
+    @property
+    def length(self):
+        return len(self.current) if isinstance(self.current, str) else abs(self.current)
+    
+    def take(self, size=None):
+        current = self.current
+        self.last_kind = _kind(current)
+        
+        if size is None or size >= self.length:
+            self.index += 1
+            self.current = self.components[self.index] if self.index < len(self.components) else None
+            return current
+        
+        if self.last_kind == "insert":
+            part, self.current = current[:size], current[size:]
+        elif self.last_kind == "retain":
+            part, self.current = size, current - size
+        else:
+            part, self.current = -size, current + size
+        
+        return part
@@ -0,0 +1,75 @@
+import frappe
+import json
+from frappe.utils import get_datetime
+
+from mermaid_studio.mermaid_studio.utils import ot
+
+# Recent saves of each diagram as text operations, so that a patch made
+# against an older save can be rebased instead of overwriting what others
+# saved since. Each entry links the `modified` it was made on to the one it
+# produced; following the links back from the current `modified` finds the
+# operations to transform a patch over. Entries of saves that were rolled
+# back are simply never reached.
+
+LOG_KEY = "mermaid_patch_log:{0}"
+
+# Saves kept per diagram; patches based on older saves are rejected
+MAX_LOG_LENGTH = 50
+LOG_TTL = 24 * 60 * 60
+
+def record(diagram):
+    """Log the change of diagram_code made by the save of a Diagram"""
+    previous = diagram.get_doc_before_save()
+    if not previous:
+        return
+    
+    if diagram.has_value_changed("diagram_code"):
+        operation = ot.from_texts(previous.diagram_code or "", diagram.diagram_code or "")
+    else:
+        operation = []
+    
+    entry = {
+        "base": _stamp(previous.modified),
+        "modified": _stamp(diagram.modified),
+        "operation": operation
+    }
+    
+    cache = frappe.cache()
+    pipeline = cache.pipeline()
+    pipeline.rpush(_key(diagram.name), json.dumps(entry))
+    pipeline.ltrim(_key(diagram.name), -MAX_LOG_LENGTH, -1)
+    pipeline.expire(_key(diagram.name), LOG_TTL)
+    pipeline.execute()
+
+def get_operations_since(diagram_name, base_modified, current_modified):
+    """Operations saved between two `modified` stamps, oldest first, or None if not all are known"""
+    base, stamp = _stamp(base_modified), _stamp(current_modified)
+    if base == stamp:
+        return []
+    
+    # Written through a raw pipeline, but RedisWrapper.lrange adds the site
+    # prefix itself
+    entries = {}
+    for entry in frappe.cache().lrange(LOG_KEY.format(diagram_name), 0, -1):
+        entry = json.loads(entry)
+        entries[entry["modified"]] = entry
+    
+    operations = []
+    while stamp != base:
+        entry = entries.pop(stamp, None)
+        if not entry:
+            return None
+        
+        operations.append(entry["operation"])
+        stamp = entry["base"]
+    
+    return operations[::-1]
+
+def clear(diagram_name):
+    frappe.cache().delete(_key(diagram_name))
+
+def _stamp(modified):
+    return str(get_datetime(modified))
+
+def _key(diagram_name):
+    return frappe.cache().make_key(LOG_KEY.format(diagram_name))
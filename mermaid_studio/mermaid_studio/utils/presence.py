@@ -0,0 +1,48 @@
+import frappe
+import time
+
+# Presence of users on a diagram is a Redis sorted set per diagram with the
+# user as member and the time of their last heartbeat as score. A heartbeat
+# is one ZADD, listing is one range query on the score, and users who stop
+# sending heartbeats drop out of the range without anyone rewriting a list.
+
+PRESENCE_KEY = "mermaid_presence:{0}"
+
+# Users are active while their last heartbeat is younger than this
+PRESENCE_TIMEOUT = 60
+
+def heartbeat(diagram_name, user=None):
+    """Mark `user` (default: session user) active on a diagram now
+
+    Returns True when the user was not in the set yet, i.e. just joined.
+    """
+    cache = frappe.cache()
+    key = _key(diagram_name)
+    now = time.time()
+    
+    pipeline = cache.pipeline()
+    pipeline.zadd(key, {user or frappe.session.user: now})
+    # Drop stale members and let the whole set expire once nobody is left
+    pipeline.zremrangebyscore(key, "-inf", now - PRESENCE_TIMEOUT)
+    pipeline.expire(key, PRESENCE_TIMEOUT * 2)
+    added, _removed, _expire = pipeline.execute()
+    
+    return bool(added)
+
+def leave(diagram_name, user=None):
+    """Remove `user` (default: session user) from a diagram's active users"""
+    frappe.cache().zrem(_key(diagram_name), user or frappe.session.user)
+
+def get_active_users(diagram_name):
+    """List of (user, last heartbeat timestamp) active on a diagram, most recent first"""
+    members = frappe.cache().zrevrangebyscore(
+        _key(diagram_name), "+inf", time.time() - PRESENCE_TIMEOUT, withscores=True
+    )
+    
+    return [
+        (user.decode() if isinstance(user, bytes) else user, score)
+        for user, score in members
+    ]
+
+def _key(diagram_name):
+    return frappe.cache().make_key(PRESENCE_KEY.format(diagram_name))
@@ -0,0 +1,164 @@
+import frappe
+import importlib.util
+import json
+import os
+import shutil
+import subprocess
+
+from mermaid_studio.mermaid_studio.utils import render_pool, svg_cache
+
+DEFAULT_TIMEOUT = 30
+
+class MermaidRenderError(Exception):
+    """Raised when the server-side renderer fails on a diagram"""
+
+class RendererUnavailableError(MermaidRenderError):
+    """Raised when no server-side renderer is installed"""
+
+def get_cli_path():
+    """Path of the mermaid-cli (mmdc) executable, or None if not installed"""
+    return frappe.conf.get("mermaid_cli_path") or shutil.which("mmdc")
+
+def get_renderer():
+    """Renderer alias or dotted path configured for this site
+    
+    Defaults to a warm Playwright browser when playwright is installed and to
+    mermaid-cli otherwise.
+    """
+    if frappe.conf.get("mermaid_renderer"):
+        return frappe.conf.get("mermaid_renderer")
+    
+    if importlib.util.find_spec("playwright"):
+        return "playwright"
+    
+    if get_cli_path():
+        return "cli"
+    
+    return None
+
+def get_mermaid_package_path(*parts):
+    """Path inside the mermaid package installed with the app's node dependencies"""
+    return os.path.join(frappe.get_app_path("mermaid_studio"), "..", "node_modules", "mermaid", *parts)
+
+def get_mermaid_js_path():
+    """Local mermaid.js for the browser renderer, or None when configured to load it from a URL"""
+    if frappe.conf.get("mermaid_js_url"):
+        return None
+    
+    path = frappe.conf.get("mermaid_js_path") or get_mermaid_package_path("dist", "mermaid.min.js")
+    if not os.path.exists(path):
+        raise RendererUnavailableError(
+            f"mermaid.js not found at {path}; install the app's node dependencies (yarn install)"
+        )
+    
+    return path
+
+def get_render_pool():
+    """Renderer worker pool of this process for the site's renderer settings"""
+    renderer = get_renderer()
+    if not renderer:
+        raise RendererUnavailableError("No server-side Mermaid renderer is installed")
+    
+    conf = frappe.conf
+    timeout = int(conf.get("mermaid_render_timeout") or DEFAULT_TIMEOUT)
+    
+    renderer_options = dict(conf.get("mermaid_renderer_options") or {})
+    if renderer == "cli":
+        renderer_options.setdefault("cli_path", get_cli_path())
+        renderer_options.setdefault("timeout", timeout)
+    elif renderer == "playwright":
+        if conf.get("mermaid_js_url"):
+            renderer_options.setdefault("mermaid_js_url", conf.get("mermaid_js_url"))
+        else:
+            renderer_options.setdefault("mermaid_js_path", get_mermaid_js_path())
+    
+    return render_pool.get_pool(
+        renderer,
+        renderer_options,
+        size=conf.get("mermaid_render_pool_size") or render_pool.DEFAULT_POOL_SIZE,
+        max_jobs=conf.get("mermaid_render_max_jobs") or render_pool.DEFAULT_MAX_JOBS,
+        max_rss_mb=conf.get("mermaid_render_max_rss_mb") or render_pool.DEFAULT_MAX_RSS_MB,
+        timeout=timeout
+    )
+
+def get_mermaid_version():
+    """Version of the renderer, part of the cache key so upgrades re-render"""
+    if frappe.conf.get("mermaid_version"):
+        return frappe.conf.get("mermaid_version")
+    
+    if get_renderer() == "cli":
+        return frappe.cache().get_value("mermaid_cli_version", generator=_read_cli_version)
+    
+    if frappe.conf.get("mermaid_js_url"):
+        return frappe.conf.get("mermaid_js_url")
+    
+    return frappe.cache().get_value("mermaid_js_version", generator=_read_mermaid_js_version)
+
+def _read_cli_version():
+    cli_path = get_cli_path()
+    if not cli_path:
+        return ""
+    
+    try:
+        result = subprocess.run(
+            [cli_path, "--version"], capture_output=True, text=True, timeout=DEFAULT_TIMEOUT
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return ""
+    
+    return result.stdout.strip()
+
+def _read_mermaid_js_version():
+    try:
+        with open(get_mermaid_package_path("package.json"), encoding="utf-8") as f:
+            return json.load(f).get("version") or ""
+    except (OSError, ValueError):
+        return ""
+
+def parse_render_settings(render_settings):
+    """Render settings are stored as JSON; accept both strings and dicts"""
+    if not render_settings:
+        return {}
+    
+    if isinstance(render_settings, str):
+        try:
+            return json.loads(render_settings) or {}
+        except ValueError:
+            return {}
+    
+    return render_settings
+
+def render(diagram_code, output_format="svg", render_settings=None, **options):
+    """Render diagram code to SVG, PNG or PDF bytes on the renderer pool"""
+    job_options = dict(parse_render_settings(render_settings))
+    job_options.update({key: value for key, value in options.items() if value is not None})
+    
+    try:
+        return get_render_pool().submit(diagram_code or "", output_format, job_options)
+    except render_pool.RenderWorkerStartError as e:
+        raise RendererUnavailableError(str(e))
+    except render_pool.RenderWorkerError as e:
+        raise MermaidRenderError(str(e))
+
+def render_svg(diagram_code, render_settings=None):
+    """Render diagram code to SVG bytes"""
+    return render(diagram_code, "svg", render_settings)
+
+def get_svg(diagram_code, render_settings=None):
+    """Return (svg_bytes, cached) for the diagram, rendering only on a cache miss"""
+    settings = parse_render_settings(render_settings)
+    key = svg_cache.get_cache_key(diagram_code, settings, get_mermaid_version())
+    
+    svg = svg_cache.get(key)
+    if svg is not None:
+        return svg, True
+    
+    svg = render_svg(diagram_code, settings)
+    svg_cache.put(key, svg)
+    
+    return svg, False
+
+def get_cached_svg(diagram_code, render_settings=None):
+    """SVG bytes of the diagram if a render is already cached, else None; never renders"""
+    settings = parse_render_settings(render_settings)
+    return svg_cache.get(svg_cache.get_cache_key(diagram_code, settings, get_mermaid_version()))
@@ -0,0 +1,346 @@
+import atexit
+import importlib
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+from mermaid_studio.mermaid_studio.utils.renderers import RENDERER_ALIASES
+
+DEFAULT_POOL_SIZE = 2
+DEFAULT_MAX_JOBS = 200
+DEFAULT_MAX_RSS_MB = 512
+DEFAULT_TIMEOUT = 30
+WORKER_START_TIMEOUT = 60
+
+class RenderWorkerError(Exception):
+    """Raised when a job fails inside a renderer worker"""
+
+class RenderTimeoutError(RenderWorkerError):
+    """Raised when a job does not finish within its timeout"""
+
+class RenderWorkerStartError(RenderWorkerError):
+    """Raised when a job gets no worker because the renderer could not start"""
+
+def load_renderer_class(renderer):
+    """Resolve a renderer alias or dotted path to its class"""
+    path = RENDERER_ALIASES.get(renderer, renderer)
+    module_name, class_name = path.rsplit(".", 1)
+    return getattr(importlib.import_module(module_name), class_name)
+
+def get_rss():
+    """Resident memory of this process and its children (e.g. a browser), in bytes"""
+    try:
+        import psutil
+    except ImportError:
+        # Current (not peak) memory of this process only, 0 where unknown
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, IndexError):
+            return 0
+    
+    process = psutil.Process()
+    rss = process.memory_info().rss
+    for child in process.children(recursive=True):
+        try:
+            rss += child.memory_info().rss
+        except psutil.Error:
+            pass
+    
+    return rss
+
+def _worker_main(conn, renderer, renderer_options):
+    """Entry point of a renderer worker process"""
+    try:
+        instance = load_renderer_class(renderer)(**renderer_options)
+        instance.start()
+    except Exception as e:
+        conn.send(("error", f"Renderer failed to start: {e}", 0))
+        return
+    
+    conn.send(("ready", None, get_rss()))
+    
+    try:
+        while True:
+            try:
+                job = conn.recv()
+            except EOFError:
+                break
+            
+            if job is None:
+                break
+            
+            diagram_code, output_format, options = job
+            try:
+                output = instance.render(diagram_code, output_format, options)
+                conn.send(("ok", output, get_rss()))
+            except Exception as e:
+                conn.send(("error", str(e) or e.__class__.__name__, get_rss()))
+    finally:
+        instance.stop()
+
+class _FailedStart:
+    """Stands in the idle queue for a worker that could not be started"""
+    
+    def __init__(self, message):
+        self.message = message
+    
+    def stop(self, timeout=None):
+        pass
+
+class _Worker:
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        self.jobs = 0
+        self.rss = 0
+    
+    def stop(self, timeout=5):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        
+        self.conn.close()
+    
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+class RenderPool:
+    """Pool of long-lived renderer worker processes
+    
+    Workers are started in the background by `start` (warm start) and reused
+    across jobs; jobs submitted meanwhile wait for the first one. A worker is
+    recycled after `max_jobs` jobs or once its resident memory, including
+    child processes such as a headless browser, exceeds `max_rss_mb`. A job
+    that exceeds `timeout` seconds gets its worker killed and replaced.
+    """
+    
+    def __init__(self, renderer="cli", renderer_options=None, size=DEFAULT_POOL_SIZE,
+                 max_jobs=DEFAULT_MAX_JOBS, max_rss_mb=DEFAULT_MAX_RSS_MB, timeout=DEFAULT_TIMEOUT):
+        self.renderer = renderer
+        self.renderer_options = renderer_options or {}
+        self.size = int(size)
+        self.max_jobs = int(max_jobs)
+        self.max_rss = int(max_rss_mb) * 1024 * 1024
+        self.timeout = float(timeout)
+        
+        self._context = multiprocessing.get_context("spawn")
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._started = False
+        self._waiting = 0
+        self.stats = {
+            "jobs": 0,
+            "errors": 0,
+            "timeouts": 0,
+            "recycled": 0,
+            "render_time": 0.0
+        }
+    
+    def start(self):
+        """Boot the workers in background threads, once"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        
+        for _ in range(self.size):
+            self._spawn_in_background()
+    
+    def _spawn(self):
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(child_conn, self.renderer, self.renderer_options),
+            daemon=True
+        )
+        process.start()
+        child_conn.close()
+        
+        worker = _Worker(process, parent_conn)
+        
+        if not parent_conn.poll(WORKER_START_TIMEOUT):
+            worker.kill()
+            raise RenderWorkerError("Renderer worker did not start in time")
+        
+        try:
+            status, message, rss = parent_conn.recv()
+        except EOFError:
+            status, message, rss = "error", "Renderer worker exited during startup", 0
+        
+        if status != "ready":
+            worker.kill()
+            raise RenderWorkerError(message)
+        
+        worker.rss = rss
+        return worker
+    
+    def _replace(self, worker, kill=False):
+        """Retire `worker` and put a freshly started one in its place"""
+        if kill:
+            worker.kill()
+        else:
+            worker.stop()
+        
+        with self._lock:
+            self.stats["recycled"] += 1
+        
+        self._spawn_in_background()
+    
+    def _spawn_in_background(self):
+        """Start a worker off the request path and add it to the idle queue"""
+        def spawn():
+            error = None
+            for attempt in range(3):
+                if self._closed:
+                    return
+                try:
+                    worker = self._spawn()
+                except RenderWorkerError as e:
+                    error = e
+                    time.sleep(attempt + 1)
+                    continue
+                
+                if self._closed:
+                    worker.stop()
+                else:
+                    self._idle.put(worker)
+                return
+            
+            # The next job fails with the reason instead of waiting it out
+            self._idle.put(_FailedStart(str(error)))
+        
+        threading.Thread(target=spawn, daemon=True).start()
+    
+    def _release(self, worker):
+        if self._closed:
+            worker.stop()
+        elif worker.jobs >= self.max_jobs or worker.rss > self.max_rss:
+            self._replace(worker)
+        else:
+            self._idle.put(worker)
+    
+    @property
+    def queue_depth(self):
+        """Number of jobs waiting for a free worker"""
+        return self._waiting
+    
+    def submit(self, diagram_code, output_format="svg", options=None, timeout=None):
+        """Render on the next free worker and return the output bytes"""
+        if self._closed:
+            raise RenderWorkerError("Render pool is closed")
+        
+        timeout = float(timeout or self.timeout)
+        deadline = time.monotonic() + timeout
+        
+        with self._lock:
+            self._waiting += 1
+        
+        try:
+            worker = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            with self._lock:
+                self.stats["timeouts"] += 1
+            raise RenderTimeoutError("No renderer worker became available in time")
+        finally:
+            with self._lock:
+                self._waiting -= 1
+        
+        if isinstance(worker, _FailedStart):
+            # Try again for later jobs, e.g. once the renderer is installed
+            self._spawn_in_background()
+            raise RenderWorkerStartError(worker.message)
+        
+        started = time.monotonic()
+        try:
+            worker.conn.send((diagram_code, output_format, options or {}))
+            
+            if not worker.conn.poll(max(deadline - time.monotonic(), 0)):
+                with self._lock:
+                    self.stats["timeouts"] += 1
+                self._replace(worker, kill=True)
+                raise RenderTimeoutError(f"Rendering did not finish within {timeout:g}s")
+            
+            status, payload, rss = worker.conn.recv()
+        except (EOFError, OSError):
+            with self._lock:
+                self.stats["errors"] += 1
+            self._replace(worker, kill=True)
+            raise RenderWorkerError("Renderer worker exited unexpectedly")
+        
+        worker.jobs += 1
+        worker.rss = rss
+        self._release(worker)
+        
+        with self._lock:
+            self.stats["jobs"] += 1
+            self.stats["render_time"] += time.monotonic() - started
+            if status != "ok":
+                self.stats["errors"] += 1
+        
+        if status != "ok":
+            raise RenderWorkerError(payload)
+        
+        return payload
+    
+    def get_stats(self):
+        """Counters and gauges for this process's pool"""
+        with self._lock:
+            stats = dict(self.stats)
+        
+        stats.update({
+            "renderer": self.renderer,
+            "size": self.size,
+            "idle_workers": self._idle.qsize(),
+            "queue_depth": self.queue_depth,
+            "avg_render_time": stats["render_time"] / stats["jobs"] if stats["jobs"] else 0,
+            "pid": os.getpid()
+        })
+        
+        return stats
+    
+    def close(self):
+        """Stop all idle workers; busy workers are stopped when they finish"""
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().stop()
+            except queue.Empty:
+                break
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(renderer, renderer_options=None, **pool_options):
+    """Return the process-wide pool for this renderer configuration, starting it if needed"""
+    key = (renderer, repr(sorted((renderer_options or {}).items())), repr(sorted(pool_options.items())))
+    
+    with _pools_lock:
+        pool = _pools.get(key)
+        if not pool:
+            pool = _pools[key] = RenderPool(renderer, renderer_options, **pool_options)
+    
+    # Workers boot in the background, so neither the lock nor the request
+    # that created the pool waits for a browser to launch
+    pool.start()
+    return pool
+
+def close_all():
+    """Stop every pool started in this process"""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+atexit.register(close_all)
@@ -0,0 +1,98 @@
+import frappe
+from frappe.utils import cint, now
+
+# Views and renders of diagrams are counted in a Redis hash instead of
+# saving the Diagram each time, which would bump `modified`, run validation
+# and hooks and could create a version. A scheduler job moves the buffer
+# aside and writes view_count and last_rendered of all diagrams in bulk.
+
+STATS_KEY = "mermaid_render_stats"
+FLUSHING_KEY = "mermaid_render_stats_flushing"
+
+# Diagrams updated per UPDATE statement
+BATCH_SIZE = 500
+
+def record_view(diagram_name):
+    """Count a view of a diagram"""
+    cache = frappe.cache()
+    cache.hincrby(_key(STATS_KEY), f"{diagram_name}|views", 1)
+
+def record_render(diagram_name):
+    """Remember that a diagram was just rendered"""
+    # The pipeline skips the pickling hset of frappe.cache()
+    pipeline = frappe.cache().pipeline()
+    pipeline.hset(_key(STATS_KEY), f"{diagram_name}|rendered", now())
+    pipeline.execute()
+
+def flush():
+    """Write the buffered views and render times to the Diagrams"""
+    cache = frappe.cache()
+    stats_key, flushing_key = _key(STATS_KEY), _key(FLUSHING_KEY)
+    
+    # Take the whole buffer at once, new records start a fresh one. A buffer
+    # left over by a failed run is written first. RedisWrapper.exists adds
+    # the site prefix itself.
+    if not cache.exists(FLUSHING_KEY):
+        if not cache.exists(STATS_KEY):
+            return
+        
+        cache.rename(stats_key, flushing_key)
+    
+    pipeline = cache.pipeline()
+    pipeline.hgetall(flushing_key)
+    (buffered,) = pipeline.execute()
+    
+    stats = {}
+    for field, value in buffered.items():
+        diagram_name, stat = _decode(field).rsplit("|", 1)
+        stats.setdefault(diagram_name, {})[stat] = _decode(value)
+    
+    names = list(stats)
+    try:
+        for start in range(0, len(names), BATCH_SIZE):
+            _update_diagrams({name: stats[name] for name in names[start:start + BATCH_SIZE]})
+        
+        frappe.db.commit()
+    except Exception as e:
+        frappe.db.rollback()
+        frappe.log_error(f"Error writing diagram render stats: {str(e)}", "Diagram Render Stats Error")
+        return
+    
+    cache.delete(flushing_key)
+
+def _update_diagrams(stats):
+    """One UPDATE for a batch of {diagram: {"views": n, "rendered": timestamp}}"""
+    values = {"names": tuple(stats)}
+    view_cases, render_cases = [], []
+    
+    for i, (diagram_name, stat) in enumerate(stats.items()):
+        values[f"name_{i}"] = diagram_name
+        
+        if cint(stat.get("views")):
+            values[f"views_{i}"] = cint(stat["views"])
+            view_cases.append(f"WHEN %(name_{i})s THEN %(views_{i})s")
+        
+        if stat.get("rendered"):
+            values[f"rendered_{i}"] = stat["rendered"]
+            render_cases.append(f"WHEN %(name_{i})s THEN %(rendered_{i})s")
+    
+    # Plain SQL: neither counts as an edit, so `modified` is left alone
+    assignments = []
+    if view_cases:
+        assignments.append(f"view_count = view_count + CASE name {' '.join(view_cases)} ELSE 0 END")
+    
+    if render_cases:
+        assignments.append(f"last_rendered = CASE name {' '.join(render_cases)} ELSE last_rendered END")
+    
+    if assignments:
+        frappe.db.sql(f"""
+            UPDATE `tabDiagram`
+            SET {', '.join(assignments)}
+            WHERE name IN %(names)s
+        """, values)
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+def _key(key):
+    return frappe.cache().make_key(key)
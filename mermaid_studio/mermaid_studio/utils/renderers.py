@@ -0,0 +1,198 @@
+import json
+import os
+import subprocess
+import tempfile
+import time
+
+# Renderers run inside pool worker processes (see render_pool) which have no
+# Frappe site context, so everything they need is passed in as options.
+#
+# Diagram code and render settings come from users. Mermaid is always run
+# with securityLevel "strict", whatever the settings ask for, so labels
+# cannot carry scripts or click handlers into the rendered output.
+
+RENDERER_ALIASES = {
+    "cli": "mermaid_studio.mermaid_studio.utils.renderers.CLIRenderer",
+    "playwright": "mermaid_studio.mermaid_studio.utils.renderers.PlaywrightRenderer",
+    "stub": "mermaid_studio.mermaid_studio.utils.renderers.StubRenderer",
+}
+
+class Renderer:
+    """Base class for diagram renderers
+    
+    `start` is called once when a worker process boots so expensive setup
+    (launching a browser) is paid before the first job, `render` once per job
+    and `stop` when the worker is recycled.
+    """
+    
+    formats = ("svg", "png", "pdf")
+    
+    def __init__(self, **options):
+        self.options = options
+    
+    def start(self):
+        pass
+    
+    def render(self, diagram_code, output_format="svg", options=None):
+        raise NotImplementedError
+    
+    def stop(self):
+        pass
+
+def get_mermaid_config(options):
+    """Mermaid configuration of a job with the security level forced to strict"""
+    config = dict(options.get("mermaidConfig") or {})
+    if options.get("theme"):
+        config["theme"] = options["theme"]
+    
+    config["securityLevel"] = "strict"
+    return config
+
+class StubRenderer(Renderer):
+    """Renderer that fabricates output without a browser, for tests and benchmarks"""
+    
+    def render(self, diagram_code, output_format="svg", options=None):
+        delay = float(self.options.get("delay") or 0)
+        if delay:
+            time.sleep(delay)
+        
+        if "%%stub:fail" in (diagram_code or ""):
+            raise ValueError("Stub render failure")
+        
+        if output_format == "svg":
+            return f'<svg xmlns="http://www.w3.org/2000/svg"><!-- {len(diagram_code or "")} --></svg>'.encode()
+        
+        return f"{output_format}:{len(diagram_code or '')}".encode()
+
+class CLIRenderer(Renderer):
+    """Renderer backed by mermaid-cli (mmdc)
+    
+    mmdc launches its own browser on every call, so this renderer mainly
+    bounds concurrency; PlaywrightRenderer keeps a warm browser instead.
+    """
+    
+    def render(self, diagram_code, output_format="svg", options=None):
+        options = options or {}
+        cli_path = self.options.get("cli_path") or "mmdc"
+        
+        with tempfile.TemporaryDirectory(prefix="mermaid_") as temp_dir:
+            input_path = os.path.join(temp_dir, "diagram.mmd")
+            output_path = os.path.join(temp_dir, f"diagram.{output_format}")
+            
+            with open(input_path, "w", encoding="utf-8") as f:
+                f.write(diagram_code or "")
+            
+            command = [cli_path, "--quiet", "-i", input_path, "-o", output_path]
+            
+            if options.get("backgroundColor"):
+                command += ["-b", options["backgroundColor"]]
+            
+            if options.get("width"):
+                command += ["-w", str(options["width"])]
+            
+            if options.get("height"):
+                command += ["-H", str(options["height"])]
+            
+            if options.get("scale"):
+                command += ["-s", str(options["scale"])]
+            
+            config_path = os.path.join(temp_dir, "config.json")
+            with open(config_path, "w", encoding="utf-8") as f:
+                json.dump(get_mermaid_config(options), f)
+            command += ["-c", config_path]
+            
+            result = subprocess.run(
+                command,
+                capture_output=True,
+                text=True,
+                timeout=self.options.get("timeout")
+            )
+            
+            if result.returncode != 0 or not os.path.exists(output_path):
+                raise RuntimeError(result.stderr.strip() or "Rendering failed")
+            
+            with open(output_path, "rb") as f:
+                return f.read()
+
+class PlaywrightRenderer(Renderer):
+    """Renderer that keeps a headless Chromium with mermaid.js loaded between jobs
+    
+    mermaid.js is read from `mermaid_js_path`, the copy installed with the
+    app, so rendering does not depend on a CDN. `mermaid_js_url` loads it
+    from elsewhere instead when explicitly configured. Chromium keeps its
+    sandbox.
+    """
+    
+    page_html = """<!DOCTYPE html>
+<html><head></head>
+<body style="margin:0"><div id="container"></div></body></html>"""
+    
+    render_js = """async ([code, config, id]) => {
+        mermaid.initialize(Object.assign({startOnLoad: false}, config));
+        const { svg } = await mermaid.render(id, code);
+        return svg;
+    }"""
+    
+    def start(self):
+        from playwright.sync_api import sync_playwright
+        
+        self._playwright = sync_playwright().start()
+        self._browser = self._playwright.chromium.launch()
+        self._pages = {}
+        self._render_count = 0
+        
+        # Load the default page now so the first job does not pay for it
+        self._get_page(float(self.options.get("scale") or 2))
+    
+    def _get_page(self, scale):
+        if scale not in self._pages:
+            page = self._browser.new_page(device_scale_factor=scale)
+            page.set_content(self.page_html, wait_until="load")
+            
+            if self.options.get("mermaid_js_url"):
+                page.add_script_tag(url=self.options["mermaid_js_url"])
+            else:
+                page.add_script_tag(path=self.options["mermaid_js_path"])
+            
+            page.wait_for_function("window.mermaid !== undefined")
+            self._pages[scale] = page
+        
+        return self._pages[scale]
+    
+    def render(self, diagram_code, output_format="svg", options=None):
+        options = options or {}
+        page = self._get_page(float(options.get("scale") or self.options.get("scale") or 2))
+        
+        config = get_mermaid_config(options)
+        
+        self._render_count += 1
+        svg = page.evaluate(self.render_js, [diagram_code, config, f"diagram{self._render_count}"])
+        
+        if output_format == "svg":
+            return svg.encode("utf-8")
+        
+        page.set_viewport_size({
+            "width": int(options.get("width") or 800),
+            "height": int(options.get("height") or 600)
+        })
+        page.evaluate(
+            "([svg, background]) => {"
+            " const container = document.getElementById('container');"
+            " container.innerHTML = svg;"
+            " document.body.style.background = background || 'white'; }",
+            [svg, options.get("backgroundColor")]
+        )
+        
+        if output_format == "png":
+            return page.locator("#container svg").screenshot()
+        
+        if output_format == "pdf":
+            return page.pdf(print_background=True)
+        
+        raise ValueError(f"Unsupported output format: {output_format}")
+    
+    def stop(self):
+        try:
+            self._browser.close()
+        finally:
+            self._playwright.stop()
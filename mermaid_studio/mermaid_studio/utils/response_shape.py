@@ -0,0 +1,42 @@
+import frappe
+from frappe import _
+
+# What the diagram APIs send back. "full" is the whole document; the lean
+# shapes are fixed projections that never carry diagram_code, the tags table
+# or the JSON settings, so saves and lists stay small on large diagrams.
+SHAPES = {
+    "minimal": ["name", "version", "modified"],
+    "summary": ["name", "title", "diagram_type", "status", "folder", "is_public", "is_template",
+                "owner", "version", "modified", "thumbnail"],
+}
+
+def get_shape_fields(shape):
+    """Fields of a lean response shape"""
+    if shape not in SHAPES:
+        frappe.throw(_("Invalid response shape: {0}").format(shape))
+    
+    return SHAPES[shape]
+
+def shape_diagram(diagram, shape="full"):
+    """The diagram document, or a dict with only the fields of a lean shape"""
+    if shape == "full":
+        return diagram
+    
+    return {field: diagram.get(field) for field in get_shape_fields(shape)}
+
+def project_fields(fields, shape="summary"):
+    """Requested list fields, which must all belong to a shape, or all of its fields if none are requested"""
+    try:
+        fields = frappe.parse_json(fields) if fields else []
+    except ValueError:
+        fields = None
+    
+    if not isinstance(fields, list) or not all(isinstance(field, str) for field in fields):
+        frappe.throw(_("Fields must be a list of field names"))
+    
+    allowed = get_shape_fields(shape)
+    disallowed = [field for field in fields if field not in allowed]
+    if disallowed:
+        frappe.throw(_("Fields not available in list responses: {0}").format(", ".join(disallowed)))
+    
+    return fields or allowed
@@ -0,0 +1,177 @@
+import frappe
+import re
+from collections import Counter
+from frappe.utils import strip_html
+
+from mermaid_studio.mermaid_studio.utils.diagram_type import detect_diagram_type
+from mermaid_studio.mermaid_studio.utils.flowchart import parse_flowchart
+
+# Diagrams are searched through a token index (Diagram Search Token) instead
+# of LIKE '%text%' over title, description and diagram_code. Every diagram
+# keeps one row per distinct word, weighted by where the word appears. Query
+# words match indexed words by prefix, so each one is an index range scan,
+# and diagrams are ranked by the summed weight of their best match for every
+# query word. Filters on the diagrams are applied inside every word's scan,
+# so the matches of diagrams that are filtered out are never aggregated. The
+# index is updated when a diagram is saved.
+
+SOURCE_WEIGHTS = {
+    "title": 10,
+    "tag": 8,
+    "node": 5,
+    "description": 3,
+    "code": 1
+}
+
+# Repeating a word in the same place adds weight only up to this count
+MAX_OCCURRENCES = 3
+
+MIN_TOKEN_LENGTH = 2
+MAX_TOKEN_LENGTH = 64
+MAX_QUERY_TOKENS = 6
+
+# Words matched exactly rank above words that only start with the query word
+EXACT_MATCH_FACTOR = 2
+
+# Shorter query words only match indexed words exactly; as prefixes they
+# would match a large part of the index
+MIN_PREFIX_LENGTH = 3
+
+# Mermaid syntax that appears in most diagrams and says nothing about them
+CODE_STOP_WORDS = {
+    "graph", "flowchart", "td", "tb", "bt", "lr", "rl", "subgraph", "end",
+    "direction", "classdef", "class", "style", "linkstyle", "click", "fill",
+    "stroke", "width", "color", "px", "participant", "actor", "note", "over",
+    "of", "left", "right", "loop", "alt", "else", "opt", "par", "and",
+    "activate", "deactivate", "section", "title", "dateformat", "state"
+}
+
+SEARCH_FILTER_FIELDS = ("owner", "folder", "is_template", "is_public", "diagram_type", "status")
+
+_WORD = re.compile(r"\w+")
+
+def tokenize(text):
+    """Lowercase words of a text that are worth indexing"""
+    return [
+        word for word in _WORD.findall((text or "").lower())
+        if MIN_TOKEN_LENGTH <= len(word) <= MAX_TOKEN_LENGTH
+    ]
+
+def get_diagram_tokens(diagram):
+    """{token: weight} for a Diagram document"""
+    weights = Counter()
+    
+    def add(source, words):
+        for word, count in Counter(words).items():
+            weights[word] += SOURCE_WEIGHTS[source] * min(count, MAX_OCCURRENCES)
+    
+    code = diagram.diagram_code or ""
+    
+    add("title", tokenize(diagram.title))
+    add("description", tokenize(strip_html(diagram.description or "")))
+    add("tag", [word for row in diagram.get("tags") or [] for word in tokenize(row.tag)])
+    
+    if detect_diagram_type(code) == "flowchart":
+        nodes, _edges = parse_flowchart(code)
+        add("node", [word for label in nodes.values() for word in tokenize(label)])
+    
+    add("code", [word for word in tokenize(code) if word not in CODE_STOP_WORDS])
+    
+    return dict(weights)
+
+def is_index_stale(diagram):
+    """Whether a save changed anything the search index is built from"""
+    previous = diagram.get_doc_before_save()
+    if not previous:
+        return True
+    
+    if any(diagram.has_value_changed(field) for field in ("title", "description", "diagram_code")):
+        return True
+    
+    return [row.tag for row in previous.get("tags") or []] != [row.tag for row in diagram.get("tags") or []]
+
+def update_diagram_index(diagram):
+    """Bring a diagram's index rows in line with its current content"""
+    tokens = get_diagram_tokens(diagram)
+    existing = dict(frappe.get_all(
+        "Diagram Search Token",
+        filters={"diagram": diagram.name},
+        fields=["token", "weight"],
+        as_list=True
+    ))
+    
+    # Only rows whose weight changed are rewritten
+    stale = [token for token, weight in existing.items() if tokens.get(token) != weight]
+    added = [token for token, weight in tokens.items() if existing.get(token) != weight]
+    
+    if stale:
+        frappe.db.delete("Diagram Search Token", {"diagram": diagram.name, "token": ["in", stale]})
+    
+    if added:
+        now = frappe.utils.now()
+        frappe.db.bulk_insert(
+            "Diagram Search Token",
+            fields=["name", "diagram", "token", "weight", "creation", "modified"],
+            values=[
+                (frappe.generate_hash(length=12), diagram.name, token, tokens[token], now, now)
+                for token in added
+            ]
+        )
+
+def remove_diagram_index(diagram_name):
+    frappe.db.delete("Diagram Search Token", {"diagram": diagram_name})
+
+def search_diagrams(search_text, filters=None, fields=None, limit=20, start=0):
+    """Diagrams matching every word of `search_text`, best match first
+    
+    `filters` is a dict of equality conditions on SEARCH_FILTER_FIELDS.
+    Each result carries its `search_score`.
+    """
+    terms = list(dict.fromkeys(tokenize(search_text)))[:MAX_QUERY_TOKENS]
+    if not terms:
+        return []
+    
+    fields = fields or ["name", "title", "modified"]
+    values = {"limit": int(limit), "start": int(start)}
+    
+    filter_fields = []
+    for field, value in (filters or {}).items():
+        if field not in SEARCH_FILTER_FIELDS:
+            frappe.throw(frappe._("Cannot filter search results by {0}").format(field))
+        
+        filter_fields.append(field)
+        values[f"filter_{field}"] = value
+    
+    # Each word's matches are restricted to the filtered diagrams before they
+    # are grouped, instead of grouping the matches of every diagram
+    scope_join = "JOIN `tabDiagram` scope ON scope.name = search_token.diagram" if filter_fields else ""
+    scope_conditions = "".join(f" AND scope.`{field}` = %(filter_{field})s" for field in filter_fields)
+    
+    joins = []
+    for index, term in enumerate(terms):
+        values[f"term_{index}"] = term
+        if len(term) >= MIN_PREFIX_LENGTH:
+            values[f"prefix_{index}"] = term.replace("\\", "\\\\").replace("_", "\\_") + "%"
+            token_condition = f"search_token.token LIKE %(prefix_{index})s"
+        else:
+            token_condition = f"search_token.token = %(term_{index})s"
+        
+        joins.append(f"""
+            JOIN (
+                SELECT search_token.diagram, MAX(CASE WHEN search_token.token = %(term_{index})s
+                    THEN search_token.weight * {EXACT_MATCH_FACTOR} ELSE search_token.weight END) AS weight
+                FROM `tabDiagram Search Token` search_token
+                {scope_join}
+                WHERE {token_condition}{scope_conditions}
+                GROUP BY search_token.diagram
+            ) match_{index} ON match_{index}.diagram = diagram.name""")
+    
+    score = " + ".join(f"match_{index}.weight" for index in range(len(terms)))
+    
+    return frappe.db.sql(f"""
+        SELECT {', '.join(f'diagram.`{field}`' for field in fields)}, {score} AS search_score
+        FROM `tabDiagram` diagram
+        {''.join(joins)}
+        ORDER BY search_score DESC, diagram.modified DESC
+        LIMIT %(limit)s OFFSET %(start)s
+    """, values, as_dict=True)
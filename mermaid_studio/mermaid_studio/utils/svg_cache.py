@@ -0,0 +1,149 @@
+import frappe
+import hashlib
+import json
+import os
+
+from mermaid_studio.mermaid_studio.utils import counters
+
+CACHE_DIR = "mermaid_svg_cache"
+STATS_KEY = "mermaid_svg_cache_stats"
+STATS_FIELDS = ("hits", "misses", "evictions", "bytes")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Eviction trims the cache down to this fraction of the limit so that a
+# cache sitting at its limit does not evict on every single store
+EVICTION_TARGET = 0.9
+
+def get_cache_dir():
+    """Directory holding cached SVG files"""
+    path = frappe.get_site_path("private", CACHE_DIR)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def get_max_bytes():
+    """Upper bound for the total size of the cache on disk"""
+    return int(frappe.conf.get("mermaid_svg_cache_max_bytes") or DEFAULT_MAX_BYTES)
+
+def get_cache_key(diagram_code, render_settings=None, mermaid_version=None):
+    """Content address for a render of `diagram_code` with the given settings"""
+    if isinstance(render_settings, str):
+        try:
+            render_settings = json.loads(render_settings) if render_settings else None
+        except ValueError:
+            pass
+    
+    payload = json.dumps(
+        [diagram_code or "", render_settings or {}, mermaid_version or ""],
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str
+    )
+    
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def get_cache_path(key):
+    """Path of the cache entry for `key`, sharded by the first two hex digits"""
+    return os.path.join(get_cache_dir(), key[:2], f"{key}.svg")
+
+def get(key):
+    """Return cached SVG bytes for `key` or None"""
+    path = get_cache_path(key)
+    
+    try:
+        with open(path, "rb") as f:
+            svg = f.read()
+    except FileNotFoundError:
+        _incr_stat("misses")
+        return None
+    
+    # Touch the entry so eviction treats it as recently used
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    
+    _incr_stat("hits")
+    return svg
+
+def put(key, svg):
+    """Store SVG bytes under `key` and evict old entries if over the size limit"""
+    if isinstance(svg, str):
+        svg = svg.encode("utf-8")
+    
+    path = get_cache_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    
+    # Write to a temporary file first so readers never see a partial entry
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(svg)
+    
+    # An overwritten entry no longer counts towards the cache size
+    try:
+        replaced = os.path.getsize(path)
+    except FileNotFoundError:
+        replaced = 0
+    os.replace(temp_path, path)
+    
+    total = _incr_stat("bytes", len(svg) - replaced)
+    if total > get_max_bytes():
+        evict()
+
+def evict(max_bytes=None):
+    """Remove least recently used entries until the cache fits its size budget"""
+    max_bytes = get_max_bytes() if max_bytes is None else max_bytes
+    target = int(max_bytes * EVICTION_TARGET)
+    
+    entries = []
+    total = 0
+    for shard in os.scandir(get_cache_dir()):
+        if not shard.is_dir():
+            continue
+        
+        for entry in os.scandir(shard.path):
+            if not entry.name.endswith(".svg"):
+                continue
+            
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+    
+    evicted = 0
+    if total > max_bytes:
+        entries.sort()
+        for _mtime, size, path in entries:
+            if total <= target:
+                break
+            
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            
+            total -= size
+            evicted += 1
+    
+    # Resync the byte counter with what is actually on disk
+    counters.set_value(STATS_KEY, "bytes", total)
+    if evicted:
+        _incr_stat("evictions", evicted)
+    
+    return evicted
+
+def clear():
+    """Remove every cached entry and reset the counters"""
+    evict(max_bytes=0)
+    counters.reset(STATS_KEY, STATS_FIELDS)
+
+def get_stats():
+    """Hit/miss counters and current size of the cache"""
+    stats = counters.get_values(STATS_KEY, STATS_FIELDS)
+    lookups = stats["hits"] + stats["misses"]
+    
+    stats["hit_rate"] = stats["hits"] / lookups if lookups else 0
+    stats["max_bytes"] = get_max_bytes()
+    
+    return stats
+
+def _incr_stat(field, amount=1):
+    return counters.incr(STATS_KEY, field, amount)
@@ -0,0 +1,112 @@
+import frappe
+import time
+from collections import OrderedDict
+
+# Collaboration endpoints need the name, avatar and colour of users on every
+# heartbeat and cursor move. Profiles are cached per process and site for a
+# short TTL in front of a Redis hash that is cleared when the User changes,
+# so the hot paths never query the User table.
+
+PROFILE_CACHE_KEY = "mermaid_user_profiles"
+
+# Other processes may show a stale profile for at most this many seconds
+# after the user is updated
+LOCAL_TTL = 60
+
+# Profiles kept per process across all sites; the least recently used go first
+LOCAL_MAX_PROFILES = 1000
+
+# Same palette and hash as getUserColor in CollaborationIndicator.vue
+USER_COLORS = (
+    "#3b82f6", "#ef4444", "#10b981", "#f59e0b", "#8b5cf6",
+    "#ec4899", "#14b8a6", "#f97316", "#6366f1", "#84cc16"
+)
+
+# (site, user) -> (expires, profile)
+_local_profiles = OrderedDict()
+
+def get_user_profile(user=None):
+    """Cached profile of a user: user, full_name, user_image and color"""
+    user = user or frappe.session.user
+    return get_user_profiles([user])[user]
+
+def get_user_profiles(users):
+    """Cached profiles of several users, by user; loads all misses in one query"""
+    now = time.monotonic()
+    site = frappe.local.site
+    profiles = {}
+    missing = []
+    
+    for user in users:
+        cached = _local_profiles.get((site, user))
+        if cached and cached[0] > now:
+            _local_profiles.move_to_end((site, user))
+            profiles[user] = cached[1]
+        else:
+            missing.append(user)
+    
+    if not missing:
+        return profiles
+    
+    cache = frappe.cache()
+    not_in_redis = []
+    for user in missing:
+        profile = cache.hget(PROFILE_CACHE_KEY, user)
+        if profile:
+            profiles[user] = profile
+        else:
+            not_in_redis.append(user)
+    
+    for profile in _load_profiles(not_in_redis):
+        cache.hset(PROFILE_CACHE_KEY, profile["user"], profile)
+        profiles[profile["user"]] = profile
+    
+    for user in missing:
+        if user in profiles:
+            _local_profiles[(site, user)] = (now + LOCAL_TTL, profiles[user])
+            _local_profiles.move_to_end((site, user))
+        else:
+            # Unknown users (e.g. deleted) get a bare profile, not cached
+            profiles[user] = _make_profile(user)
+    
+    while len(_local_profiles) > LOCAL_MAX_PROFILES:
+        _local_profiles.popitem(last=False)
+    
+    return profiles
+
+def clear_user_profile(doc, method=None):
+    """Drop a user's cached profile; hooked to User on_update and on_trash"""
+    frappe.cache().hdel(PROFILE_CACHE_KEY, doc.name)
+    _local_profiles.pop((frappe.local.site, doc.name), None)
+
+def get_user_color(user):
+    """Stable avatar colour of a user, matching the frontend's getUserColor"""
+    value = 0
+    encoded = (user or "").encode("utf-16-le")
+    for index in range(0, len(encoded), 2):
+        value = ((value << 5) - value + int.from_bytes(encoded[index:index + 2], "little")) & 0xFFFFFFFF
+    
+    if value >= 0x80000000:
+        value -= 0x100000000
+    
+    return USER_COLORS[abs(value) % len(USER_COLORS)]
+
+def _load_profiles(users):
+    if not users:
+        return []
+    
+    rows = frappe.get_all(
+        "User",
+        filters={"name": ["in", users]},
+        fields=["name", "full_name", "user_image"]
+    )
+    
+    return [_make_profile(row.name, row.full_name, row.user_image) for row in rows]
+
+def _make_profile(user, full_name=None, user_image=None):
+    return {
+        "user": user,
+        "full_name": full_name or user,
+        "user_image": user_image,
+        "color": get_user_color(user)
+    }
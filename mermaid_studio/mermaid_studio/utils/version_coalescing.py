@@ -0,0 +1,150 @@
+import frappe
+import json
+import time
+
+# Saves of a diagram that change its code within the coalescing window are
+# folded into one pending "working" version kept in Redis. The pending
+# version becomes a durable Diagram Version row when the diagram has been
+# idle for the window, on an explicit checkpoint, when the editing session
+# ends, or when another user starts changing the code.
+#
+# Diagram.version still counts every save that changes the code. A
+# Diagram Version row takes the number of the last save folded into it, so
+# row numbers have gaps where saves were coalesced.
+#
+# A flush claims the diagram by taking it out of the due index, but leaves
+# the pending version in Redis until the new row is committed. If the
+# transaction rolls back the diagram goes back into the index, so the work
+# is flushed again later instead of being lost.
+
+PENDING_KEY = "mermaid_pending_version:{0}"
+DUE_INDEX_KEY = "mermaid_pending_versions"
+PENDING_TTL = 7 * 24 * 60 * 60
+DEFAULT_WINDOW = 120
+
+# KEYS: due index, pending version. ARGV: diagram name.
+# The pending version if this caller removed the diagram from the index,
+# "" if it did but nothing is pending any more, nil if another caller did.
+_CLAIM_SCRIPT = """
+if redis.call('zrem', KEYS[1], ARGV[1]) == 0 then
+    return false
+end
+return redis.call('get', KEYS[2]) or ''
+"""
+
+# ARGV: diagram name, due time. Puts a claimed diagram back in the index
+# unless its pending version is gone.
+_RELEASE_SCRIPT = """
+if redis.call('exists', KEYS[2]) == 1 then
+    return redis.call('zadd', KEYS[1], 'NX', ARGV[2], ARGV[1])
+end
+return 0
+"""
+
+# ARGV: diagram name, flushed pending version. Keeps a pending version that
+# a newer change has replaced since the flush.
+_DROP_SCRIPT = """
+if redis.call('get', KEYS[2]) == ARGV[2] then
+    return redis.call('del', KEYS[2])
+end
+return 0
+"""
+
+def get_coalesce_window(diagram):
+    """Seconds of inactivity after which pending changes become a version
+    
+    Read from the diagram's collaboration settings, falling back to the
+    site config. 0 disables coalescing.
+    """
+    window = diagram.get_collaboration_setting("version_coalesce_seconds")
+    if window is None:
+        window = frappe.conf.get("mermaid_version_coalesce_seconds")
+    
+    return DEFAULT_WINDOW if window is None else int(window)
+
+def get_pending_version(diagram_name):
+    """The pending working version of a diagram, or None"""
+    value = frappe.cache().get(_key(PENDING_KEY.format(diagram_name)))
+    return frappe._dict(json.loads(value)) if value else None
+
+def record_change(diagram, window, previous_code=None):
+    """Fold a code change of `diagram` into its pending working version"""
+    user = frappe.session.user
+    now = time.time()
+    pending = get_pending_version(diagram.name)
+    
+    if pending and pending.user != user:
+        # Keep the other user's work as its own version before taking over
+        flush_pending_version(diagram.name, code=previous_code)
+        pending = None
+    
+    pending = {
+        "user": user,
+        "first_change": pending.first_change if pending else now,
+        "last_change": now,
+        "saves": (pending.saves if pending else 0) + 1,
+        "version": diagram.version
+    }
+    
+    cache = frappe.cache()
+    cache.set(_key(PENDING_KEY.format(diagram.name)), json.dumps(pending), ex=PENDING_TTL)
+    cache.zadd(_key(DUE_INDEX_KEY), {diagram.name: now + window})
+
+def flush_pending_version(diagram_name, code=None, change_notes=None):
+    """Turn the pending working version into a Diagram Version row
+    
+    `code` defaults to the diagram's current code. Returns the new version
+    name, or None when nothing was pending or another worker flushed it.
+    """
+    # Only the caller that removes the diagram from the index may flush it
+    value = _run(_CLAIM_SCRIPT, diagram_name)
+    if not value:
+        # Claimed by another worker, or an index entry whose pending version
+        # has expired; either way there is nothing to write here
+        return None
+    
+    pending = json.loads(value)
+    
+    frappe.db.after_commit.add(lambda: _run(_DROP_SCRIPT, diagram_name, value))
+    frappe.db.after_rollback.add(lambda: _run(_RELEASE_SCRIPT, diagram_name, time.time()))
+    
+    diagram = frappe.get_doc("Diagram", diagram_name)
+    return diagram.create_version_history(
+        code=code,
+        user=pending.get("user"),
+        change_notes=change_notes,
+        version_number=pending.get("version")
+    )
+
+def flush_due_versions():
+    """Flush every pending version whose diagram has been idle for its window"""
+    cache = frappe.cache()
+    due = cache.zrangebyscore(_key(DUE_INDEX_KEY), "-inf", time.time())
+    
+    for diagram_name in due:
+        diagram_name = diagram_name.decode() if isinstance(diagram_name, bytes) else diagram_name
+        
+        try:
+            if frappe.db.exists("Diagram", diagram_name):
+                flush_pending_version(diagram_name)
+            else:
+                discard_pending_version(diagram_name)
+            
+            frappe.db.commit()
+        except Exception as e:
+            frappe.db.rollback()
+            frappe.log_error(f"Error flushing pending version of {diagram_name}: {str(e)}", "Diagram Version Error")
+
+def discard_pending_version(diagram_name):
+    """Drop the pending working version of a diagram, e.g. when it is deleted"""
+    cache = frappe.cache()
+    cache.zrem(_key(DUE_INDEX_KEY), diagram_name)
+    cache.delete(_key(PENDING_KEY.format(diagram_name)))
+
+def _run(script, diagram_name, *args):
+    cache = frappe.cache()
+    keys = [_key(DUE_INDEX_KEY), _key(PENDING_KEY.format(diagram_name))]
+    return cache.register_script(script)(keys=keys, args=[diagram_name, *args])
+
+def _key(key):
+    return frappe.cache().make_key(key)
@@ -0,0 +1,84 @@
+import json
+
+from mermaid_studio.mermaid_studio.utils.diff import get_opcodes
+
+# A delta is a JSON list of line operations applied to the base text in order:
+#   n (positive int)  copy the next n lines of the base
+#   -n (negative int) skip the next n lines of the base
+#   [lines]           insert these lines
+# Lines keep their line endings so reconstruction is byte-for-byte exact.
+
+DEFAULT_SNAPSHOT_INTERVAL = 20
+
+def split_lines(text):
+    return (text or "").splitlines(keepends=True)
+
+def make_delta(old, new):
+    """Compute the line-level delta turning `old` into `new`"""
+    old_lines = split_lines(old)
+    new_lines = split_lines(new)
+    
+    ops = []
+    for tag, i1, i2, j1, j2 in get_opcodes(old_lines, new_lines):
+        if tag == "equal":
+            ops.append(i2 - i1)
+            continue
+        
+        if i2 > i1:
+            ops.append(i1 - i2)
+        
+        if j2 > j1:
+            ops.append(new_lines[j1:j2])
+    
+    return ops
+
+def apply_delta(old, delta):
+    """Rebuild the new text from `old` and a delta produced by make_delta"""
+    if isinstance(delta, str):
+        delta = json.loads(delta)
+    
+    old_lines = split_lines(old)
+    result = []
+    pos = 0
+    
+    for op in delta:
+        if isinstance(op, list):
+            result.extend(op)
+        elif op > 0:
+            result.extend(old_lines[pos:pos + op])
+            pos += op
+        else:
+            pos -= op
+    
+    return "".join(result)
+
+def get_storage_fields(code, base=None, interval=DEFAULT_SNAPSHOT_INTERVAL):
+    """Decide how to store `code` given the previous stored version
+    
+    `base` is a dict with `version_number`, `chain_length` and `code` of the
+    latest stored version, or None. Returns the Diagram Version field values:
+    a full snapshot every `interval` versions (or when a delta would not be
+    smaller), otherwise a delta against `base`.
+    """
+    full = {
+        "storage_type": "full",
+        "diagram_code": code,
+        "delta": None,
+        "base_version": None,
+        "chain_length": 0
+    }
+    
+    if not base or (base.get("chain_length") or 0) + 1 >= interval:
+        return full
+    
+    delta = json.dumps(make_delta(base["code"], code), separators=(",", ":"))
+    if len(delta) >= len(code or ""):
+        return full
+    
+    return {
+        "storage_type": "delta",
+        "diagram_code": None,
+        "delta": delta,
+        "base_version": base["version_number"],
+        "chain_length": (base.get("chain_length") or 0) + 1
+    }
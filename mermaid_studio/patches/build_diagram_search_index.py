@@ -0,0 +1,13 @@
+import frappe
+
+from mermaid_studio.mermaid_studio.utils.search import update_diagram_index
+
+def execute():
+    """Build the search token index for existing diagrams"""
+    for index, name in enumerate(frappe.get_all("Diagram", pluck="name", order_by="creation asc")):
+        update_diagram_index(frappe.get_doc("Diagram", name))
+        
+        if index % 500 == 499:
+            frappe.db.commit()
+    
+    frappe.db.commit()
@@ -0,0 +1,45 @@
+import frappe
+
+from mermaid_studio.mermaid_studio.doctype.diagram_version.diagram_version import get_snapshot_interval
+from mermaid_studio.mermaid_studio.utils.version_delta import apply_delta, get_storage_fields
+
+def execute():
+    """
+    Rewrite existing Diagram Version history as periodic full snapshots with
+    line-level deltas in between.
+    """
+    interval = get_snapshot_interval()
+    diagrams = frappe.db.sql_list("SELECT DISTINCT diagram FROM `tabDiagram Version`")
+    
+    for diagram in diagrams:
+        versions = frappe.get_all(
+            "Diagram Version",
+            filters={"diagram": diagram},
+            fields=["name", "version_number"],
+            order_by="version_number asc"
+        )
+        
+        base = None
+        for version in versions:
+            # Rows are loaded one at a time to keep memory flat on long histories
+            row = frappe.db.get_value(
+                "Diagram Version", version.name,
+                ["storage_type", "diagram_code", "delta"],
+                as_dict=True
+            )
+            
+            if row.storage_type == "delta":
+                code = apply_delta(base["code"], row.delta)
+            else:
+                code = row.diagram_code or ""
+            
+            fields = get_storage_fields(code, base, interval)
+            frappe.db.set_value("Diagram Version", version.name, fields, update_modified=False)
+            
+            base = {
+                "version_number": version.version_number,
+                "chain_length": fields["chain_length"],
+                "code": code
+            }
+        
+        frappe.db.commit()
@@ -0,0 +1,54 @@
+import frappe
+import json
+import re
+
+POSITION_MARKER = re.compile(r"<!-- POSITION: (.*?) -->")
+
+def execute():
+    """
+    Move diagram comments from Comment, where the position was appended to
+    the content as an HTML comment, to Diagram Comment.
+    """
+    comments = frappe.get_all(
+        "Comment",
+        filters={"reference_doctype": "Diagram", "comment_type": "Comment"},
+        fields=["name", "reference_name", "content", "owner", "creation", "modified"],
+        order_by="creation asc"
+    )
+    
+    for comment in comments:
+        if not frappe.db.exists("Diagram", comment.reference_name):
+            continue
+        
+        content = comment.content or ""
+        position = {}
+        match = POSITION_MARKER.search(content)
+        if match:
+            content = content.replace(match.group(0), "").strip()
+            try:
+                position = json.loads(match.group(1)) or {}
+            except ValueError:
+                position = {}
+        
+        doc = frappe.new_doc("Diagram Comment")
+        doc.diagram = comment.reference_name
+        doc.content = content or "-"
+        doc.node_id = position.get("node_id")
+        
+        if position.get("x") is not None and position.get("y") is not None:
+            doc.has_position = 1
+            doc.position_x = position["x"]
+            doc.position_y = position["y"]
+        
+        doc.insert(ignore_permissions=True)
+        
+        # Keep the original author and dates
+        frappe.db.set_value("Diagram Comment", doc.name, {
+            "owner": comment.owner,
+            "creation": comment.creation,
+            "modified": comment.modified
+        }, update_modified=False)
+        
+        frappe.delete_doc("Comment", comment.name, ignore_permissions=True)
+    
+    frappe.db.commit()
@@ -0,0 +1,7 @@
+import frappe
+from frappe.utils.nestedset import rebuild_tree
+
+def execute():
+    """Compute the nested set intervals of existing folders"""
+    rebuild_tree("Diagram Folder")
+    frappe.db.commit()
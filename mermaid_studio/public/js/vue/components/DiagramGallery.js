@@ -28,7 +28,7 @@ const DiagramGallery = {
     </div>
 
     <!-- No diagrams -->
-    <div v-else-if="diagrams.length === 0" class="bg-white rounded-lg border border-gray-200 p-6 text-center">
+    <div v-else-if="diagrams.length === 0 && !searchQuery && !typeFilter" class="bg-white rounded-lg border border-gray-200 p-6 text-center">
       <svg class="mx-auto h-12 w-12 text-gray-400" xmlns="http://www.w3.org/2000/svg" fill="none" viewBox="0 0 24 24" stroke="currentColor">
         <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M9.663 17h4.673M12 3v1m6.364 1.636l-.707.707M21 12h-1M4 12H3m3.343-5.657l-.707-.707m2.828 9.9a5 5 0 117.072 0l-.548.547A3.374 3.374 0 0014 18.469V19a2 2 0 11-4 0v-.531c0-.895-.356-1.754-.988-2.386l-.548-.547z" />
       </svg>
@@ -86,10 +86,15 @@ const DiagramGallery = {
         </div>
       </div>
 
+      <!-- No results -->
+      <p v-if="diagrams.length === 0" class="text-sm text-gray-500">
+        Try changing your search or filter criteria.
+      </p>
+
       <!-- Diagram grid -->
       <div class="grid grid-cols-1 sm:grid-cols-2 lg:grid-cols-3 gap-6">
         <div 
-          v-for="diagram in filteredDiagrams" 
+          v-for="diagram in diagrams" 
           :key="diagram.name" 
           class="bg-white rounded-lg border border-gray-200 overflow-hidden hover:shadow-md transition-shadow duration-200"
         >
@@ -98,10 +103,16 @@ const DiagramGallery = {
             <div v-if="diagram.thumbnail" class="w-full h-full flex items-center justify-center">
               <img :src="diagram.thumbnail" :alt="diagram.title" class="max-w-full max-h-full object-contain">
             </div>
-            <div v-else class="diagram-preview w-full h-full" :id="'diagram-' + diagram.name">
-              <div v-if="diagram.diagram_code" class="mermaid-preview">
-                {{ diagram.diagram_code }}
-              </div>
+            <div v-else class="diagram-preview w-full h-full">
+              <img 
+                v-if="!failedPreviews[diagram.name]" 
+                :src="getPreviewUrl(diagram)" 
+                :alt="diagram.title" 
+                loading="lazy" 
+                class="max-w-full max-h-full object-contain" 
+                @error="renderPreview(diagram)"
+              >
+              <div v-else-if="previewSvgs[diagram.name]" class="mermaid-preview" v-html="previewSvgs[diagram.name]"></div>
               <div v-else class="flex items-center justify-center h-full">
                 <svg class="w-12 h-12 text-gray-300" xmlns="http://www.w3.org/2000/svg" fill="none" viewBox="0 0 24 24" stroke="currentColor">
                   <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M4 5a1 1 0 011-1h14a1 1 0 011 1v2a1 1 0 01-1 1H5a1 1 0 01-1-1V5zM4 13a1 1 0 011-1h6a1 1 0 011 1v6a1 1 0 01-1 1H5a1 1 0 01-1-1v-6zM16 13a1 1 0 011-1h2a1 1 0 011 1v6a1 1 0 01-1 1h-2a1 1 0 01-1-1v-6z" />
@@ -145,6 +156,14 @@ const DiagramGallery = {
           </div>
         </div>
       </div>
+
+      <!-- Next page, loaded when it scrolls into view -->
+      <div v-if="nextCursor" ref="loadMoreTrigger" class="mt-8 flex justify-center">
+        <div v-if="loadingMore" class="animate-spin rounded-full h-8 w-8 border-t-2 border-b-2 border-purple-500"></div>
+        <button v-else @click="loadMoreDiagrams" class="btn btn-outline">
+          Load more
+        </button>
+      </div>
     </div>
   </div>
   `,
@@ -154,71 +173,74 @@ const DiagramGallery = {
       diagrams: [],
       loading: true,
       error: null,
+      failedPreviews: {},
+      previewSvgs: {},
+      pendingPreviews: [],
+      maxPreviewCodes: 100,
       searchQuery: '',
       typeFilter: '',
       sortBy: 'modified desc',
-      currentPage: 1,
-      pageSize: 9
+      nextCursor: null,
+      loadingMore: false,
+      pageSize: 24,
+      fetchCount: 0
     };
   },
   
-  computed: {
-    filteredDiagrams() {
-      let filtered = [...this.diagrams];
-      
-      // Apply search filter
-      if (this.searchQuery) {
-        const query = this.searchQuery.toLowerCase();
-        filtered = filtered.filter(d => 
-          (d.title && d.title.toLowerCase().includes(query)) || 
-          (d.name && d.name.toLowerCase().includes(query))
-        );
-      }
-      
-      // Apply type filter
-      if (this.typeFilter) {
-        filtered = filtered.filter(d => d.diagram_type === this.typeFilter);
+  mounted() {
+    // Infinite scroll: fetch the next page when the trigger scrolls into view
+    this.loadMoreObserver = new IntersectionObserver((entries) => {
+      if (entries.some(entry => entry.isIntersecting)) {
+        this.loadMoreDiagrams();
       }
-      
-      return filtered;
-    }
+    }, { rootMargin: '200px' });
+    
+    this.fetchDiagrams();
   },
   
-  mounted() {
-    this.fetchDiagrams();
-    
-    // Load mermaid.js
-    if (!window.mermaid) {
-      const script = document.createElement('script');
-      script.src = 'https://cdn.jsdelivr.net/npm/mermaid@9.3.0/dist/mermaid.min.js';
-      script.onload = () => {
-        this.initMermaid();
-      };
-      document.head.appendChild(script);
-    } else {
-      this.initMermaid();
-    }
+  beforeUnmount() {
+    clearTimeout(this.searchTimeout);
+    clearTimeout(this.previewTimeout);
+    this.loadMoreObserver.disconnect();
   },
   
   methods: {
-    async fetchDiagrams() {
-      this.loading = true;
+    // Fetch the first page of diagrams, or append the next one. Search, type
+    // filter and sort order run on the server, pages follow its keyset cursor.
+    async fetchDiagrams(append = false) {
+      const fetchId = ++this.fetchCount;
       this.error = null;
       
       try {
+        const args = {
+          is_template: 0,
+          cursor: append ? this.nextCursor : '',
+          limit: this.pageSize,
+          order_by: this.sortBy
+        };
+        
+        if (this.searchQuery) {
+          args.search_text = this.searchQuery;
+        }
+        
+        if (this.typeFilter) {
+          args.diagram_type = this.typeFilter;
+        }
+        
         const response = await frappe.call({
-          method: 'mermaid_studio.api.diagram_api.get_diagrams',
-          args: {
-            filters: { is_template: 0 },
-            fields: ['name', 'title', 'diagram_type', 'modified', 'owner', 'diagram_code']
-          }
+          method: 'mermaid_studio.mermaid_studio.api.diagram_api.get_diagrams',
+          args
         });
         
-        this.diagrams = response.message || [];
+        // A newer search or filter has replaced this one
+        if (fetchId !== this.fetchCount) return;
+        
+        const page = response.message || { diagrams: [], next_cursor: null };
+        this.diagrams = append ? [...this.diagrams, ...page.diagrams] : page.diagrams;
+        this.nextCursor = page.next_cursor;
         
-        // Render diagrams after they are loaded
         this.$nextTick(() => {
-          this.renderPreviews();
+          this.observeLoadMore();
         });
       } catch (err) {
         console.error('Error fetching diagrams:', err);
@@ -228,6 +250,97 @@ const DiagramGallery = {
       }
     },
     
+    async loadMoreDiagrams() {
+      if (!this.nextCursor || this.loadingMore) return;
+      
+      this.loadingMore = true;
+      try {
+        await this.fetchDiagrams(true);
+      } finally {
+        this.loadingMore = false;
+      }
+    },
+    
+    observeLoadMore() {
+      this.loadMoreObserver.disconnect();
+      if (this.$refs.loadMoreTrigger) {
+        this.loadMoreObserver.observe(this.$refs.loadMoreTrigger);
+      }
+    },
+    
+    // Previews come from the server only when a render is already cached, so
+    // a list never starts server renders. On a miss the diagram is rendered in
+    // the browser; the misses of a page share one request for their code.
+    getPreviewUrl(diagram) {
+      const params = new URLSearchParams({ diagram_name: diagram.name, cached_only: 1, v: diagram.modified });
+      return `/api/method/mermaid_studio.mermaid_studio.api.export_api.get_svg_image?${params}`;
+    },
+    
+    renderPreview(diagram) {
+      this.failedPreviews[diagram.name] = true;
+      this.pendingPreviews.push(diagram.name);
+      clearTimeout(this.previewTimeout);
+      this.previewTimeout = setTimeout(() => this.renderPendingPreviews(), 50);
+    },
+    
+    async renderPendingPreviews() {
+      const names = this.pendingPreviews.splice(0, this.maxPreviewCodes);
+      if (this.pendingPreviews.length) {
+        this.previewTimeout = setTimeout(() => this.renderPendingPreviews(), 0);
+      }
+      
+      try {
+        const [response] = await Promise.all([
+          frappe.call({
+            method: 'mermaid_studio.mermaid_studio.api.diagram_api.get_preview_codes',
+            args: { diagram_names: names }
+          }),
+          this.loadMermaid()
+        ]);
+        
+        Object.entries(response.message || {}).forEach(([name, code]) => {
+          if (!code) return;
+          
+          try {
+            window.mermaid.mermaidAPI.render(`preview-${name}`, code, (svg) => {
+              this.previewSvgs[name] = svg;
+            });
+          } catch (err) {
+            console.error('Error rendering preview:', err);
+          }
+        });
+      } catch (err) {
+        console.error('Error rendering previews:', err);
+      }
+    },
+    
+    // Load mermaid.js once, the first time a preview is not cached
+    loadMermaid() {
+      if (!this.mermaidLoaded) {
+        this.mermaidLoaded = new Promise((resolve, reject) => {
+          if (window.mermaid) {
+            resolve();
+            return;
+          }
+          
+          const script = document.createElement('script');
+          script.src = 'https://cdn.jsdelivr.net/npm/mermaid@9.3.0/dist/mermaid.min.js';
+          script.onload = resolve;
+          script.onerror = reject;
+          document.head.appendChild(script);
+        }).then(() => {
+          window.mermaid.initialize({
+            startOnLoad: false,
+            theme: 'default',
+            securityLevel: 'strict',
+            flowchart: { useMaxWidth: true }
+          });
+        });
+      }
+      
+      return this.mermaidLoaded;
+    },
+    
     formatDate(dateString) {
       return dayjs(dateString).fromNow();
     },
@@ -249,58 +362,22 @@ const DiagramGallery = {
     shareDiagram(diagram) {
       // Redirect to share page
       this.$router.push(`/share/${diagram.name}`);
-    },
-    
-    initMermaid() {
-      if (window.mermaid) {
-        window.mermaid.initialize({
-          startOnLoad: false,
-          theme: 'default',
-          securityLevel: 'loose',
-          flowchart: { useMaxWidth: true }
-        });
-        
-        this.renderPreviews();
-      }
-    },
-    
-    renderPreviews() {
-      if (!window.mermaid) return;
-      
-      this.filteredDiagrams.forEach(diagram => {
-        if (diagram.diagram_code) {
-          const container = document.getElementById(`diagram-${diagram.name}`);
-          if (container) {
-            try {
-              const element = container.querySelector('.mermaid-preview');
-              if (element) {
-                // Limit code length for preview
-                const previewCode = diagram.diagram_code.length > 500 
-                  ? diagram.diagram_code.substring(0, 500) 
-                  : diagram.diagram_code;
-                  
-                window.mermaid.mermaidAPI.render(
-                  `preview-${diagram.name}`, 
-                  previewCode, 
-                  (svg) => {
-                    element.innerHTML = svg;
-                  }
-                );
-              }
-            } catch (err) {
-              console.error('Error rendering preview:', err);
-            }
-          }
-        }
-      });
     }
   },
   
   watch: {
-    filteredDiagrams() {
-      this.$nextTick(() => {
-        this.renderPreviews();
-      });
+    // Start over from the first page when the filters change
+    searchQuery() {
+      clearTimeout(this.searchTimeout);
+      this.searchTimeout = setTimeout(() => this.fetchDiagrams(), 300);
+    },
+    
+    typeFilter() {
+      this.fetchDiagrams();
+    },
+    
+    sortBy() {
+      this.fetchDiagrams();
     }
   }
 }; 
\ No newline at end of file
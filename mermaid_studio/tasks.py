@@ -0,0 +1,13 @@
+from mermaid_studio.mermaid_studio.utils import coedit, render_stats, version_coalescing
+
+def flush_pending_versions():
+    """Turn pending autosave versions of idle diagrams into Diagram Versions"""
+    version_coalescing.flush_due_versions()
+
+def persist_coedit_sessions():
+    """Save co-edited diagram code back to the Diagrams"""
+    coedit.persist_dirty_sessions()
+
+def flush_render_stats():
+    """Write buffered diagram views and render times to the Diagrams"""
+    render_stats.flush()
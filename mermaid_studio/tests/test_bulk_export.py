@@ -0,0 +1,42 @@
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from mermaid_studio.mermaid_studio.utils import bulk_export
+
+class TestBulkExport(FrappeTestCase):
+    def setUp(self):
+        self.parent = frappe.get_doc({
+            "doctype": "Diagram Folder",
+            "folder_name": "Export test parent"
+        }).insert()
+        self.child = frappe.get_doc({
+            "doctype": "Diagram Folder",
+            "folder_name": "Export test child",
+            "parent_folder": self.parent.name
+        }).insert()
+        self.diagrams = [
+            frappe.get_doc({
+                "doctype": "Diagram",
+                "title": f"Export test {folder.folder_name}",
+                "diagram_code": "graph TD\n    A-->B",
+                "folder": folder.name
+            }).insert()
+            for folder in (self.parent, self.child)
+        ]
+    
+    def tearDown(self):
+        for diagram in self.diagrams:
+            frappe.delete_doc("Diagram", diagram.name, force=True)
+        
+        frappe.delete_doc("Diagram Folder", self.child.name, force=True)
+        frappe.delete_doc("Diagram Folder", self.parent.name, force=True)
+    
+    def test_folder_includes_subfolders(self):
+        names = bulk_export.get_readable_diagrams(folder=self.parent.name)
+        
+        self.assertEqual(set(names), {diagram.name for diagram in self.diagrams})
+    
+    def test_subfolder_excludes_its_parent(self):
+        names = bulk_export.get_readable_diagrams(folder=self.child.name)
+        
+        self.assertEqual(names, [self.diagrams[1].name])
@@ -0,0 +1,40 @@
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from mermaid_studio.mermaid_studio.utils import coedit
+
+CODE = "graph TD\n    A-->B"
+
+class TestCoedit(FrappeTestCase):
+    def setUp(self):
+        self.diagram = frappe.get_doc({
+            "doctype": "Diagram",
+            "title": "Co-editing test",
+            "diagram_code": CODE
+        }).insert()
+    
+    def tearDown(self):
+        coedit.reset(self.diagram.name)
+        frappe.delete_doc("Diagram", self.diagram.name, force=True)
+    
+    def test_concurrent_operations_are_transformed(self):
+        self.assertEqual(coedit.join(self.diagram.name), {"revision": 0, "code": CODE})
+        
+        # Two clients edit revision 0 at the same time
+        coedit.submit(self.diagram.name, 0, [len("graph TD\n"), "    C-->A\n"])
+        result = coedit.submit(self.diagram.name, 0, [len(CODE), "\n    B-->D"])
+        
+        # The second insert is moved past the first one
+        self.assertEqual(result, {"revision": 2, "operation": [len(CODE) + 10, "\n    B-->D"]})
+        self.assertEqual(
+            coedit.join(self.diagram.name)["code"],
+            "graph TD\n    C-->A\n    A-->B\n    B-->D"
+        )
+    
+    def test_reset_drops_the_session(self):
+        coedit.join(self.diagram.name)
+        coedit.submit(self.diagram.name, 0, [len(CODE), "\n    B-->C"])
+        
+        coedit.reset(self.diagram.name)
+        
+        self.assertEqual(coedit.join(self.diagram.name), {"revision": 0, "code": CODE})
@@ -0,0 +1,61 @@
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from mermaid_studio.mermaid_studio.api import diagram_api
+
+class TestDiagramPaging(FrappeTestCase):
+    def setUp(self):
+        self.diagrams = [
+            frappe.get_doc({
+                "doctype": "Diagram",
+                "title": f"Paging test {i}",
+                "diagram_code": "graph TD\n    A-->B"
+            }).insert()
+            for i in range(3)
+        ]
+    
+    def tearDown(self):
+        for diagram in self.diagrams:
+            frappe.delete_doc("Diagram", diagram.name, force=True)
+    
+    def test_pages_follow_the_cursor(self):
+        names = []
+        cursor = ""
+        while cursor is not None:
+            page = diagram_api.get_diagrams(cursor=cursor, limit=2)
+            names += [diagram.name for diagram in page["diagrams"]]
+            cursor = page["next_cursor"]
+        
+        self.assertEqual(len(names), len(set(names)))
+        self.assertTrue({diagram.name for diagram in self.diagrams} <= set(names))
+    
+    def test_pages_follow_the_sort_order(self):
+        for order_by in ("title asc", "title desc", "modified asc"):
+            names = []
+            cursor = ""
+            while cursor is not None:
+                page = diagram_api.get_diagrams(cursor=cursor, limit=2, order_by=order_by)
+                names += [diagram.name for diagram in page["diagrams"]]
+                cursor = page["next_cursor"]
+            
+            ours = [name for name in names if name in {diagram.name for diagram in self.diagrams}]
+            expected = [diagram.name for diagram in self.diagrams]
+            self.assertEqual(ours, expected[::-1] if order_by == "title desc" else expected)
+    
+    def test_cursor_of_another_sort_order_is_rejected(self):
+        cursor = diagram_api.get_diagrams(cursor="", limit=1)["next_cursor"]
+        with self.assertRaises(frappe.ValidationError):
+            diagram_api.get_diagrams(cursor=cursor, limit=1, order_by="title asc")
+    
+    def test_cursor_of_the_other_mode_is_rejected(self):
+        search_cursor = diagram_api._encode_cursor({"start": 2})
+        with self.assertRaises(frappe.ValidationError):
+            diagram_api.get_diagrams(cursor=search_cursor, limit=2)
+        
+        list_cursor = diagram_api._encode_cursor({"modified": "2026-01-01 00:00:00", "name": "x"})
+        with self.assertRaises(frappe.ValidationError):
+            diagram_api.get_diagrams(cursor=list_cursor, search_text="paging", limit=2)
+    
+    def test_malformed_cursor_is_rejected(self):
+        with self.assertRaises(frappe.ValidationError):
+            diagram_api.get_diagrams(cursor="not a cursor", limit=2)
@@ -0,0 +1,51 @@
+import frappe
+import json
+from frappe.tests.utils import FrappeTestCase
+
+from mermaid_studio.mermaid_studio.api.diagram_api import update_diagram
+from mermaid_studio.mermaid_studio.utils import patch_log
+
+CODE = "graph TD\n    A-->B"
+
+class TestPatchUpdate(FrappeTestCase):
+    def setUp(self):
+        self.diagram = frappe.get_doc({
+            "doctype": "Diagram",
+            "title": "Patch update test",
+            "diagram_code": CODE
+        }).insert()
+        self.base_modified = str(self.diagram.modified)
+    
+    def tearDown(self):
+        frappe.delete_doc("Diagram", self.diagram.name, force=True)
+    
+    def save_elsewhere(self, code):
+        other = frappe.get_doc("Diagram", self.diagram.name)
+        other.diagram_code = code
+        other.save()
+    
+    def test_patch_is_rebased_over_a_later_save(self):
+        self.save_elsewhere(CODE + "\n    B-->C")
+        
+        # Made against the first save: insert a line at the top
+        result = update_diagram(
+            self.diagram.name,
+            patch=json.dumps([len("graph TD\n"), "    X-->A\n"]),
+            base_modified=self.base_modified,
+            response_shape="minimal"
+        )
+        
+        merged = "graph TD\n    X-->A\n    A-->B\n    B-->C"
+        self.assertEqual(result["diagram_code"], merged)
+        self.assertEqual(frappe.db.get_value("Diagram", self.diagram.name, "diagram_code"), merged)
+    
+    def test_patch_on_an_unknown_save_is_rejected(self):
+        self.save_elsewhere(CODE + "\n    B-->C")
+        patch_log.clear(self.diagram.name)
+        
+        with self.assertRaises(frappe.TimestampMismatchError):
+            update_diagram(
+                self.diagram.name,
+                patch=json.dumps([len("graph TD\n"), "    X-->A\n"]),
+                base_modified=self.base_modified
+            )
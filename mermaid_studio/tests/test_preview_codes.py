@@ -0,0 +1,33 @@
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from mermaid_studio.mermaid_studio.api import diagram_api
+
+class TestPreviewCodes(FrappeTestCase):
+    def setUp(self):
+        self.private = frappe.get_doc({
+            "doctype": "Diagram",
+            "title": "Preview test private",
+            "diagram_code": "graph TD\n    A-->B"
+        }).insert()
+        self.public = frappe.get_doc({
+            "doctype": "Diagram",
+            "title": "Preview test public",
+            "diagram_code": "graph TD\n    C-->D",
+            "is_public": 1
+        }).insert()
+    
+    def tearDown(self):
+        frappe.set_user("Administrator")
+        for diagram in (self.private, self.public):
+            frappe.delete_doc("Diagram", diagram.name, force=True)
+    
+    def test_only_readable_diagrams_are_returned(self):
+        frappe.set_user("Guest")
+        codes = diagram_api.get_preview_codes([self.private.name, self.public.name])
+        
+        self.assertEqual(codes, {self.public.name: self.public.diagram_code})
+    
+    def test_too_many_names_are_rejected(self):
+        with self.assertRaises(frappe.ValidationError):
+            diagram_api.get_preview_codes(["x"] * (diagram_api.MAX_PREVIEW_CODES + 1))
@@ -0,0 +1,32 @@
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from mermaid_studio.mermaid_studio.utils import render_stats
+
+class TestRenderStats(FrappeTestCase):
+    def setUp(self):
+        self.diagram = frappe.get_doc({
+            "doctype": "Diagram",
+            "title": "Render stats test",
+            "diagram_code": "graph TD\n    A-->B"
+        }).insert()
+    
+    def tearDown(self):
+        frappe.delete_doc("Diagram", self.diagram.name, force=True)
+    
+    def test_flush_writes_buffered_views_and_renders(self):
+        render_stats.record_view(self.diagram.name)
+        render_stats.record_view(self.diagram.name)
+        render_stats.record_render(self.diagram.name)
+        
+        render_stats.flush()
+        
+        view_count, last_rendered = frappe.db.get_value(
+            "Diagram", self.diagram.name, ["view_count", "last_rendered"]
+        )
+        self.assertEqual(view_count, 2)
+        self.assertIsNotNone(last_rendered)
+        
+        # The buffer is gone, so nothing is counted twice
+        render_stats.flush()
+        self.assertEqual(frappe.db.get_value("Diagram", self.diagram.name, "view_count"), 2)
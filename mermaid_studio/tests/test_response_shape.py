@@ -0,0 +1,22 @@
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from mermaid_studio.mermaid_studio.utils.response_shape import project_fields
+
+class TestProjectFields(FrappeTestCase):
+    def test_requested_fields_are_kept(self):
+        self.assertEqual(project_fields('["name", "title"]'), ["name", "title"])
+    
+    def test_no_fields_means_the_whole_shape(self):
+        self.assertIn("thumbnail", project_fields(None))
+    
+    def test_fields_outside_the_shape_are_rejected(self):
+        with self.assertRaises(frappe.ValidationError):
+            project_fields(["name", "diagram_code"])
+    
+    def test_fields_that_are_not_a_list_are_rejected(self):
+        with self.assertRaises(frappe.ValidationError):
+            project_fields("name, title")
+        
+        with self.assertRaises(frappe.ValidationError):
+            project_fields('{"name": 1}')
@@ -0,0 +1,30 @@
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from mermaid_studio.mermaid_studio.utils import version_coalescing
+
+class TestVersionCoalescing(FrappeTestCase):
+    def setUp(self):
+        self.diagram = frappe.get_doc({
+            "doctype": "Diagram",
+            "title": "Coalescing test",
+            "diagram_code": "graph TD\n    A-->B",
+            "collaboration_settings": frappe.as_json({"version_coalesce_seconds": 600})
+        }).insert()
+    
+    def tearDown(self):
+        frappe.delete_doc("Diagram", self.diagram.name, force=True)
+        frappe.db.delete("Diagram Version", {"diagram": self.diagram.name})
+    
+    def test_coalesced_saves_bump_the_version(self):
+        start = self.diagram.version
+        for code in ("graph TD\n    A-->C", "graph TD\n    A-->D"):
+            self.diagram.diagram_code = code
+            self.diagram.save()
+        
+        self.assertEqual(frappe.db.get_value("Diagram", self.diagram.name, "version"), start + 2)
+        self.assertFalse(frappe.db.exists("Diagram Version", {"diagram": self.diagram.name}))
+        
+        # The flushed row is numbered after the last save folded into it
+        name = version_coalescing.flush_pending_version(self.diagram.name)
+        self.assertEqual(frappe.db.get_value("Diagram Version", name, "version_number"), start + 2)